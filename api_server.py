@@ -0,0 +1,535 @@
+"""Local HTTP/JSON API over the snippet library, for clients other than the Tk app.
+
+    python api_server.py --db snippets.db --port 8080
+
+Endpoints, with JSON bodies:
+
+    POST   /login                    {"username", "password"} -> {"token", "user_id"}
+    POST   /logout
+    GET    /snippets?after_id=&limit= a page of snippets visible to the caller
+    GET    /snippets/search?q=&limit= full-text search
+    GET    /snippets/{id}
+    GET    /snippets/{id}/similar    near duplicates of the snippet's code
+    POST   /snippets                 {"name", "language", "code", ...} -> {"id"}
+    PUT    /snippets/{id}
+    DELETE /snippets/{id}
+    POST   /snippets/{id}/execute    {"force": false} -> Judge0 submission
+
+Requests are authorized with "Authorization: Bearer <token>" from /login;
+without it the caller is anonymous and only sees public snippets. List and get
+responses carry an ETag and answer If-None-Match with 304 Not Modified. The
+event loop never touches SQLite: database calls run in a bounded thread pool,
+executions in another one.
+"""
+import re
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import secrets
+import argparse
+import threading
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qsl
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from applog import logger, setup_logging
+from metrics import metrics
+from database import SnippetsDatabase, SNIPPET_FIELDS, SNIPPET_PAGE_SIZE, execution_cache_key
+from judge0ce import is_reproducible
+
+# Threads running database calls, and database calls queued or running at once
+DB_WORKERS = 8
+MAX_PENDING_CALLS = 64
+# How long (in seconds) closing the server waits for every database thread to close its connection
+DB_RELEASE_TIMEOUT = 10
+# Snippet executions running at once
+EXECUTION_WORKERS = 4
+# How long (in seconds) a session token stays valid after its last use
+SESSION_TTL = 12 * 60 * 60
+# Largest request body, in bytes
+MAX_BODY_SIZE = 1024 * 1024
+# Largest page or search result a client can ask for
+MAX_LIMIT = 1000
+# How long (in seconds) an idle keep-alive connection is kept open
+KEEP_ALIVE_TIMEOUT = 30
+
+
+class HttpError(Exception):
+    def __init__(self, status: HTTPStatus, message: str = None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+class Request:
+    def __init__(self, method: str, target: str, headers: dict, body: bytes):
+        self.method: str = method
+        url = urlsplit(target)
+        self.path: str = url.path.rstrip("/") or "/"
+        self.query = dict(parse_qsl(url.query))
+        # Header names are lowercase
+        self.headers: dict = headers
+        self.body: bytes = body
+        self.token = None
+        self.user_id = None
+
+    @property
+    def keep_alive(self):
+        return self.headers.get("connection", "").lower() != "close"
+
+    def json(self):
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Invalid JSON: %s" % e) from e
+        if not isinstance(data, dict):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Expected a JSON object")
+        return data
+
+    def int_param(self, name: str, default: int = None, maximum: int = None, minimum: int = 0):
+        """Returns an integer query parameter, lowered to maximum; raises 400 if it is under minimum"""
+        value = self.query.get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "%s must be an integer" % name) from e
+        if value < minimum:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "%s must be at least %d" % (name, minimum))
+        return min(value, maximum) if maximum is not None else value
+
+
+class Sessions:
+    """Session tokens of logged in users, each valid until SESSION_TTL after its last use.
+
+    Only used from the event loop thread, so it needs no lock.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL):
+        self.ttl: float = ttl
+        # (user id, expiry time) by token
+        self.tokens = {}
+
+    def create(self, user_id: int):
+        token = secrets.token_urlsafe(32)
+        self.tokens[token] = (user_id, time.monotonic() + self.ttl)
+        return token
+
+    def get(self, token: str):
+        """Returns the user id of a token, or None if it is unknown or expired"""
+        session = self.tokens.get(token)
+        if session is None:
+            return None
+        user_id, expires = session
+        now = time.monotonic()
+        if expires < now:
+            del self.tokens[token]
+            return None
+        self.tokens[token] = (user_id, now + self.ttl)
+        return user_id
+
+    def delete(self, token: str):
+        self.tokens.pop(token, None)
+
+
+def etag_of(body: bytes):
+    return '"%s"' % hashlib.sha1(body).hexdigest()
+
+
+def etag_matches(if_none_match: str, etag: str):
+    """Checks an If-None-Match header against an ETag, with the weak comparison it calls for"""
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def is_blank(text: str):
+    return text is None or text.strip() == ""
+
+
+def text_field(data: dict, name: str, default: str = ""):
+    """Returns a text field of a request body, or default if it is missing; raises 400 unless it is a string or null"""
+    value = data.get(name, default)
+    if value is not None and not isinstance(value, str):
+        raise HttpError(HTTPStatus.BAD_REQUEST, "%s must be a string" % name)
+    return value
+
+
+def name_field(data: dict, default: str = None):
+    """Returns the name of a request body, or default if it is missing; raises 400 if it is blank or not a string"""
+    name = text_field(data, "name", default)
+    if is_blank(name):
+        raise HttpError(HTTPStatus.BAD_REQUEST, "name is required")
+    return name
+
+
+class ApiServer:
+    """asyncio HTTP/1.1 server of the JSON API, with keep-alive connections.
+
+    The database is shared by all requests; each request is authorized by its
+    session token, never by SnippetsDatabase.current_user.
+    """
+
+    # (method, path pattern, handler name); path groups are passed as integers
+    ROUTES = [
+        ("POST", r"/login", "login"),
+        ("POST", r"/logout", "logout"),
+        ("GET", r"/snippets", "list_snippets"),
+        ("GET", r"/snippets/search", "search_snippets"),
+        ("GET", r"/snippets/(\d+)", "get_snippet"),
+        ("GET", r"/snippets/(\d+)/similar", "similar_snippets"),
+        ("POST", r"/snippets", "add_snippet"),
+        ("PUT", r"/snippets/(\d+)", "edit_snippet"),
+        ("DELETE", r"/snippets/(\d+)", "delete_snippet"),
+        ("POST", r"/snippets/(\d+)/execute", "execute_snippet"),
+    ]
+
+    def __init__(self, db: SnippetsDatabase, backend=None, db_workers: int = DB_WORKERS,
+                 max_pending_calls: int = MAX_PENDING_CALLS, execution_workers: int = EXECUTION_WORKERS):
+        self.db = db
+        self.backend = backend
+        self.sessions = Sessions()
+        self.routes = [(method, re.compile(pattern + "$"), getattr(self, name)) for method, pattern, name in self.ROUTES]
+        # Number of database threads started, each with its own SQLite connection once it runs a call
+        self.db_threads = 0
+        self.db_threads_lock = threading.Lock()
+        self.db_executor = ThreadPoolExecutor(db_workers, thread_name_prefix="api-db",
+                                              initializer=self.count_db_thread)
+        self.execution_executor = ThreadPoolExecutor(execution_workers, thread_name_prefix="api-execution")
+        # Futures of executions not finished yet, cancelled by close()
+        self.executions = set()
+        self.max_pending_calls: int = max_pending_calls
+        self.pending_calls = None
+        self.server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080):
+        """Starts listening; returns the (host, port) bound, port 0 picking a free one"""
+        self.pending_calls = asyncio.Semaphore(self.max_pending_calls)
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        self.release_db_connections()
+        self.db_executor.shutdown(wait=True)
+        # Executions that have not started yet; shutdown() cannot cancel them before Python 3.9
+        for future in list(self.executions):
+            future.cancel()
+        self.execution_executor.shutdown(wait=False)
+        if self.backend is not None:
+            self.backend.close()
+
+    def count_db_thread(self):
+        with self.db_threads_lock:
+            self.db_threads += 1
+
+    def release_db_connections(self):
+        """Closes the SQLite connections of the database threads, each on its own thread.
+
+        Every thread gets one release() call: the calls wait for each other, so no
+        thread can take a second one while another thread has none.
+        """
+        threads = self.db_threads
+        if not threads:
+            return
+        barrier = threading.Barrier(threads)
+
+        def release():
+            self.db.connections.release()
+            barrier.wait(DB_RELEASE_TIMEOUT)
+
+        wait([self.db_executor.submit(release) for _ in range(threads)])
+
+    async def run_db(self, func, *args):
+        """Runs a database call in the database thread pool, waiting while MAX_PENDING_CALLS are queued"""
+        async with self.pending_calls:
+            return await asyncio.get_running_loop().run_in_executor(self.db_executor, func, *args)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except HttpError as e:
+                    writer.write(self.response(e.status, {"error": str(e)}, keep_alive=False))
+                    break
+                if request is None:
+                    break
+                writer.write(await self.respond(request))
+                await writer.drain()
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_request(reader: asyncio.StreamReader):
+        """Reads a request, or returns None if the client closed the connection"""
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split()
+        except ValueError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Malformed request line") from e
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length") from e
+        if length < 0:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > MAX_BODY_SIZE:
+            raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        body = await reader.readexactly(length) if length else b""
+        return Request(method.upper(), target, headers, body)
+
+    async def respond(self, request: Request):
+        """Routes a request to its handler and returns the encoded response"""
+        start = time.perf_counter()
+        route = "unmatched"
+        try:
+            handler, args, route = self.route(request)
+            authorization = request.headers.get("authorization", "")
+            if authorization.startswith("Bearer "):
+                request.token = authorization[len("Bearer "):].strip()
+                request.user_id = self.sessions.get(request.token)
+                if request.user_id is None:
+                    raise HttpError(HTTPStatus.UNAUTHORIZED, "Invalid or expired session token")
+            status, payload, cacheable = await handler(request, *args)
+            response = self.response(status, payload, request.keep_alive, request.headers.get("if-none-match")
+                                     if cacheable else None, cacheable)
+        except HttpError as e:
+            response = self.response(e.status, {"error": str(e)}, request.keep_alive)
+        except Exception:  # pylint: disable=broad-except
+            # The details are in the log, not in the response
+            logger.exception("API request %s %s failed", request.method, request.path)
+            status = HTTPStatus.INTERNAL_SERVER_ERROR
+            response = self.response(status, {"error": status.phrase}, request.keep_alive)
+        if metrics.enabled:
+            metrics.observe("snippets_api_request_seconds", (("route", route),), time.perf_counter() - start)
+        return response
+
+    def route(self, request: Request):
+        """Returns the handler of a request, its path arguments and the route label"""
+        allowed = []
+        for method, pattern, handler in self.routes:
+            match = pattern.match(request.path)
+            if match:
+                if method == request.method:
+                    return handler, [int(group) for group in match.groups()], "%s %s" % (method, pattern.pattern[:-1])
+                allowed.append(method)
+        if allowed:
+            raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED)
+        raise HttpError(HTTPStatus.NOT_FOUND)
+
+    @staticmethod
+    def response(status: HTTPStatus, payload, keep_alive: bool = True, if_none_match: str = None,
+                 with_etag: bool = False):
+        """Encodes a JSON response; with_etag adds an ETag, and a matching if_none_match makes it a 304"""
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        headers = ["Content-Type: application/json", "Connection: %s" % ("keep-alive" if keep_alive else "close")]
+        if with_etag:
+            etag = etag_of(body)
+            headers.append("ETag: " + etag)
+            if if_none_match is not None and etag_matches(if_none_match, etag):
+                status, body = HTTPStatus.NOT_MODIFIED, b""
+        if status != HTTPStatus.NOT_MODIFIED:
+            headers.append("Content-Length: %d" % len(body))
+        head = "HTTP/1.1 %d %s\r\n%s\r\n\r\n" % (status, status.phrase, "\r\n".join(headers))
+        return head.encode("latin-1") + body
+
+    def require_user(self, request: Request):
+        if request.user_id is None:
+            raise HttpError(HTTPStatus.UNAUTHORIZED, "Log in first")
+        return request.user_id
+
+    def snippet_json(self, row):
+        snippet = dict(zip(SNIPPET_FIELDS, row))
+        snippet["language"] = self.db.get_language_name(snippet["language_id"])
+        snippet["is_private"] = bool(snippet["is_private"])
+        return snippet
+
+    def language_field(self, data: dict, default: int = None):
+        """Returns the language id of a request body's language_id or language, a name or an id, or default.
+
+        Raises 400 for a language the catalog does not have; while the catalog was
+        never fetched, any language id is accepted.
+        """
+        language = data.get("language_id", data.get("language", default))
+        if language is None:
+            return None
+        if isinstance(language, bool) or not isinstance(language, (int, str)):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "language must be a language name or id")
+        language_id = self.db.get_language_id(language)
+        names = self.db.get_language_catalog()[0]
+        if language_id is None or (names and language_id not in names):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Unknown language %s" % language)
+        return language_id
+
+    def visible_snippet(self, snippet_id: int, user_id: int):
+        """Returns a snippet the user can see, or raises 404"""
+        row = self.db.get_snippet(snippet_id)
+        if row is None or (row[7] and row[8] != user_id and not (user_id and self.db.is_admin(user_id))):
+            raise HttpError(HTTPStatus.NOT_FOUND, "No snippet %d" % snippet_id)
+        return row
+
+    def owned_snippet(self, snippet_id: int, user_id: int):
+        """Returns a snippet the user can change: their own, or any for an administrator"""
+        row = self.visible_snippet(snippet_id, user_id)
+        if row[8] != user_id and not self.db.is_admin(user_id):
+            raise HttpError(HTTPStatus.FORBIDDEN, "Snippet %d belongs to another user" % snippet_id)
+        return row
+
+    async def login(self, request: Request):
+        data = request.json()
+        user_id = await self.run_db(self.db.authenticate, str(data.get("username", "")), str(data.get("password", "")))
+        if user_id is None:
+            raise HttpError(HTTPStatus.UNAUTHORIZED, "Invalid username or password")
+        return HTTPStatus.OK, {"token": self.sessions.create(user_id), "user_id": user_id}, False
+
+    async def logout(self, request: Request):
+        self.require_user(request)
+        self.sessions.delete(request.token)
+        return HTTPStatus.OK, {}, False
+
+    async def list_snippets(self, request: Request):
+        limit = request.int_param("limit", SNIPPET_PAGE_SIZE, MAX_LIMIT, minimum=1)
+        after_id = request.int_param("after_id", 0)
+
+        def page():
+            rows = self.db.get_snippets_page(request.user_id or 0, after_id, limit)
+            return {"snippets": [{"id": row[0], "name": row[1], "language_id": row[2],
+                                  "language": self.db.get_language_name(row[2]), "preview": row[3]} for row in rows],
+                    "next_after_id": rows[-1][0] if len(rows) == limit else None}
+
+        return HTTPStatus.OK, await self.run_db(page), True
+
+    async def search_snippets(self, request: Request):
+        query = request.query.get("q", "")
+        if not query.strip():
+            raise HttpError(HTTPStatus.BAD_REQUEST, "q is required")
+        limit = request.int_param("limit", SNIPPET_PAGE_SIZE, MAX_LIMIT, minimum=1)
+
+        def search():
+            rows = self.db.search_snippets(query, request.user_id or 0, limit=limit)
+            return {"snippets": [{"id": row[0], "name": row[1], "language_id": row[2],
+                                  "language": self.db.get_language_name(row[2]), "fragment": row[3]} for row in rows]}
+
+        return HTTPStatus.OK, await self.run_db(search), True
+
+    async def get_snippet(self, request: Request, snippet_id: int):
+        snippet = await self.run_db(lambda: self.snippet_json(self.visible_snippet(snippet_id, request.user_id)))
+        return HTTPStatus.OK, snippet, True
+
+    async def similar_snippets(self, request: Request, snippet_id: int):
+        limit = request.int_param("limit", 10, MAX_LIMIT, minimum=1)
+
+        def similar():
+            self.visible_snippet(snippet_id, request.user_id)
+            rows = self.db.get_similar_snippets(snippet_id, request.user_id or 0, limit)
+            return {"snippets": [{"id": row[0], "name": row[1], "language_id": row[2],
+                                  "language": self.db.get_language_name(row[2]), "similarity": row[3]} for row in rows]}
+
+        return HTTPStatus.OK, await self.run_db(similar), True
+
+    async def add_snippet(self, request: Request):
+        user_id = self.require_user(request)
+        data = request.json()
+        name = name_field(data)
+        texts = [text_field(data, field) for field in ("code", "example_code", "stdin", "expected_output")]
+        snippet_id = await self.run_db(lambda: self.db.add_snippet(name, self.language_field(data), *texts,
+                                                                   bool(data.get("is_private")), user_id))
+        return HTTPStatus.CREATED, {"id": snippet_id}, False
+
+    async def edit_snippet(self, request: Request, snippet_id: int):
+        user_id = self.require_user(request)
+        data = request.json()
+
+        def edit():
+            snippet = self.snippet_json(self.owned_snippet(snippet_id, user_id))
+            texts = [text_field(data, field, snippet[field])
+                     for field in ("code", "example_code", "stdin", "expected_output")]
+            self.db.edit_snippet(snippet_id, name_field(data, snippet["name"]),
+                                 self.language_field(data, snippet["language_id"]), *texts,
+                                 int(bool(data.get("is_private", snippet["is_private"]))), user_id)
+            return self.snippet_json(self.db.get_snippet(snippet_id))
+
+        return HTTPStatus.OK, await self.run_db(edit), False
+
+    async def delete_snippet(self, request: Request, snippet_id: int):
+        user_id = self.require_user(request)
+
+        def delete():
+            self.owned_snippet(snippet_id, user_id)
+            self.db.delete_snippet(snippet_id)
+
+        await self.run_db(delete)
+        return HTTPStatus.OK, {}, False
+
+    async def execute_snippet(self, request: Request, snippet_id: int):
+        if self.backend is None:
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, "No execution backend: set JUDGE0_API_TOKEN "
+                                                            "or SNIPPETS_BACKEND=local")
+        force = bool(request.json().get("force"))
+        row = await self.run_db(self.visible_snippet, snippet_id, request.user_id)
+        code = row[3] if is_blank(row[4]) else row[4]
+        key = execution_cache_key(row[2], code, row[5], backend=self.backend.name)
+        if not force and (cached := await self.run_db(self.db.get_cached_result, key)) is not None:
+            return HTTPStatus.OK, {"cached": True, **json.loads(cached)}, False
+        future = self.execution_executor.submit(self.backend.run, code, row[2], row[5])
+        self.executions.add(future)
+        future.add_done_callback(self.executions.discard)
+        result = await asyncio.wrap_future(future)
+        if is_reproducible(result):
+            await self.run_db(self.db.cache_result, key, json.dumps(result))
+        return HTTPStatus.OK, {"cached": False, **result}, False
+
+
+async def serve(db: SnippetsDatabase, host: str, port: int, backend=None, db_workers: int = DB_WORKERS):
+    server = ApiServer(db, backend, db_workers)
+    host, port = await server.start(host, port)
+    logger.info("API server listening on http://%s:%d/", host, port)
+    print("Listening on http://%s:%d/" % (host, port), flush=True)
+    try:
+        await server.serve_forever()
+    finally:
+        server.close()
+
+
+def main(argv=None):
+    from backends import backend_from_environment
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="snippets.db", help="snippets database")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on, 0 for any free one")
+    parser.add_argument("--workers", type=int, default=DB_WORKERS, help="threads running database calls")
+    parser.add_argument("--no-log", action="store_true", help="do not write the log file")
+    args = parser.parse_args(argv)
+
+    if not args.no_log:
+        setup_logging()
+    with SnippetsDatabase(args.db) as db:
+        try:
+            asyncio.run(serve(db, args.host, args.port, backend_from_environment(), args.workers))
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import reprlib
+import inspect
+import itertools
+import logging
+import functools
+import logging.handlers
+
+from metrics import metrics
+
+LOG_FILE = "snippets_app.log"
+# Size of a log file before it is rotated, and how many rotated files are kept
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+# Longest rendering of a single argument, in characters
+MAX_ARG_LENGTH = 200
+# Arguments whose values are replaced by REDACTED
+REDACTED_ARGS = {"password", "token", "api_key"}
+REDACTED = "***"
+# Overrides the sample rates of @log, e.g. "show_context_menu=0.5,search_snippets=1"
+SAMPLING_ENV = "SNIPPETS_LOG_SAMPLING"
+
+logger = logging.getLogger("snippets_app")
+
+# Sample rates by function name, set from SAMPLING_ENV by setup_logging()
+sample_rates = {}
+
+arg_repr = reprlib.Repr()
+arg_repr.maxstring = MAX_ARG_LENGTH
+arg_repr.maxother = MAX_ARG_LENGTH
+arg_repr.maxlist = arg_repr.maxtuple = arg_repr.maxdict = arg_repr.maxset = 10
+
+
+def render_arg(value):
+    """Returns a representation of an argument of at most about MAX_ARG_LENGTH characters"""
+    if isinstance(value, str) and len(value) > MAX_ARG_LENGTH:
+        return "%s... (%d chars)" % (repr(value[:MAX_ARG_LENGTH]), len(value))
+    return arg_repr.repr(value)
+
+
+def render_args(names, args, kwargs):
+    """Returns the arguments of a call by name, without self, redacted and rendered.
+
+    names are the names of the positional parameters of the function.
+    """
+    rendered = {}
+    for name, value in itertools.chain(zip(names, args), kwargs.items()):
+        if name != "self":
+            rendered[name] = REDACTED if name in REDACTED_ARGS else render_arg(value)
+    return rendered
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, with the fields passed in extra={"fields": ...}"""
+
+    def format(self, record: logging.LogRecord):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update(getattr(record, "fields", None) or {})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps the traceback out of the message, for the JSON formatter.
+
+    Like QueueHandler, it renders the message and traceback on the logging thread,
+    so the queued record holds no references to arguments or frames. The record is
+    changed in place rather than copied: this is the only handler of the logger.
+    """
+
+    def prepare(self, record: logging.LogRecord):
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class BackgroundListener(logging.handlers.QueueListener):
+    """QueueListener that can be stopped more than once, e.g. explicitly and at exit"""
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+def parse_sample_rates(text: str):
+    """Parses "name=rate,name=rate" into a dict"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def setup_logging(path: str = LOG_FILE, level: int = logging.INFO, console: bool = False):
+    """Sends the app's log records through a queue to a background thread writing rotating JSON files.
+
+    Records are JSON objects, one per line, and files rotate at LOG_MAX_BYTES.
+    Returns the QueueListener, which is stopped, flushing pending records, at exit.
+    """
+    file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                                                        encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+        handlers.append(console_handler)
+
+    records = queue.SimpleQueue()
+    listener = BackgroundListener(records, *handlers, respect_handler_level=True)
+    logger.handlers[:] = [StructuredQueueHandler(records)]
+    logger.setLevel(level)
+    logger.propagate = False
+    sample_rates.update(parse_sample_rates(os.environ.get(SAMPLING_ENV, "")))
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def log(func=None, *, sample: float = 1.0):
+    """Decorator logging the calls of a function with their arguments and duration.
+
+    Only a fraction sample of the calls is logged, overridable per function name
+    through SNIPPETS_LOG_SAMPLING. Unlogged calls only cost a random draw.
+    Exceptions are always logged. Durations also go to the metrics when they are
+    enabled, and a call runs under cProfile if metrics.profile_next() asked for it.
+    """
+    if func is None:
+        return functools.partial(log, sample=sample)
+    names = [parameter.name for parameter in inspect.signature(func).parameters.values()
+             if parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD)]
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        rate = sample_rates.get(name, sample)
+        logged = rate >= 1 or random.random() < rate
+        start = time.perf_counter()
+        try:
+            if metrics.profile_request is not None:
+                result = metrics.call(name, func, args, kwargs)
+            else:
+                result = func(*args, **kwargs)
+        except Exception:
+            logger.exception("%s failed", name, extra={"fields": {
+                "event": "call", "function": name, "args": render_args(names, args, kwargs),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3)}})
+            raise
+        finally:
+            if metrics.enabled:
+                metrics.observe("snippets_ui_handler_seconds", (("handler", name),), time.perf_counter() - start)
+        if logged and logger.isEnabledFor(logging.INFO):
+            logger.info("Called %s", name, extra={"fields": {
+                "event": "call", "function": name, "args": render_args(names, args, kwargs),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3), "sample_rate": rate}})
+        return result
+    return wrapper
@@ -0,0 +1,323 @@
+import os
+import signal
+import shutil
+import resource
+import tempfile
+import itertools
+import threading
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from judge0ce import Judge0CEClient, ExecutionCancelled
+
+# Limits of a local execution: CPU seconds, wall clock seconds, address space and output size in bytes
+CPU_TIME_LIMIT = 5
+WALL_TIME_LIMIT = 10
+MEMORY_LIMIT = 256 * 1024 * 1024
+OUTPUT_LIMIT = 1024 * 1024
+COMPILE_TIME_LIMIT = 30
+# How often (in seconds) a worker checks if its run was cancelled
+CANCEL_POLL_INTERVAL = 0.05
+
+# Judge0 statuses, so local results have the same shape as Judge0 submissions
+STATUS_ACCEPTED = {"id": 3, "description": "Accepted"}
+STATUS_TIME_LIMIT_EXCEEDED = {"id": 5, "description": "Time Limit Exceeded"}
+STATUS_COMPILATION_ERROR = {"id": 6, "description": "Compilation Error"}
+STATUS_SIGSEGV = {"id": 7, "description": "Runtime Error (SIGSEGV)"}
+STATUS_SIGXFSZ = {"id": 8, "description": "Runtime Error (SIGXFSZ)"}
+STATUS_SIGFPE = {"id": 9, "description": "Runtime Error (SIGFPE)"}
+STATUS_SIGABRT = {"id": 10, "description": "Runtime Error (SIGABRT)"}
+STATUS_NZEC = {"id": 11, "description": "Runtime Error (NZEC)"}
+STATUS_OTHER = {"id": 12, "description": "Runtime Error (Other)"}
+STATUS_INTERNAL_ERROR = {"id": 13, "description": "Internal Error"}
+
+SIGNAL_STATUSES = {
+    signal.SIGXCPU: STATUS_TIME_LIMIT_EXCEEDED,
+    signal.SIGSEGV: STATUS_SIGSEGV,
+    signal.SIGXFSZ: STATUS_SIGXFSZ,
+    signal.SIGFPE: STATUS_SIGFPE,
+    signal.SIGABRT: STATUS_SIGABRT,
+}
+
+
+class LocalLanguage:
+    """How to build and run one language locally. Commands are formatted with {source} and {binary}."""
+
+    def __init__(self, name: str, source_file: str, run: list, compile: list = None,  # pylint: disable=redefined-builtin
+                 limit_memory: bool = True):
+        self.name: str = name
+        self.source_file: str = source_file
+        self.run: list = run
+        self.compile: list = compile
+        # V8 reserves far more address space than it uses, so node cannot run under RLIMIT_AS
+        self.limit_memory: bool = limit_memory
+
+    @property
+    def available(self):
+        return all(shutil.which(command[0]) for command in (self.run, self.compile)
+                   if command and not command[0].startswith("{"))
+
+
+PYTHON = LocalLanguage("Python", "main.py", ["python3", "{source}"])
+C = LocalLanguage("C", "main.c", ["{binary}"], ["gcc", "-O2", "-o", "{binary}", "{source}", "-lm"])
+CPP = LocalLanguage("C++", "main.cpp", ["{binary}"], ["g++", "-O2", "-o", "{binary}", "{source}"])
+JAVASCRIPT = LocalLanguage("JavaScript", "main.js", ["node", "{source}"], limit_memory=False)
+BASH = LocalLanguage("Bash", "main.sh", ["bash", "{source}"])
+
+# Judge0 language ids run by LocalBackend
+LOCAL_LANGUAGES = {
+    46: BASH,
+    48: C, 49: C, 50: C, 75: C, 103: C,
+    52: CPP, 53: CPP, 54: CPP, 76: CPP, 105: CPP,
+    63: JAVASCRIPT, 93: JAVASCRIPT, 97: JAVASCRIPT, 102: JAVASCRIPT,
+    71: PYTHON, 92: PYTHON, 100: PYTHON,
+}
+
+
+class ExecutionBackend:
+    """Something that executes snippets.
+
+    Results are dicts shaped like Judge0 submissions: stdout, stderr, compile_output,
+    message, status ({id, description}), time (CPU seconds, as a string) and memory (KB).
+    """
+    name = None
+
+    def run(self, source_code: str, language_id: int, stdin: str = None, cancelled=None, on_status=None):
+        """Executes code and returns the result. cancelled is an optional threading.Event
+        that makes it raise ExecutionCancelled, on_status is called on status changes."""
+        raise NotImplementedError
+
+    def run_many(self, snippets, cancelled=None):
+        """Executes (key, source_code, language_id, stdin) snippets, yielding (key, result) as they finish"""
+        for key, source_code, language_id, stdin in snippets:
+            yield key, self.run(source_code, language_id, stdin, cancelled)
+
+    def close(self):
+        pass
+
+
+class Judge0Backend(ExecutionBackend):
+    """Executes snippets remotely with the Judge0 API"""
+    name = "judge0"
+
+    def __init__(self, client: Judge0CEClient):
+        self.client = client
+
+    def run(self, source_code: str, language_id: int, stdin: str = None, cancelled=None, on_status=None):
+        return self.client.run_submission(source_code, language_id, cancelled=cancelled, on_status=on_status,
+                                          stdin=stdin)
+
+    def run_many(self, snippets, cancelled=None):
+        return self.client.run_many(snippets, cancelled=cancelled)
+
+
+def limit_resources(cpu_time: int, memory: int, output: int):
+    """Returns a preexec_fn applying rlimits in the child process"""
+    def apply_limits():
+        os.setsid()
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_time, cpu_time + 1))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (output, output))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        if memory:
+            resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    return apply_limits
+
+
+def run_process(command: list, workdir: str, stdin: str, cpu_time: int, wall_time: float, memory: int,
+                cancel_path: str = None):
+    """Runs a command under rlimits and returns (exit status, stdout, stderr, rusage, timed out).
+
+    The command is killed early once a file exists at cancel_path.
+    """
+    stdin_path, stdout_path, stderr_path = (os.path.join(workdir, name) for name in ("stdin", "stdout", "stderr"))
+    with open(stdin_path, "w", encoding="utf-8") as f:
+        f.write(stdin or "")
+    with open(stdin_path, "rb") as stdin_file, open(stdout_path, "wb") as stdout_file, \
+            open(stderr_path, "wb") as stderr_file:
+        process = subprocess.Popen(command, cwd=workdir, stdin=stdin_file, stdout=stdout_file, stderr=stderr_file,
+                                   preexec_fn=limit_resources(cpu_time, memory, OUTPUT_LIMIT))
+    killed, cancelled = threading.Event(), threading.Event()
+    # Set under lock once the process is reaped, after which its pid may belong to another process
+    reaped = threading.Event()
+    lock = threading.Lock()
+
+    def kill(reason: threading.Event):
+        with lock:
+            if reaped.is_set():
+                return
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                return
+            reason.set()
+
+    def watch_cancel():
+        while not reaped.wait(CANCEL_POLL_INTERVAL):
+            if os.path.exists(cancel_path):
+                kill(cancelled)
+                return
+
+    timer = threading.Timer(wall_time, kill, (killed,))
+    timer.start()
+    if cancel_path is not None:
+        threading.Thread(target=watch_cancel, daemon=True).start()
+    try:
+        # wait4 instead of Popen.wait, to get the resource usage of this process only
+        _, status, rusage = os.wait4(process.pid, 0)
+    finally:
+        with lock:
+            reaped.set()
+        timer.cancel()
+    # Negative signal number if killed by a signal, as Popen.returncode
+    process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    # The timer may fire while the process is exiting on its own; that run finished in time
+    timed_out = killed.is_set() and process.returncode == -signal.SIGKILL
+
+    def read(path):
+        with open(path, "rb") as f:
+            return f.read(OUTPUT_LIMIT).decode(errors="replace") or None
+
+    return process.returncode, read(stdout_path), read(stderr_path), rusage, timed_out
+
+
+def run_local(language_id: int, source_code: str, stdin: str, cpu_time: int, wall_time: float, memory: int,
+              cancel_path: str = None):
+    """Builds and runs a snippet in a scratch directory. Runs in a worker process of LocalBackend,
+    which creates cancel_path to stop it."""
+    language = LOCAL_LANGUAGES[language_id]
+    result = {"token": None, "stdout": None, "stderr": None, "compile_output": None, "message": None,
+              "time": None, "memory": None, "status": STATUS_INTERNAL_ERROR}
+    with tempfile.TemporaryDirectory(prefix="snippet-") as workdir:
+        paths = {"source": os.path.join(workdir, language.source_file), "binary": os.path.join(workdir, "main")}
+        with open(paths["source"], "w", encoding="utf-8") as f:
+            f.write(source_code)
+
+        if language.compile:
+            returncode, stdout, stderr, _, timed_out = run_process(
+                [part.format(**paths) for part in language.compile], workdir, None,
+                COMPILE_TIME_LIMIT, COMPILE_TIME_LIMIT, 0, cancel_path)
+            if returncode != 0:
+                result["compile_output"] = (stdout or "") + (stderr or "")
+                result["status"] = STATUS_TIME_LIMIT_EXCEEDED if timed_out else STATUS_COMPILATION_ERROR
+                return result
+
+        returncode, stdout, stderr, rusage, timed_out = run_process(
+            [part.format(**paths) for part in language.run], workdir, stdin, cpu_time, wall_time,
+            memory if language.limit_memory else 0, cancel_path)
+
+    result.update(stdout=stdout, stderr=stderr, time="%.3f" % (rusage.ru_utime + rusage.ru_stime),
+                  memory=rusage.ru_maxrss)
+    if timed_out:
+        result["status"] = STATUS_TIME_LIMIT_EXCEEDED
+    elif returncode == 0:
+        result["status"] = STATUS_ACCEPTED
+    elif returncode < 0:
+        result["status"] = SIGNAL_STATUSES.get(-returncode, STATUS_OTHER)
+        result["message"] = "Exited with signal %d" % -returncode
+    else:
+        result["status"] = STATUS_NZEC
+        result["message"] = "Exited with error status %d" % returncode
+    return result
+
+
+class LocalBackend(ExecutionBackend):
+    """Executes snippets in local subprocesses limited by rlimits, on a process pool
+
+    Only languages of LOCAL_LANGUAGES whose toolchain is installed are supported.
+    """
+    name = "local"
+
+    def __init__(self, max_workers: int = None, cpu_time: int = CPU_TIME_LIMIT, wall_time: float = WALL_TIME_LIMIT,
+                 memory: int = MEMORY_LIMIT):
+        self.pool = ProcessPoolExecutor(max_workers or os.cpu_count())
+        self.cpu_time: int = cpu_time
+        self.wall_time: float = wall_time
+        self.memory: int = memory
+        # Runs not finished yet, cancelled by close(): future -> file that stops it once created.
+        # Worker processes cannot see the events of this process, so they look for the file instead.
+        self.futures = {}
+        self.futures_lock = threading.Lock()
+        self.cancel_dir: str = tempfile.mkdtemp(prefix="snippet-cancel-")
+        self.run_ids = itertools.count(1)
+
+    @staticmethod
+    def supports(language_id: int):
+        return language_id in LOCAL_LANGUAGES and LOCAL_LANGUAGES[language_id].available
+
+    def submit(self, source_code: str, language_id: int, stdin: str = None):
+        if not self.supports(language_id):
+            raise ValueError("Language %s cannot be executed locally" % language_id)
+        cancel_path = os.path.join(self.cancel_dir, str(next(self.run_ids)))
+        future = self.pool.submit(run_local, language_id, source_code, stdin, self.cpu_time, self.wall_time,
+                                  self.memory, cancel_path)
+        with self.futures_lock:
+            self.futures[future] = cancel_path
+        future.add_done_callback(self.discard_future)
+        return future
+
+    def discard_future(self, future):
+        with self.futures_lock:
+            cancel_path = self.futures.pop(future, None)
+        if cancel_path is not None and os.path.exists(cancel_path):
+            os.remove(cancel_path)
+
+    def cancel(self, future):
+        """Cancels a queued run, or kills the process of a started one"""
+        if future.cancel():
+            return
+        with self.futures_lock:
+            cancel_path = self.futures.get(future)
+        if cancel_path is not None:
+            with open(cancel_path, "w"):
+                pass
+
+    def run(self, source_code: str, language_id: int, stdin: str = None, cancelled=None, on_status=None):
+        future = self.submit(source_code, language_id, stdin)
+        if on_status is not None:
+            on_status({"id": 2, "description": "Processing"})
+        while cancelled is not None and not future.done():
+            if cancelled.wait(0.1):
+                self.cancel(future)
+                raise ExecutionCancelled()
+        return future.result()
+
+    def run_many(self, snippets, cancelled=None):
+        futures = {}
+        for key, source_code, language_id, stdin in snippets:
+            if self.supports(language_id):
+                futures[self.submit(source_code, language_id, stdin)] = key
+            else:
+                yield key, {"status": STATUS_INTERNAL_ERROR, "stdout": None, "stderr": None, "time": None,
+                            "memory": None, "message": "Language %s cannot be executed locally" % language_id}
+        pending = set(futures)
+        while pending:
+            if cancelled is not None and cancelled.is_set():
+                for future in pending:
+                    self.cancel(future)
+                raise ExecutionCancelled()
+            done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield futures[future], future.result()
+
+    def close(self):
+        # Runs are cancelled one by one, as shutdown(cancel_futures=True) needs Python 3.9.
+        # Started ones are killed, so waiting for the workers is short.
+        with self.futures_lock:
+            futures = list(self.futures)
+        for future in futures:
+            self.cancel(future)
+        self.pool.shutdown(wait=True)
+        shutil.rmtree(self.cancel_dir, ignore_errors=True)
+
+
+def backend_from_environment():
+    """Returns the backend the environment selects, or None if Judge0 is selected without an API key.
+
+    Snippets run locally if SNIPPETS_BACKEND=local, else with Judge0 and the API key
+    in JUDGE0_API_TOKEN.
+    """
+    if os.environ.get("SNIPPETS_BACKEND") == "local":
+        return LocalBackend()
+    if (api_key := os.environ.get("JUDGE0_API_TOKEN")) is None:
+        return None
+    return Judge0Backend(Judge0CEClient(api_key))
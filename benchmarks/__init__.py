@@ -0,0 +1,2 @@
+"""Benchmarks for the snippets app. Run them from the repository root, e.g.
+python -m benchmarks.startup_benchmark"""
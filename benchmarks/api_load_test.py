@@ -0,0 +1,181 @@
+"""Load test of the JSON API server: requests per second and latency with concurrent clients.
+
+    python -m benchmarks.api_load_test --snippets 20000 --clients 32 --seconds 5
+
+Seeds a scratch database, starts api_server.py on it in its own process and
+runs each scenario with --clients keep-alive connections sending requests back
+to back. "revalidate" sends If-None-Match with the ETag of an earlier response,
+which the server answers with 304. Malformed requests (a bad request line, an
+invalid or negative Content-Length) are sent first and must get a 400. Exits
+with status 1 if a request fails, or if the 99th percentile latency of a
+scenario exceeds --budget-ms.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from database import SnippetsDatabase
+from benchmarks.synthetic import build_database, generate_users, WORDS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Users the clients log in as, in turn
+USERS = 20
+
+
+def seed(path: str, count: int):
+    with SnippetsDatabase(path) as db:
+        build_database(db, USERS, count)
+
+
+class Client:
+    """A keep-alive HTTP/1.1 connection sending one request at a time"""
+
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+        self.token = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method: str, path: str, body=None, headers=None):
+        """Returns (status, headers, decoded JSON body or None)"""
+        data = json.dumps(body).encode() if body is not None else b""
+        lines = ["%s %s HTTP/1.1" % (method, path), "Host: %s" % self.host, "Content-Length: %d" % len(data)]
+        if self.token:
+            lines.append("Authorization: Bearer " + self.token)
+        lines += ["%s: %s" % item for item in (headers or {}).items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + data)
+        status = int((await self.reader.readline()).split()[1])
+        response_headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        length = int(response_headers.get("content-length") or 0)
+        payload = await self.reader.readexactly(length) if length else b""
+        return status, response_headers, json.loads(payload) if payload else None
+
+    def close(self):
+        self.writer.close()
+
+
+# Malformed requests by name, each of which the server has to answer with 400 Bad Request
+MALFORMED_REQUESTS = {
+    "request line": b"GET\r\n\r\n",
+    "Content-Length: abc": b"POST /login HTTP/1.1\r\nContent-Length: abc\r\n\r\n",
+    "Content-Length: -3": b"POST /login HTTP/1.1\r\nContent-Length: -3\r\n\r\n",
+}
+
+
+async def check_malformed_requests(host: str, port: int):
+    """Returns the names of the malformed requests not answered with 400"""
+    failed = []
+    for name, request in MALFORMED_REQUESTS.items():
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(request)
+        line = await reader.readline()
+        writer.close()
+        if line.split()[1:2] != [b"400"]:
+            failed.append(name)
+    return failed
+
+
+def scenarios(snippets: int):
+    """Requests of each scenario by name, as functions (client, rng, etags) -> (method, path, headers)"""
+    def get(client, rng, etags):
+        return "GET", "/snippets/%d" % rng.randint(1, snippets), None
+
+    def list_page(client, rng, etags):
+        return "GET", "/snippets?after_id=%d&limit=50" % rng.randint(0, snippets), None
+
+    def search(client, rng, etags):
+        return "GET", "/snippets/search?q=%s&limit=20" % rng.choice(WORDS)[:4], None
+
+    def revalidate(client, rng, etags):
+        path = "/snippets/%d" % rng.randint(1, min(snippets, 100))
+        return "GET", path, {"If-None-Match": etags[path]} if path in etags else None
+
+    def mixed(client, rng, etags):
+        return rng.choices([get, list_page, search, revalidate], [5, 3, 1, 1])[0](client, rng, etags)
+
+    return {"get": get, "list": list_page, "search": search, "revalidate": revalidate, "mixed": mixed}
+
+
+async def run_scenario(host: str, port: int, make_request, clients: int, seconds: float):
+    """Returns the latencies of the successful requests and the number of failed ones"""
+    latencies, failures = [], [0]
+    users = list(generate_users(USERS))
+    deadline = time.perf_counter() + seconds
+
+    async def client_loop(number: int):
+        rng = random.Random(number)
+        client = Client(host, port)
+        await client.connect()
+        username, password, _ = users[number % USERS]
+        status, _, body = await client.request("POST", "/login", {"username": username, "password": password})
+        client.token = body["token"]
+        etags = {}
+        try:
+            while time.perf_counter() < deadline:
+                method, path, headers = make_request(client, rng, etags)
+                start = time.perf_counter()
+                status, response_headers, _ = await client.request(method, path, headers=headers)
+                latencies.append(time.perf_counter() - start)
+                if status not in (200, 304, 404):
+                    failures[0] += 1
+                if "etag" in response_headers:
+                    etags[path] = response_headers["etag"]
+        finally:
+            client.close()
+
+    await asyncio.gather(*(client_loop(number) for number in range(clients)))
+    return latencies, failures[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snippets", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--workers", type=int, default=8, help="database threads of the server")
+    parser.add_argument("--budget-ms", type=float, help="largest 99th percentile latency that passes")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "snippets.db")
+        seed(db_path, args.snippets)
+        server = subprocess.Popen([sys.executable, "api_server.py", "--db", db_path, "--port", "0", "--no-log",
+                                   "--workers", str(args.workers)], cwd=ROOT, stdout=subprocess.PIPE, text=True)
+        try:
+            url = server.stdout.readline().split()[-1]
+            host, port = url.split("//")[1].rstrip("/").split(":")
+            print("%d snippets, %d clients, %d database threads" % (args.snippets, args.clients, args.workers))
+            for name in asyncio.run(check_malformed_requests(host, int(port))):
+                print("malformed request not rejected with 400:", name)
+                failed = True
+            for name, make_request in scenarios(args.snippets).items():
+                latencies, failures = asyncio.run(run_scenario(host, int(port), make_request, args.clients,
+                                                               args.seconds))
+                latencies.sort()
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+                over = args.budget_ms is not None and p99 > args.budget_ms
+                failed = failed or over or failures > 0
+                print("%-12s %8.0f req/s  median %7.2f ms  p99 %7.2f ms  %d failed%s" % (
+                    name, len(latencies) / args.seconds, statistics.median(latencies) * 1000, p99, failures,
+                    "  OVER BUDGET" if over else ""))
+        finally:
+            server.terminate()
+            server.wait()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
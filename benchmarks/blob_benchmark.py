@@ -0,0 +1,115 @@
+"""Measures the size and read latency of snippet code before and after the blob store.
+
+    python -m benchmarks.blob_benchmark --snippets 20000 --forks 0.3
+
+Builds a database with the original snippets table, where code is plain TEXT,
+converts it in place by opening it with SnippetsDatabase (schema migration 6),
+and compares the pages used by the snippet code and the latency of reading a snippet.
+A fraction of the synthetic snippets are forks: exact or lightly edited copies.
+"""
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import statistics
+
+from database import SnippetsDatabase, SNIPPETS_TABLE
+
+# Boilerplate shared by the snippets of a language, as in real code
+TEMPLATES = {
+    "71": ("import sys\nimport os\nfrom collections import defaultdict\n\n\ndef main():\n", "\n\nif __name__ == \"__main__\":\n    main()\n"),
+    "54": ("#include <iostream>\n#include <vector>\n#include <string>\nusing namespace std;\n\nint main() {\n", "    return 0;\n}\n"),
+    "62": ("import java.util.*;\nimport java.io.*;\n\npublic class Main {\n    public static void main(String[] args) {\n", "    }\n}\n"),
+    "63": ("const readline = require(\"readline\");\nconst rl = readline.createInterface({ input: process.stdin });\n\n", "rl.close();\n"),
+}
+STATEMENTS = ["total = total + %s", "values.append(%s)", "print(%s)", "result[%s] += 1", "count -= %s",
+              "if %s > limit: break", "items.sort(key=len)", "name = name.strip()", "x = compute(%s, y)"]
+
+
+def make_code(rng: random.Random, language: str):
+    head, tail = TEMPLATES[language]
+    body = ["    " + rng.choice(STATEMENTS).replace("%s", str(rng.randint(0, 999))) for _ in range(rng.randint(3, 40))]
+    return head + "\n".join(body) + "\n" + tail
+
+
+def build_legacy(path: str, count: int, forks: float, seed: int = 0):
+    """Creates a database with the original snippets table and count snippets"""
+    rng = random.Random(seed)
+    connection = sqlite3.connect(path)
+    connection.execute(SNIPPETS_TABLE)
+    rows = []
+    for i in range(count):
+        if rows and rng.random() < forks:
+            original = rng.choice(rows)
+            code = original[2]
+            if rng.random() < 0.5:
+                code += "    # fork %d\n" % i
+            rows.append(("fork %d" % i, original[1], code, original[3]))
+        else:
+            language = rng.choice(list(TEMPLATES))
+            rows.append(("snippet %d" % i, language, make_code(rng, language),
+                         make_code(rng, language) if rng.random() < 0.2 else ""))
+    connection.executemany("INSERT INTO snippets VALUES (NULL, ?, ?, ?, ?, '', '', 0, 1)", rows)
+    connection.commit()
+    connection.execute("VACUUM")
+    connection.close()
+
+
+def table_sizes(connection: sqlite3.Connection):
+    """Returns the bytes of pages used by each table and index"""
+    return dict(connection.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+
+
+def measure(get_snippet, count: int, repeat: int, seed: int = 1):
+    rng = random.Random(seed)
+    timings = []
+    for _ in range(repeat):
+        snippet_id = rng.randint(1, count)
+        start = time.perf_counter()
+        get_snippet(snippet_id)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e6, statistics.quantiles(timings, n=100)[98] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snippets", type=int, default=20000)
+    parser.add_argument("--forks", type=float, default=0.3, help="fraction of snippets copied from another one")
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snippets.db")
+        build_legacy(path, args.snippets, args.forks)
+        connection = sqlite3.connect(path)
+        before = table_sizes(connection)["snippets"]
+        text_size = connection.execute("SELECT SUM(length(CAST(code AS BLOB)) + length(CAST(example_code AS BLOB))) "
+                                       "FROM snippets").fetchone()[0]
+        legacy = measure(lambda snippet_id: connection.execute("SELECT * FROM snippets WHERE id = ?",
+                                                               (snippet_id,)).fetchone(), args.snippets, args.repeat)
+        connection.close()
+
+        start = time.perf_counter()
+        db = SnippetsDatabase(path)
+        converted_in = time.perf_counter() - start
+        db.connection.execute("VACUUM")
+        sizes = table_sizes(db.connection)
+        after = sum(sizes.get(name, 0) for name in ("snippets", "blobs", "sqlite_autoindex_blobs_1", "blob_dictionaries"))
+        blobs, references, _, stored = db.get_blob_stats()
+        blob_store = measure(lambda snippet_id: db.connection.execute("SELECT * FROM snippets_text WHERE id = ?",
+                                                                      (snippet_id,)).fetchone(), args.snippets, args.repeat)
+        db.close()
+
+    print("%d snippets, %.0f%% forks, %.1f MiB of code text; converted in place in %.1f s" % (
+        args.snippets, args.forks * 100, text_size / 2 ** 20, converted_in))
+    print("blobs: %d for %d references, %.1f MiB stored" % (blobs, references, stored / 2 ** 20))
+    print("%-12s %8.1f MiB" % ("plain TEXT", before / 2 ** 20))
+    print("%-12s %8.1f MiB  (%.0f%% smaller)" % ("blob store", after / 2 ** 20, (1 - after / before) * 100))
+    print("read snippet  plain TEXT median %6.1f us  p99 %6.1f us" % legacy)
+    print("read snippet  blob store median %6.1f us  p99 %6.1f us" % blob_store)
+
+
+if __name__ == "__main__":
+    main()
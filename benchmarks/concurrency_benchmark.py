@@ -0,0 +1,84 @@
+"""Measures read and write throughput of SnippetsDatabase with N reader threads
+and one writer thread, with the old rollback journal settings and with WAL.
+
+    python -m benchmarks.concurrency_benchmark --readers 4 --seconds 5
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+from database import SnippetsDatabase
+from benchmarks.synthetic import build_database
+
+MODES = {
+    "rollback": {"journal_mode": "DELETE", "synchronous": "FULL"},
+    "wal": {"journal_mode": "WAL", "synchronous": "NORMAL"},
+}
+
+
+def run_mode(name: str, snippets: int, readers: int, seconds: float):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SnippetsDatabase(os.path.join(tmp, "snippets.db"), **MODES[name])
+        build_database(db, 100, snippets)
+        db.current_user = 1
+        stop = threading.Event()
+        counts = {"reads": 0, "writes": 0, "errors": 0}
+        lock = threading.Lock()
+
+        def reader(seed_value):
+            rng = random.Random(seed_value)
+            reads = errors = 0
+            while not stop.is_set():
+                try:
+                    db.get_snippet(rng.randint(1, snippets))
+                    db.get_snippets_page(rng.randint(1, 100), rng.randint(0, snippets), 50)
+                    reads += 2
+                except Exception:  # pylint: disable=broad-except
+                    errors += 1
+            db.connections.release()
+            with lock:
+                counts["reads"] += reads
+                counts["errors"] += errors
+
+        def writer():
+            writes = errors = 0
+            while not stop.is_set():
+                try:
+                    db.add_snippet("new", "71", "print('new')\n", "", "", "", False)
+                    writes += 1
+                except Exception:  # pylint: disable=broad-except
+                    errors += 1
+            db.connections.release()
+            with lock:
+                counts["writes"] += writes
+                counts["errors"] += errors
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+        threads.append(threading.Thread(target=writer))
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        db.close()
+
+    print("%-9s %2d readers  %9.0f reads/s  %7.0f writes/s  %d errors" % (
+        name, readers, counts["reads"] / seconds, counts["writes"] / seconds, counts["errors"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snippets", type=int, default=20000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+    for name in MODES:
+        run_mode(name, args.snippets, args.readers, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Near-duplicate lookups with the MinHash/LSH index against pairwise comparison.
+
+    python -m benchmarks.duplicate_benchmark --snippets 100000 --queries 200
+
+Imports --snippets generated snippets into a scratch database, in families of
+near duplicates (a changed constant, a renamed variable, an added or deleted
+line) among unrelated code, then times get_similar_snippets() on random
+snippets. The baseline computes the exact Jaccard similarity of the query's
+shingles with every snippet in the library, which is also the ground truth for
+recall. Exits with status 1 if recall is under --min-recall, or if the 99th
+percentile lookup time exceeds --budget-ms.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+from database import SnippetsDatabase
+from similarity import shingles, jaccard, SIMILARITY_THRESHOLD
+
+WORDS = ["total", "values", "index", "print", "result", "buffer", "parse", "render", "client", "server", "count",
+         "items", "name", "value", "data", "line", "path", "config", "user", "request"]
+TEMPLATES = ["{a} = {b}({c}, {n})", "for {a} in {b}:", "    {a}.append({b} + {n})", "if {a} > {n}:",
+             "    return {a}[{n}]", "{a} = [{b} for {c} in {a} if {c}]", "print({a}, {b}, {n})",
+             "def {a}({b}, {c}={n}):", "    {a} += {b} * {n}", "with open({a}) as {b}:"]
+
+
+def random_line(rng: random.Random):
+    return rng.choice(TEMPLATES).format(a=rng.choice(WORDS), b=rng.choice(WORDS), c=rng.choice(WORDS),
+                                        n=rng.randint(0, 100))
+
+
+def variant(rng: random.Random, code: str):
+    """Returns code with one small change: a constant, a renamed word, an added or a deleted line"""
+    lines = code.split("\n")
+    change = rng.randrange(4)
+    if change == 0:
+        return code.replace(str(rng.randint(0, 100)), str(rng.randint(0, 100)), 1) + "\n# %d" % rng.randint(0, 9)
+    if change == 1:
+        return code.replace(rng.choice(WORDS), rng.choice(WORDS) + "_2")
+    if change == 2:
+        lines.insert(rng.randrange(len(lines) + 1), random_line(rng))
+    elif len(lines) > 1:
+        del lines[rng.randrange(len(lines))]
+    return "\n".join(lines)
+
+
+def generate(count: int, rng: random.Random):
+    """Yields the code of count snippets: families of an original and up to five variants of it"""
+    produced = 0
+    while produced < count:
+        code = "\n".join(random_line(rng) for _ in range(rng.randint(5, 40)))
+        for i in range(min(rng.randint(1, 6), count - produced)):
+            yield code if i == 0 else variant(rng, code)
+            produced += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snippets", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200, help="snippets looked up with the index")
+    parser.add_argument("--pairwise-queries", type=int, default=20, help="of which also compared pairwise")
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    parser.add_argument("--budget-ms", type=float, help="largest 99th percentile lookup time that passes")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    codes = list(generate(args.snippets, rng))
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SnippetsDatabase(os.path.join(tmp, "snippets.db"))
+        start = time.perf_counter()
+        db.import_snippets({"name": "snippet %d" % i, "language_id": 71, "code": code, "user_id": 1}
+                           for i, code in enumerate(codes))
+        print("%d snippets imported and indexed in %.1f s" % (args.snippets, time.perf_counter() - start))
+
+        queries = rng.sample(range(1, args.snippets + 1), min(args.queries, args.snippets))
+        latencies, found = [], {}
+        for snippet_id in queries:
+            start = time.perf_counter()
+            similar = db.get_similar_snippets(snippet_id, 1, limit=100)
+            latencies.append(time.perf_counter() - start)
+            found[snippet_id] = {row[0] for row in similar}
+        db.close()
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print("LSH lookup: median %.2f ms  p99 %.2f ms, %.1f near duplicates per snippet" % (
+        statistics.median(latencies) * 1000, p99, sum(map(len, found.values())) / len(found)))
+
+    start = time.perf_counter()
+    library = [shingles(code) for code in codes]
+    pairwise_latencies, expected, true_positives = [], 0, 0
+    for snippet_id in queries[:args.pairwise_queries]:
+        query_start = time.perf_counter()
+        query = library[snippet_id - 1]
+        matches = {i + 1 for i, other in enumerate(library)
+                   if i + 1 != snippet_id and jaccard(query, other) >= SIMILARITY_THRESHOLD}
+        pairwise_latencies.append(time.perf_counter() - query_start)
+        expected += len(matches)
+        true_positives += len(matches & found[snippet_id])
+    recall = true_positives / expected if expected else 1.0
+    print("pairwise: median %.0f ms per lookup (plus %.1f s to shingle the library)" % (
+        statistics.median(pairwise_latencies) * 1000, time.perf_counter() - start - sum(pairwise_latencies)))
+    print("recall against exact Jaccard >= %.2f: %.1f%% of %d pairs" % (SIMILARITY_THRESHOLD, recall * 100, expected))
+
+    failures = []
+    if recall < args.min_recall:
+        failures.append("recall %.1f%% is under %.1f%%" % (recall * 100, args.min_recall * 100))
+    if args.budget_ms is not None and p99 > args.budget_ms:
+        failures.append("p99 lookup time %.2f ms is over the budget of %.2f ms" % (p99, args.budget_ms))
+    for failure in failures:
+        print("FAIL", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Measures keystroke-to-render latency of the code editor in a 50k-line buffer.
+
+    python -m benchmarks.editor_benchmark --lines 50000 --budget-ms 16
+
+Types a line of code in the middle of a large Python buffer, then a triple
+quote that turns every following line into a string, and reports the work done
+per keystroke: re-tokenizing the changed lines and the visible ones, and
+computing their tags. Without a display the editor's highlighter is driven
+directly, the same way CodeEditor drives it; with one, keystrokes are also sent
+to a CodeEditor and timed until Tk has processed its idle work. Exits with
+status 1 if the 99th percentile of a typing scenario exceeds the budget.
+"""
+import sys
+import time
+import random
+import argparse
+import statistics
+
+from highlight import Highlighter, PYTHON, tag_ranges
+from widgets import HIGHLIGHT_MARGIN, HIGHLIGHT_CHUNK
+
+# Lines shown in the editor window
+VIEW_LINES = 40
+TYPED = "        total = compute(values[index], 'label', 42)  # running total"
+
+FUNCTION = '''def function_{n}(values, limit=10):
+    """Returns the sum of the values below limit"""
+    total = 0
+    for index, value in enumerate(values):
+        if value < limit and index % {n} != 0:
+            total += value * 2  # doubled
+        else:
+            print("skipping", value)
+    return total
+
+'''
+
+
+def make_lines(count: int):
+    lines = []
+    n = 0
+    while len(lines) < count:
+        n += 1
+        lines += FUNCTION.format(n=n).splitlines()
+    return lines[:count]
+
+
+class HeadlessEditor:
+    """The highlighting work CodeEditor does, on a list of lines instead of a Text widget"""
+
+    def __init__(self, lines, top: int):
+        self.lines = lines
+        self.top = top
+        self.highlighter = Highlighter(PYTHON, len(lines))
+
+    def visible_lines(self):
+        return max(self.top - HIGHLIGHT_MARGIN, 0), self.top + VIEW_LINES + HIGHLIGHT_MARGIN
+
+    def highlight_visible(self):
+        return tag_ranges(self.highlighter.highlight(self.lines.__getitem__, *self.visible_lines()))
+
+    def highlight_in_background(self):
+        self.highlighter.tokenize(self.lines.__getitem__, 0, HIGHLIGHT_CHUNK)
+        return tag_ranges(self.highlighter.take_unpainted(*self.visible_lines()))
+
+    def type(self, line: int, column: int, chars: str):
+        text = self.lines[line]
+        if chars == "\n":
+            self.lines[line:line + 1] = [text[:column], text[column:]]
+            self.highlighter.replace_lines(line, 1, 2)
+        else:
+            self.lines[line] = text[:column] + chars + text[column:]
+            self.highlighter.replace_lines(line, 1, 1)
+        self.highlight_visible()
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return (statistics.median(timings) * 1000, timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000,
+            timings[-1] * 1000)
+
+
+def report(name: str, timings, budget_ms: float = None):
+    median, p99, worst = percentiles(timings)
+    over = budget_ms is not None and p99 > budget_ms
+    print("%-28s median %7.3f ms  p99 %7.3f ms  max %7.3f ms%s" % (name, median, p99, worst, "  OVER BUDGET" if over else ""))
+    return over
+
+
+def run_headless(line_count: int, budget_ms: float):
+    lines = make_lines(line_count)
+    line = line_count // 2
+    editor = HeadlessEditor(lines, line - VIEW_LINES // 2)
+
+    start = time.perf_counter()
+    editor.highlight_visible()
+    first_paint = time.perf_counter() - start
+    chunks = []
+    while editor.highlighter.pending:
+        start = time.perf_counter()
+        editor.highlight_in_background()
+        chunks.append(time.perf_counter() - start)
+    print("open %d lines: first paint %.2f ms, then %d idle chunks of %d lines, %.0f ms in total" % (
+        line_count, first_paint * 1000, len(chunks), HIGHLIGHT_CHUNK, sum(chunks) * 1000))
+    failed = report("idle chunk", chunks)
+
+    timings = []
+    for _ in range(5):
+        editor.type(line, 0, "\n")
+        line += 1
+        for column, char in enumerate(TYPED):
+            start = time.perf_counter()
+            editor.type(line, column, char)
+            timings.append(time.perf_counter() - start)
+    failed |= report("typing", timings, budget_ms)
+
+    # Opening a multi-line string changes every following line
+    editor.type(line, 0, "\n")
+    line += 1
+    timings = []
+    for column in range(3):
+        start = time.perf_counter()
+        editor.type(line, column, '"')
+        timings.append(time.perf_counter() - start)
+    failed |= report("opening a triple quote", timings, budget_ms)
+    chunks = 0
+    while editor.highlighter.pending:
+        editor.highlight_in_background()
+        chunks += 1
+    print("following lines re-tokenized in %d idle chunks" % chunks)
+    return failed
+
+
+def run_tk(line_count: int, budget_ms: float):
+    """Types into a CodeEditor; returns None without a display"""
+    import tkinter as tk
+    from widgets import CodeEditor
+
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        print("no display: CodeEditor not measured")
+        return None
+    editor = CodeEditor(root, language="71 {Python (3.8.1)}", height=VIEW_LINES)
+    editor.pack(fill=tk.BOTH, expand=True)
+    start = time.perf_counter()
+    editor.insert("1.0", "\n".join(make_lines(line_count)))
+    root.update()
+    print("CodeEditor: inserted and shown %d lines in %.0f ms" % (line_count, (time.perf_counter() - start) * 1000))
+    while editor.background_job is not None:
+        root.update()
+
+    line = line_count // 2
+    editor.text.mark_set("insert", "%d.0" % line)
+    editor.text.see("insert")
+    root.update()
+    timings = []
+    rng = random.Random(0)
+    for _ in range(3):
+        editor.insert("insert", "\n")
+        for char in TYPED:
+            start = time.perf_counter()
+            editor.insert("insert", char)
+            root.update_idletasks()
+            timings.append(time.perf_counter() - start)
+        if rng.random() < 0.5:
+            root.update()
+    failed = report("CodeEditor typing", timings, budget_ms)
+    root.destroy()
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=50000)
+    parser.add_argument("--budget-ms", type=float, default=16, help="largest 99th percentile keystroke latency")
+    args = parser.parse_args()
+
+    failed = run_headless(args.lines, args.budget_ms)
+    failed |= bool(run_tk(args.lines, args.budget_ms))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
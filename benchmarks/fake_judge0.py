@@ -0,0 +1,225 @@
+"""Local stand-in for the Judge0 CE API used by benchmarks"""
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import subprocess
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+LANGUAGES = [
+    {"id": 46, "name": "Bash (5.0.0)"},
+    {"id": 50, "name": "C (GCC 9.2.0)"},
+    {"id": 54, "name": "C++ (GCC 9.2.0)"},
+    {"id": 62, "name": "Java (OpenJDK 13.0.1)"},
+    {"id": 63, "name": "JavaScript (Node.js 12.14.0)"},
+    {"id": 71, "name": "Python (3.8.1)"},
+]
+
+STATUS_IN_QUEUE = {"id": 1, "description": "In Queue"}
+STATUS_PROCESSING = {"id": 2, "description": "Processing"}
+STATUS_ACCEPTED = {"id": 3, "description": "Accepted"}
+STATUS_TIME_LIMIT_EXCEEDED = {"id": 5, "description": "Time Limit Exceeded"}
+STATUS_RUNTIME_ERROR = {"id": 11, "description": "Runtime Error (NZEC)"}
+
+
+def echo_runner(source_code: str, language_id: int, stdin: str):
+    """Default fake execution: prints its stdin back. Returns (stdout, stderr, status)"""
+    return stdin or "", None, STATUS_ACCEPTED
+
+
+def python_runner(source_code: str, language_id: int, stdin: str):
+    """Fake execution that really runs the source code with the local Python interpreter"""
+    try:
+        process = subprocess.run([sys.executable, "-c", source_code], input=stdin or "", capture_output=True,
+                                 text=True, timeout=5, check=False)
+    except subprocess.TimeoutExpired:
+        return None, None, STATUS_TIME_LIMIT_EXCEEDED
+    return process.stdout, process.stderr or None, STATUS_ACCEPTED if process.returncode == 0 else STATUS_RUNTIME_ERROR
+
+
+RUNNERS = {"echo": echo_runner, "python": python_runner}
+
+
+class FakeJudge0Handler(BaseHTTPRequestHandler):
+    server: "FakeJudge0Server"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.count_connection()
+
+    def send_json(self, data, status: int = 200, headers: dict = None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self):
+        """Common request prologue; returns False if the request was answered with an injected error"""
+        self.server.count_request(self.command, self.path)
+        time.sleep(self.server.latency)
+        if self.server.take_throttle():
+            self.send_json({"error": "Too Many Requests"}, 429, {"Retry-After": str(self.server.retry_after)})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self.handle_request():
+            return
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        if parts == ["languages"]:
+            etag = '"languages-%d"' % len(self.server.languages)
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_json(self.server.languages, headers={"ETag": etag})
+        elif parts == ["submissions", "batch"]:
+            tokens = parse_qs(url.query).get("tokens", [""])[0].split(",")
+            self.send_json({"submissions": [self.server.submission_state(token) for token in tokens
+                                            if token in self.server.submissions]})
+        elif len(parts) == 2 and parts[0] == "submissions" and parts[1] in self.server.submissions:
+            self.send_json(self.server.submission_state(parts[1]))
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.handle_request():
+            return
+        url = urlsplit(self.path)
+        if url.path.strip("/") == "submissions/batch":
+            submissions = json.loads(body)["submissions"]
+            if len(submissions) > self.server.batch_size:
+                self.send_json({"error": "batch too large"}, 400)
+                return
+            self.send_json([{"token": self.server.create_submission(data)} for data in submissions], 201)
+            return
+        if url.path.strip("/") != "submissions":
+            self.send_json({"error": "not found"}, 404)
+            return
+        data = json.loads(body)
+        token = self.server.create_submission(data)
+        if parse_qs(url.query).get("wait") == ["true"]:
+            if not self.server.allow_wait:
+                self.send_json({"error": "wait not allowed"}, 400)
+                return
+            time.sleep(self.server.processing_time)
+            self.send_json(self.server.submission_state(token), 201)
+        else:
+            self.send_json({"token": token}, 201)
+
+
+class FakeJudge0Server(ThreadingHTTPServer):
+    """Fake Judge0 server on a random local port.
+
+    latency is added to every request, processing_time is how long a submission
+    stays In Queue/Processing, throttle makes the next requests fail with 429,
+    and runner(source_code, language_id, stdin) produces the submission output.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, languages: list = None, processing_time: float = 0.0,
+                 allow_wait: bool = True, runner=echo_runner, retry_after: float = 0, batch_size: int = 20,
+                 port: int = 0):
+        super().__init__(("127.0.0.1", port), FakeJudge0Handler)
+        self.latency: float = latency
+        self.languages: list = LANGUAGES if languages is None else languages
+        self.processing_time: float = processing_time
+        self.allow_wait: bool = allow_wait
+        self.runner = runner
+        self.retry_after: float = retry_after
+        self.batch_size: int = batch_size
+        self.throttle: int = 0
+        self.submissions: dict = {}
+        self.requests: dict = {}
+        self.connections: int = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d/" % self.server_address[1]
+
+    def count_request(self, method: str, path: str):
+        with self.lock:
+            key = method + " " + urlsplit(path).path
+            if key.startswith("GET /submissions/"):
+                key = "GET /submissions/{token}"
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def count_connection(self):
+        with self.lock:
+            self.connections += 1
+
+    def total_requests(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = {}
+            self.connections = 0
+
+    def take_throttle(self):
+        with self.lock:
+            if self.throttle > 0:
+                self.throttle -= 1
+                return True
+            return False
+
+    def create_submission(self, data: dict):
+        token = str(uuid.uuid4())
+        with self.lock:
+            self.submissions[token] = (time.monotonic(), data)
+        return token
+
+    def submission_state(self, token: str):
+        created_at, data = self.submissions[token]
+        elapsed = time.monotonic() - created_at
+        if elapsed < self.processing_time / 2:
+            return {"token": token, "status": STATUS_IN_QUEUE}
+        if elapsed < self.processing_time:
+            return {"token": token, "status": STATUS_PROCESSING}
+        stdout, stderr, status = self.runner(data.get("source_code", ""), data.get("language_id"), data.get("stdin"))
+        return {"token": token, "status": status, "stdout": stdout, "stderr": stderr, "compile_output": None,
+                "message": None, "time": "%.3f" % self.processing_time, "memory": 3000}
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves a fake Judge0 API until interrupted")
+    parser.add_argument("--port", type=int, default=2358)
+    parser.add_argument("--runner", choices=RUNNERS, default="echo", help="how submissions are \"executed\"")
+    parser.add_argument("--processing-time", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeJudge0Server(processing_time=args.processing_time, runner=RUNNERS[args.runner], port=args.port)
+    print("Fake Judge0 listening on " + server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Checks that repeated UI lookups of snippets and users are served from memory.
+
+Replays what the app does on a right-click, a copy and an execution of a
+snippet, counting the queries each step runs, and checks that edits and deletes
+are seen by the next lookup. Exits with status 1 if opening the context menu on
+a row seen before runs a query, or if a lookup returns a stale row.
+
+    python -m benchmarks.identity_map_check
+"""
+import sys
+
+from benchmarks.query_plans import RecordingDatabase
+
+
+def queries(db: RecordingDatabase, call):
+    """Returns the number of queries a call runs, and its result"""
+    db.recorded = []
+    result = call()
+    recorded, db.recorded = db.recorded, None
+    return len(recorded), result
+
+
+def context_menu(db: RecordingDatabase, snippet_id: int):
+    """The lookups of SnippetsApp.show_context_menu()"""
+    snippet = db.get_snippet(snippet_id)
+    return db.is_admin(db.current_user) or snippet[8] == db.current_user
+
+
+def main():
+    db = RecordingDatabase(":memory:")
+    db.login("admin", "admin")
+    for i in range(10):
+        db.add_snippet("snippet %d" % i, 71, "print(%d)" % i, "", "", "", False)
+
+    failures = []
+    steps = [
+        ("context menu, first time", lambda: context_menu(db, 3), None),
+        ("context menu, again", lambda: context_menu(db, 3), 0),
+        ("copy snippet", lambda: db.get_snippet(3), 0),
+        ("execute snippet", lambda: db.get_snippet(3), 0),
+        ("login lookups", lambda: (db.login("admin", "admin"), db.get_user_by_username("admin"),
+                                   db.is_admin(db.current_user)), 0),
+    ]
+    for name, call, expected in steps:
+        count, _ = queries(db, call)
+        failed = expected is not None and count > expected
+        if failed:
+            failures.append("%s ran %d queries" % (name, count))
+        print("%-4s %-28s %d queries" % ("FAIL" if failed else "ok", name, count))
+
+    db.edit_snippet(3, "renamed", 71, "print(3)", "", "", "", False)
+    if db.get_snippet(3)[1] != "renamed":
+        failures.append("get_snippet() returned the row from before edit_snippet()")
+    db.update_snippet(3, "updated", 71, "print(3)")
+    if db.get_snippet(3)[1] != "updated":
+        failures.append("get_snippet() returned the row from before update_snippet()")
+    db.delete_snippet(3)
+    if db.get_snippet(3) is not None:
+        failures.append("get_snippet() returned a deleted snippet")
+
+    for name, (hits, misses, rate) in db.get_cache_stats().items():
+        print("%-10s %4d hits %4d misses  hit rate %.0f%%" % (name, hits, misses, rate * 100))
+    for failure in failures:
+        print("FAIL", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Counts HTTP requests and measures end-to-end latency of Judge0CEClient.run_code
+against a local fake Judge0 server.
+
+    python -m benchmarks.judge0_client_benchmark --runs 10 --processing-time 1.0
+
+"run_many" runs the same number of snippets with batch requests.
+"legacy" replays the old client (a new connection per call, polling in a tight
+loop and fetching the result twice) for comparison.
+"""
+import time
+import argparse
+import statistics
+import requests
+
+from judge0ce import Judge0CEClient, PENDING_STATUSES
+from benchmarks.fake_judge0 import FakeJudge0Server
+
+
+def legacy_run_code(url: str, source_code: str, language_id: int):
+    token = requests.post(url + "submissions", json={"source_code": source_code, "language_id": language_id},
+                          timeout=30).json()["token"]
+    while requests.get(url + "submissions/" + token, timeout=30).json()["status"]["id"] in PENDING_STATUSES:
+        pass
+    return requests.get(url + "submissions/" + token, timeout=30).json()
+
+
+def run_scenario(name: str, server: FakeJudge0Server, runs: int, run_code, throttle: int = 0):
+    server.reset_counters()
+    timings = []
+    for _ in range(runs):
+        server.throttle = throttle
+        start = time.perf_counter()
+        run_code("print(input())", 71)
+        timings.append(time.perf_counter() - start)
+    print("%-16s %7.1f requests/run %6.1f connections/run   median %7.1f ms   max %7.1f ms" % (
+        name, server.total_requests() / runs, server.connections / runs,
+        statistics.median(timings) * 1000, max(timings) * 1000))
+
+
+def run_many_scenario(server: FakeJudge0Server, runs: int, client: Judge0CEClient):
+    server.reset_counters()
+    start = time.perf_counter()
+    results = list(client.run_many((i, "print(input())", 71, str(i)) for i in range(runs)))
+    elapsed = time.perf_counter() - start
+    assert sorted(key for key, _ in results) == list(range(runs))
+    print("%-16s %7.1f requests/run %6.1f connections/run   total  %7.1f ms for %d snippets" % (
+        "run_many", server.total_requests() / runs, server.connections / runs, elapsed * 1000, runs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--processing-time", type=float, default=1.0, help="seconds a submission takes")
+    parser.add_argument("--latency", type=float, default=0.005, help="simulated network latency in seconds")
+    args = parser.parse_args()
+
+    with FakeJudge0Server(args.latency, processing_time=args.processing_time, retry_after=0.1) as server:
+        url = server.url
+        run_scenario("legacy", server, args.runs, lambda code, language: legacy_run_code(url, code, language))
+        run_scenario("polling", server, args.runs, Judge0CEClient("", url, use_wait=False).run_code)
+        run_scenario("wait=true", server, args.runs, Judge0CEClient("", url).run_code)
+        run_scenario("throttled", server, args.runs, Judge0CEClient("", url).run_code, throttle=2)
+        server.allow_wait = False
+        run_scenario("wait disallowed", server, args.runs, Judge0CEClient("", url).run_code)
+        run_many_scenario(server, args.runs, Judge0CEClient("", url))
+
+
+if __name__ == "__main__":
+    main()
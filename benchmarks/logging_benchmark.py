@@ -0,0 +1,78 @@
+"""Measures the cost of @log on the calling (Tk) thread and the log bytes written per call.
+
+    python -m benchmarks.logging_benchmark --calls 2000
+
+Compares the original decorator, which formatted all arguments and wrote them to
+a FileHandler on the calling thread, with applog.log, which renders bounded
+arguments and hands the record to a background writer.
+"""
+import os
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+
+import applog
+
+
+def legacy_log(logger: logging.Logger):
+    """The @log decorator as it was before applog"""
+    def log(func):
+        def wrapper(*args, **kwargs):
+            logger.info(f"Calling {func.__name__} with args: {args} and kwargs: {kwargs}")
+            return func(*args, **kwargs)
+        return wrapper
+    return log
+
+
+def add_snippet(self, **kwargs):
+    pass
+
+
+def measure(decorated, calls: int, code: str):
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        decorated(None, name="snippet", language="71", code=code, example_code="", stdin="", expected_output="",
+                  is_private=False)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e6, max(timings) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_logger = logging.getLogger("legacy_benchmark")
+        legacy_logger.setLevel(logging.DEBUG)
+        legacy_logger.propagate = False
+        legacy_path = os.path.join(tmp, "legacy.log")
+        legacy_handler = logging.FileHandler(legacy_path)
+        legacy_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+        legacy_logger.addHandler(legacy_handler)
+        legacy = legacy_log(legacy_logger)(add_snippet)
+
+        path = os.path.join(tmp, "applog.log")
+        listener = applog.setup_logging(path)
+        structured = applog.log(add_snippet)
+
+        for size in (1024, 100 * 1024):
+            code = "print('hello')\n" * (size // 15)
+            for name, decorated, log_path in (("legacy", legacy, legacy_path), ("applog", structured, path)):
+                before = os.path.getsize(log_path)
+                median, worst = measure(decorated, args.calls, code)
+                if log_path == path:
+                    listener.stop()
+                    listener.start()
+                written = (os.path.getsize(log_path) - before) / args.calls
+                print("%-7s %4d KiB code  median %8.1f us  max %8.1f us  %8.0f log bytes/call" % (
+                    name, size // 1024, median, worst, written))
+        listener.stop()
+        legacy_handler.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Checks that hot SnippetsDatabase queries do not scan whole tables.
+
+Calls the hot methods on a scratch database, records the queries they run and
+asserts EXPLAIN QUERY PLAN uses an index for each of them. Exits with status 1
+if any query falls back to a full table scan.
+
+    python -m benchmarks.query_plans
+"""
+import re
+import sys
+
+from database import SnippetsDatabase
+
+# Tables that grow with the library and must never be scanned by a hot query
+LARGE_TABLES = ("snippets", "users", "blobs")
+
+
+class RecordingDatabase(SnippetsDatabase):
+    """SnippetsDatabase that records the queries it executes"""
+
+    def __init__(self, *args, **kwargs):
+        self.recorded = None
+        super().__init__(*args, **kwargs)
+
+    def execute_query(self, query, params=None):
+        if self.recorded is not None:
+            self.recorded.append((query, params))
+        return super().execute_query(query, params)
+
+
+def hot_calls(db: SnippetsDatabase):
+    """The hot paths of the app, by name"""
+    return {
+        "get_snippets(anonymous)": lambda: db.get_snippets(),
+        "get_snippets(user)": lambda: db.get_snippets(1),
+        "get_snippets_page(anonymous)": lambda: db.get_snippets_page(0, after_id=1),
+        "get_snippets_page(user)": lambda: db.get_snippets_page(1, after_id=1),
+        "get_snippets_page(backwards)": lambda: db.get_snippets_page(1, before_id=100),
+        "search_snippets": lambda: db.search_snippets("hello", 1),
+        "get_snippet": lambda: db.get_snippet(1),
+        "get_user": lambda: db.get_user(1),
+        "get_user_by_username": lambda: db.get_user_by_username("admin"),
+        "get_snippets_count_by_language": db.get_snippets_count_by_language,
+        "get_snippets_count_by_user": db.get_snippets_count_by_user,
+        "get_total_snippets": db.get_total_snippets,
+        "get_analytics_snapshot": db.get_analytics_snapshot,
+    }
+
+
+def full_scans(plan):
+    """Returns the plan steps that scan a large table without an index"""
+    pattern = re.compile(r"^SCAN (%s)( AS \w+)?$" % "|".join(LARGE_TABLES))
+    return [step for step in plan if pattern.match(step)]
+
+
+def main():
+    db = RecordingDatabase(":memory:")
+    db.current_user = 1
+    db.add_snippet("hello", "71", "print('hello')", "", "", "hello", False)
+
+    failed = False
+    for name, call in hot_calls(db).items():
+        db.recorded = []
+        call()
+        recorded, db.recorded = db.recorded, None
+        for query, params in recorded:
+            plan = db.explain_query_plan(query, params)
+            scans = full_scans(plan)
+            failed = failed or bool(scans)
+            print("%-4s %-32s %s" % ("FAIL" if scans else "ok", name, "; ".join(plan)))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
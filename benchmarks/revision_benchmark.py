@@ -0,0 +1,104 @@
+"""Storage overhead and reconstruction latency of the snippet revision history.
+
+    python -m benchmarks.revision_benchmark --revisions 5000 --lines 300
+
+Edits one snippet of --lines lines --revisions times through edit_snippet(),
+each edit changing, inserting or deleting a few lines, then materializes random
+revisions with get_revision(). Storage is the size of the snippet_revisions rows
+and of the snapshot blobs they reference, compared with storing every revision
+as a compressed copy. Exits with status 1 if a revision does not come back as it
+was stored, or if the 99th percentile reconstruction time exceeds --budget-ms.
+"""
+import sys
+import zlib
+import time
+import random
+import argparse
+import statistics
+
+from database import SnippetsDatabase, REVISION_SNAPSHOT_INTERVAL
+
+WORDS = ["total", "values", "index", "print", "result", "buffer", "parse", "render", "client", "server"]
+
+
+def random_line(rng: random.Random):
+    return "    " * rng.randint(0, 3) + " ".join(rng.choices(WORDS, k=rng.randint(2, 10))) + "\n"
+
+
+def edit(rng: random.Random, code: str):
+    """Returns code with one to three lines changed, inserted or deleted"""
+    lines = code.splitlines(keepends=True)
+    for _ in range(rng.randint(1, 3)):
+        position = rng.randrange(len(lines) + 1)
+        action = rng.random()
+        if action < 0.6 and position < len(lines):
+            lines[position] = random_line(rng)
+        elif action < 0.8 and position < len(lines) and len(lines) > 1:
+            del lines[position]
+        else:
+            lines.insert(position, random_line(rng))
+    return "".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--revisions", type=int, default=5000)
+    parser.add_argument("--lines", type=int, default=300)
+    parser.add_argument("--samples", type=int, default=1000, help="revisions materialized")
+    parser.add_argument("--budget-ms", type=float, help="largest 99th percentile reconstruction time that passes")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    db = SnippetsDatabase(":memory:")
+    db.login("admin", "admin")
+    code = "".join(random_line(rng) for _ in range(args.lines))
+    snippet_id = db.add_snippet("history", 71, code, None, "", "", False)
+    expected = {}
+    start = time.perf_counter()
+    for revision in range(2, args.revisions + 2):
+        # An edit that leaves the code as it was adds no revision
+        previous, code = code, edit(rng, code)
+        while code == previous:
+            code = edit(rng, code)
+        db.edit_snippet(snippet_id, "history", 71, code, None, "", "", False)
+        expected[revision] = code
+    elapsed = time.perf_counter() - start
+
+    # Rows are counted as their hash and name plus about 40 bytes of numbers and record header
+    db.execute_query("""SELECT COUNT(*), SUM(is_snapshot), COALESCE(SUM(length(code_delta)), 0),
+            COALESCE(SUM(length(content_hash) + length(name) + 40), 0) FROM snippet_revisions""")
+    count, snapshots, delta_bytes, row_bytes = db.fetch_one()
+    db.execute_query("""SELECT COALESCE(SUM(length(data)), 0) FROM blobs WHERE id IN (
+            SELECT code_blob_id FROM snippet_revisions WHERE snippet_id = ?)""", (snippet_id,))
+    snapshot_bytes = db.fetch_one()[0]
+    stored = delta_bytes + row_bytes + snapshot_bytes
+    full_copies = sum(len(zlib.compress(text.encode())) for text in expected.values())
+    print("%d revisions of %d lines, %d snapshots (every %d), %.0f edits/s" % (
+        count, args.lines, snapshots, REVISION_SNAPSHOT_INTERVAL, args.revisions / elapsed))
+    print("storage: %d KB deltas + %d KB snapshots + %d KB row overhead = %d KB, %.1f%% of %d KB of compressed copies" % (
+        delta_bytes // 1024, snapshot_bytes // 1024, row_bytes // 1024, stored // 1024,
+        stored * 100 / full_copies, full_copies // 1024))
+
+    failures = []
+    latencies = []
+    for revision in rng.sample(sorted(expected), min(args.samples, len(expected))):
+        start = time.perf_counter()
+        row = db.get_revision(snippet_id, revision)
+        latencies.append(time.perf_counter() - start)
+        if row is None or row[6] != expected[revision]:
+            failures.append("revision %d does not match the code it was stored from" % revision)
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print("reconstruction: median %.2f ms  p99 %.2f ms  max %.2f ms" % (
+        statistics.median(latencies) * 1000, p99, latencies[-1] * 1000))
+    if args.budget_ms is not None and p99 > args.budget_ms:
+        failures.append("p99 reconstruction time %.2f ms is over the budget of %.2f ms" % (p99, args.budget_ms))
+    db.close()
+
+    for failure in failures[:10]:
+        print("FAIL", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
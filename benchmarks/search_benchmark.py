@@ -0,0 +1,104 @@
+"""Measures SnippetsDatabase.search_snippets() latency over a synthetic corpus.
+
+    python -m benchmarks.search_benchmark --snippets 500000 --db /tmp/search_bench.db
+
+The corpus is built in a scratch directory, or once at --db and reused while
+that exists.
+"""
+import os
+import time
+import random
+import argparse
+import itertools
+import tempfile
+import statistics
+
+from database import SnippetsDatabase
+
+KEYWORDS = ["def", "return", "for", "while", "if", "else", "import", "class", "print", "int", "void", "const"]
+LANGUAGES = ["46", "50", "54", "62", "63", "71"]
+
+
+def make_vocabulary(rng: random.Random, size: int):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(4, 10))) + rng.choice(["", "_id", "_list", "2"])
+            for _ in range(size)]
+
+
+def make_code(rng: random.Random, vocabulary: list, cum_weights: list):
+    lines = []
+    for _ in range(rng.randint(3, 15)):
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(2, 6))
+        lines.append(rng.choice(KEYWORDS) + " " + " = ".join(words))
+    return "\n".join(lines)
+
+
+def build_corpus(db: SnippetsDatabase, count: int, seed: int = 0, batch: int = 10000):
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng, 20000)
+    # Zipf-like word frequencies, as in real code
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    for start in range(0, count, batch):
+        db.import_snippets([{"name": " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=2)),
+                             "language": rng.choice(LANGUAGES), "code": make_code(rng, vocabulary, cum_weights),
+                             "example_code": "", "stdin": "", "expected_output": "",
+                             "is_private": rng.random() < 0.3, "user_id": rng.randint(1, 1000)}
+                            for _ in range(min(batch, count - start))], batch_size=batch)
+    return vocabulary
+
+
+def measure(db: SnippetsDatabase, query: str, user_id: int, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        db.search_snippets(query, user_id, limit=50)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, max(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snippets", type=int, default=500000)
+    parser.add_argument("--db", help="database to build once and reuse, by default a scratch one")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=10.0, help="fail if a median latency exceeds this")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "search_bench.db")
+        fresh = not os.path.exists(path)
+        db = SnippetsDatabase(path)
+        if fresh:
+            start = time.perf_counter()
+            build_corpus(db, args.snippets)
+            print("built %d snippets in %.1f s" % (args.snippets, time.perf_counter() - start))
+        over_budget = run_queries(db, args)
+        db.close()
+    raise SystemExit(1 if over_budget else 0)
+
+
+def run_queries(db: SnippetsDatabase, args):
+    """Prints the latency of every query for an anonymous and a signed in user; returns whether one is over budget"""
+    vocabulary = make_vocabulary(random.Random(0), 20000)
+
+    # (query, checked against the budget). The frequent word is in ~40% of the
+    # snippets: FTS5 has to decode its whole doclist, so it is reported only.
+    queries = {
+        "rare word": (vocabulary[15000], True),
+        "medium word": (vocabulary[500], True),
+        "two words": (vocabulary[300] + " " + vocabulary[2000], True),
+        "prefix (as you type)": (vocabulary[1000][:3], True),
+        "frequent word": (vocabulary[5], False),
+    }
+    over_budget = False
+    for name, (query, budgeted) in queries.items():
+        for user_id in (0, 1):
+            median, worst = measure(db, query, user_id, args.repeat)
+            over_budget = over_budget or (budgeted and median > args.budget_ms)
+            print("%-22s user %d  median %7.2f ms  max %7.2f ms%s" % (
+                name, user_id, median, worst, "" if budgeted else "  (not budgeted)"))
+    return over_budget
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Checks that admin console queries stream, stop at the row limit and can be cancelled.
+
+    python -m benchmarks.sql_console_check --snippets 20000
+
+Runs ConsoleQuery the way the SQL console does, on a worker thread of a scratch
+database: an endless query cancelled from the main thread, a full table read
+capped by the row limit, an EXPLAIN QUERY PLAN and a write. Exits with status 1
+if a query is not stopped in time, returns more rows than the limit, holds
+more than one batch at a time, or leaves a stale cached row behind.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+from database import SnippetsDatabase, ConsoleQuery, query_plan_lines, CONSOLE_FETCH_SIZE
+
+# Longest time in seconds between cancel() and the end of a running query
+CANCEL_BUDGET = 0.1
+ENDLESS = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) SELECT x FROM n WHERE x < 0"
+
+
+def run_in_thread(db: SnippetsDatabase, query: ConsoleQuery, on_rows=lambda rows: None):
+    """Starts query.run() in a worker thread; returns the thread and a dict receiving the result or error"""
+    outcome = {}
+
+    def worker():
+        try:
+            outcome["result"] = query.run(on_rows)
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            db.connections.release()
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    return thread, outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snippets", type=int, default=20000)
+    parser.add_argument("--row-limit", type=int, default=5000)
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SnippetsDatabase(os.path.join(tmp, "snippets.db"))
+        db.import_snippets(({"name": "snippet %d" % i, "language_id": 71, "code": "print(%d)\n" % i, "user_id": 1}
+                            for i in range(args.snippets)))
+
+        query = ConsoleQuery(db, ENDLESS)
+        thread, outcome = run_in_thread(db, query)
+        time.sleep(0.2)
+        start = time.perf_counter()
+        query.cancel()
+        thread.join(5)
+        stopped = time.perf_counter() - start
+        print("endless query: cancelled after %.1f ms, %d VM steps" % (stopped * 1000, query.steps))
+        if thread.is_alive() or stopped > CANCEL_BUDGET or outcome != {"result": False}:
+            failures.append("the endless query was not cancelled within %d ms: %r" % (CANCEL_BUDGET * 1000, outcome))
+
+        batches = []
+        query = ConsoleQuery(db, "SELECT * FROM snippets_text", args.row_limit)
+        thread, outcome = run_in_thread(db, query, lambda rows: batches.append(len(rows)))
+        thread.join()
+        print("full read: %d rows in %d batches, %.1f ms, truncated %s" % (
+            query.rows, len(batches), query.elapsed() * 1000, query.truncated))
+        if sum(batches) != min(args.row_limit, args.snippets) or query.truncated != (args.snippets > args.row_limit):
+            failures.append("the full read returned %d rows for a limit of %d" % (sum(batches), args.row_limit))
+        if max(batches) > CONSOLE_FETCH_SIZE:
+            failures.append("a batch of %d rows was fetched at once" % max(batches))
+
+        plan = []
+        query = ConsoleQuery(db, "EXPLAIN QUERY PLAN SELECT * FROM snippets_text WHERE id = 1")
+        run_in_thread(db, query, plan.extend)[0].join()
+        print("query plan:\n  " + "\n  ".join(query_plan_lines(plan)))
+
+        db.get_snippet(1)
+        thread, outcome = run_in_thread(db, ConsoleQuery(db, "UPDATE snippets SET name = 'changed' WHERE id = 1"))
+        thread.join()
+        if db.get_snippet(1)[1] != "changed":
+            failures.append("get_snippet() returned the row from before a console UPDATE")
+        db.close()
+
+    for failure in failures:
+        print("FAIL", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
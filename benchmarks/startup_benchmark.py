@@ -0,0 +1,80 @@
+"""Measures cold start time of SnippetsDatabase with and without network.
+
+A cold start uses a fresh database file. "blocking" is the old behaviour
+(fetching the languages catalog before the window appears), "cached" is a
+start with a fresh stored catalog, "online"/"offline" are the first start
+with the refresh done in the background against a local stand-in server
+or an unreachable one.
+
+    python -m benchmarks.startup_benchmark --latency 0.2 --repeat 5
+"""
+import os
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import statistics
+
+from database import SnippetsDatabase
+from benchmarks.fake_judge0 import FakeJudge0Server
+
+
+def unreachable_url():
+    """Returns the URL of a local port nobody listens on"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return "http://127.0.0.1:%d/languages/" % s.getsockname()[1]
+
+
+def cold_start(db_name: str, languages_url: str, blocking: bool):
+    """Returns (startup time, time until the catalog refresh finished)"""
+    start = time.perf_counter()
+    with SnippetsDatabase(db_name, languages_url) as db:
+        if blocking:
+            db.update_supported_languages(force=True)
+        startup = time.perf_counter() - start
+
+        def refresh():
+            try:
+                with SnippetsDatabase(db_name, languages_url) as worker_db:
+                    worker_db.update_supported_languages()
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+        thread = threading.Thread(target=refresh)
+        thread.start()
+        thread.join()
+    return startup, time.perf_counter() - start
+
+
+def run_scenario(name: str, languages_url: str, repeat: int, blocking: bool = False, warm: bool = False):
+    startups, refreshes = [], []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_name = os.path.join(tmp, "snippets.db")
+            if warm:
+                cold_start(db_name, languages_url, blocking=True)
+            startup, refresh = cold_start(db_name, languages_url, blocking)
+            startups.append(startup)
+            refreshes.append(refresh)
+    print("%-10s startup median %8.2f ms   max %8.2f ms   catalog ready after %8.2f ms" % (
+        name, statistics.median(startups) * 1000, max(startups) * 1000, statistics.median(refreshes) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated server latency in seconds")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with FakeJudge0Server(latency=args.latency) as server:
+        url = server.url + "languages/"
+        run_scenario("blocking", url, args.repeat, blocking=True)
+        run_scenario("cached", url, args.repeat, warm=True)
+        run_scenario("online", url, args.repeat)
+    run_scenario("offline", unreachable_url(), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
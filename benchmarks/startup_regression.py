@@ -0,0 +1,86 @@
+"""Fails if the headless part of the app's startup gets slower than a budget.
+
+    python -m benchmarks.startup_regression --repeat 10 --budget-ms 150
+
+Starts fresh interpreters that import snippet_manager, open a database and query
+the first page of snippets, the work done before and right after the first frame,
+timed with the same StartupTimer as --profile-startup. Tk itself is not started,
+so no display is needed. Also fails if a module that should only be imported on
+first use, like requests, was imported at startup. Prints the slowest imports,
+measured with -X importtime.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from metrics import import_times, format_import_times
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules only needed by some actions, which must not be imported at startup
+LAZY_MODULES = ("requests", "urllib.request", "webbrowser", "cProfile", "concurrent.futures.process",
+                "backends", "execution", "tkinter.filedialog")
+
+STARTUP_SCRIPT = """
+import sys, json, time
+started = time.perf_counter()
+import snippet_manager
+from metrics import StartupTimer
+startup = StartupTimer(started)
+startup.mark("imports")
+db = snippet_manager.SnippetsDatabase(sys.argv[1])
+startup.mark("database")
+db.get_snippets_page(0)
+startup.mark("snippet list")
+print(json.dumps({"phases": startup.phases, "total": startup.total(),
+                  "lazy": [name for name in json.loads(sys.argv[2]) if name in sys.modules]}))
+"""
+
+
+def start(db_name: str, env: dict):
+    """Runs the startup in a fresh interpreter and returns its phases and the lazy modules it imported"""
+    result = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, db_name, json.dumps(LAZY_MODULES)],
+                            capture_output=True, text=True, cwd=ROOT, env=env, check=True)
+    return json.loads(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=150, help="largest median startup time that passes")
+    args = parser.parse_args()
+
+    # Bytecode is cached as it would be for an installed app
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "snippets.db")
+        # The first start creates the database and writes the bytecode caches
+        start(db_name, env)
+        runs = [start(db_name, env) for _ in range(args.repeat)]
+
+    print("Slowest imports (cumulative, self):")
+    print(format_import_times(import_times("snippet_manager", cwd=ROOT)))
+    print()
+    for i, (phase, _) in enumerate(runs[0]["phases"]):
+        print("%-16s median %8.1f ms" % (phase, statistics.median(run["phases"][i][1] for run in runs) * 1000))
+    total = statistics.median(run["total"] for run in runs) * 1000
+    print("%-16s median %8.1f ms   max %8.1f ms   budget %8.1f ms" % (
+        "total", total, max(run["total"] for run in runs) * 1000, args.budget_ms))
+
+    failures = []
+    if total > args.budget_ms:
+        failures.append("startup took %.1f ms, over the budget of %.1f ms" % (total, args.budget_ms))
+    if lazy := sorted(set(name for run in runs for name in run["lazy"])):
+        failures.append("imported at startup: " + ", ".join(lazy))
+    for failure in failures:
+        print("FAIL", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
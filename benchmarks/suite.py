@@ -0,0 +1,215 @@
+"""Benchmark suite of SnippetsDatabase over a synthetic library, with machine-readable results.
+
+    python -m benchmarks.suite --snippets 100000 --output before.json
+    python -m benchmarks.suite --snippets 100000 --compare before.json --tolerance 1.25
+
+Builds a database with benchmarks.synthetic, in a scratch directory or at --db,
+where it is reused while it has the requested numbers of rows. Each benchmark
+runs --warmup untimed calls, then up to --repeat timed ones within --max-seconds:
+reads (get_snippets, get_snippet from the identity map and from SQLite, search),
+a cold login, add/edit/delete, the analytics queries and the Treeview refresh
+path (the first page and scrolling through the next ones, as PagedTreeview
+fetches them). Snippets added by the suite are deleted again, so a reused
+database keeps its size.
+
+Results are written to --output as JSON: the parameters, the commit, Python and
+SQLite versions, and per benchmark the number of calls and the median, mean,
+95th and 99th percentile and maximum in milliseconds. With --compare, medians
+are compared with an earlier results file, and the suite exits with status 1 if
+one is more than --tolerance times slower.
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+from database import SNIPPET_PAGE_SIZE
+from benchmarks.synthetic import open_database, generate_users, make_code, WORDS, LANGUAGE_WEIGHTS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Pages loaded after the first one by the "treeview_scroll" benchmark
+SCROLL_PAGES = 5
+
+
+def git_commit():
+    """Returns (commit, whether the tree has uncommitted changes), or (None, None) outside a git checkout"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def benchmarks(db, snippets: int, rng: random.Random, added: list):
+    """The benchmarks by name, as functions called once per timed call.
+
+    Ids of the snippets the suite adds are appended to added, for the benchmarks
+    editing and deleting them; those raise StopIteration when there are none left.
+    """
+    username, password, _ = next(generate_users(1))
+    user_id = db.authenticate(username, password)
+    hot_ids = [rng.randint(1, snippets) for _ in range(100)]
+
+    def treeview_page(after_id=0):
+        """A page of the snippet list, fetched and formatted as PagedTreeview does for SnippetsApp"""
+        rows = db.get_snippets_page(user_id, after_id, SNIPPET_PAGE_SIZE)
+        return [(row[0], row[1], db.get_language_name(row[2]) or "", (row[3] or "") + "...") for row in rows]
+
+    def treeview_scroll():
+        after_id = 0
+        for _ in range(SCROLL_PAGES + 1):
+            rows = treeview_page(after_id)
+            if not rows:
+                break
+            after_id = rows[-1][0]
+
+    def login():
+        db.logout()
+        return db.login(username, password)
+
+    def add_snippet():
+        language_id = rng.choice(list(LANGUAGE_WEIGHTS))
+        added.append(db.add_snippet("suite %d" % len(added), language_id, make_code(rng, language_id), "", "", "",
+                                    False, user_id))
+
+    def edit_snippet():
+        if not added:
+            raise StopIteration
+        snippet_id = rng.choice(added)
+        language_id = rng.choice(list(LANGUAGE_WEIGHTS))
+        db.edit_snippet(snippet_id, "suite edited", language_id, make_code(rng, language_id), "", "", "", False,
+                        user_id)
+
+    def delete_snippet():
+        if not added:
+            raise StopIteration
+        db.delete_snippet(added.pop())
+
+    return {
+        "get_snippets(anonymous)": lambda: db.get_snippets(),
+        "get_snippets(user)": lambda: db.get_snippets(user_id),
+        "get_snippet(cached)": lambda: db.get_snippet(rng.choice(hot_ids)),
+        "get_snippet(uncached)": lambda: db.load_snippet(rng.randint(1, snippets)),
+        "search_snippets": lambda: db.search_snippets(rng.choice(WORDS), user_id, limit=100),
+        "login": login,
+        "add_snippet": add_snippet,
+        "edit_snippet": edit_snippet,
+        "delete_snippet": delete_snippet,
+        "get_total_snippets": db.get_total_snippets,
+        "get_snippets_count_by_language": db.get_snippets_count_by_language,
+        "get_snippets_count_by_user": db.get_snippets_count_by_user,
+        "get_analytics_snapshot": db.get_analytics_snapshot,
+        "check_analytics_consistency": db.check_analytics_consistency,
+        "treeview_refresh": treeview_page,
+        "treeview_scroll": treeview_scroll,
+    }
+
+
+def run(call, warmup: int, repeat: int, max_seconds: float):
+    """Returns the timings of up to repeat calls in seconds, stopping early after max_seconds or at StopIteration"""
+    timings = []
+    try:
+        for _ in range(warmup):
+            call()
+        deadline = time.perf_counter() + max_seconds
+        while len(timings) < repeat and (len(timings) < 3 or time.perf_counter() < deadline):
+            start = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - start)
+    except StopIteration:
+        pass
+    return timings
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    ms = [timing * 1000 for timing in timings]
+    return {"calls": len(ms), "median_ms": statistics.median(ms), "mean_ms": statistics.fmean(ms),
+            "p95_ms": ms[min(len(ms) - 1, int(len(ms) * 0.95))], "p99_ms": ms[min(len(ms) - 1, int(len(ms) * 0.99))],
+            "max_ms": ms[-1]}
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Prints the change of every median against a baseline; returns the names of the regressions"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        ratio = result["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+        regressed = ratio > tolerance
+        if regressed:
+            regressions.append(name)
+        print("%-32s %10.3f -> %10.3f ms  x%.2f%s" % (name, before["median_ms"], result["median_ms"], ratio,
+                                                     "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--snippets", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="database to build once and reuse, by default a scratch one")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--max-seconds", type=float, default=2.0, help="time after which a benchmark stops repeating")
+    parser.add_argument("--only", help="run the benchmarks whose name contains this")
+    parser.add_argument("--output", help="JSON results file")
+    parser.add_argument("--compare", help="JSON results file of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="largest median slowdown that passes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        db = open_database(args.db or os.path.join(tmp, "snippets.db"), args.users, args.snippets, args.seed)
+        build_seconds = time.perf_counter() - start
+        print("%d users, %d snippets ready in %.1f s" % (args.users, args.snippets, build_seconds))
+
+        rng = random.Random(args.seed)
+        results, added = {}, []
+        for name, call in benchmarks(db, args.snippets, rng, added).items():
+            if args.only and args.only not in name:
+                continue
+            timings = run(call, args.warmup, args.repeat, args.max_seconds)
+            if not timings:
+                print("%-32s skipped, nothing to run it on" % name)
+                continue
+            results[name] = summary = summarize(timings)
+            print("%-32s %6d calls  median %9.3f ms  p95 %9.3f ms  p99 %9.3f ms" % (
+                name, summary["calls"], summary["median_ms"], summary["p95_ms"], summary["p99_ms"]), flush=True)
+        for snippet_id in added:
+            db.delete_snippet(snippet_id)
+        db.close()
+
+    commit, dirty = git_commit()
+    report = {"meta": {"commit": commit, "dirty": dirty, "created_at": time.time(),
+                       "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                       "platform": platform.platform(), "users": args.users, "snippets": args.snippets,
+                       "seed": args.seed, "build_seconds": build_seconds},
+              "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        print("\nagainst %s (%s):" % (args.compare, (baseline["meta"].get("commit") or "unknown commit")[:12]))
+        regressions = compare(results, baseline, args.tolerance)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Offline synthetic data for benchmarks: users and snippets shaped like a real library.
+
+    python -m benchmarks.synthetic --db /tmp/bench.db --users 1000 --snippets 100000
+
+Code is built from per-language boilerplate and statements, with a log-normal
+number of lines: most snippets are a dozen lines, a few are hundreds. Languages
+follow LANGUAGE_WEIGHTS, snippet owners a Zipf-like distribution (a few users
+own most snippets), PRIVATE_FRACTION of the snippets are private and
+FORK_FRACTION are exact or lightly edited copies of an earlier snippet. Users and
+snippets are written with bulk inserts, many rows per transaction. Everything
+derives from the seed, so the same arguments build the same database.
+"""
+import os
+import math
+import time
+import random
+import argparse
+import itertools
+
+from database import SnippetsDatabase
+
+# Judge0 language ids and their share of snippets
+LANGUAGE_WEIGHTS = {71: 35, 63: 18, 62: 12, 54: 10, 50: 6, 51: 5, 74: 5, 60: 3, 46: 3, 73: 2, 72: 1}
+# Boilerplate and statements of each language, as (head, tail, indent, statements); %s is a number
+TEMPLATES = {
+    71: ("import sys\nfrom collections import defaultdict\n\n\ndef main():\n", "\n\nif __name__ == \"__main__\":\n    main()\n",
+         "    ", ["total = total + %s", "values.append(%s)", "print(total, %s)", "result[%s] += 1", "count -= %s",
+                 "if count > %s:\n        break", "items.sort(key=len)", "name = name.strip()"]),
+    63: ("const readline = require(\"readline\");\n\nfunction main() {\n", "}\n\nmain();\n",
+         "  ", ["total += %s;", "values.push(%s);", "console.log(total, %s);", "result[%s] = (result[%s] || 0) + 1;",
+                 "if (count > %s) return;", "items.sort((a, b) => a - b);", "const name = input.trim();"]),
+    62: ("import java.util.*;\n\npublic class Main {\n    public static void main(String[] args) {\n", "    }\n}\n",
+         "        ", ["total += %s;", "values.add(%s);", "System.out.println(total + %s);", "result[%s]++;",
+                     "if (count > %s) break;", "Collections.sort(items);", "String name = line.trim();"]),
+    54: ("#include <iostream>\n#include <vector>\nusing namespace std;\n\nint main() {\n", "    return 0;\n}\n",
+         "    ", ["total += %s;", "values.push_back(%s);", "cout << total << %s << endl;", "result[%s]++;",
+                 "if (count > %s) break;", "sort(items.begin(), items.end());", "string name = line;"]),
+    50: ("#include <stdio.h>\n#include <stdlib.h>\n\nint main(void) {\n", "    return 0;\n}\n",
+         "    ", ["total += %s;", "values[count++] = %s;", "printf(\"%%d\\n\", total + %s);", "result[%s]++;",
+                 "if (count > %s) break;", "qsort(items, n, sizeof(int), compare);"]),
+    51: ("using System;\nusing System.Collections.Generic;\n\nclass Program {\n    static void Main() {\n", "    }\n}\n",
+         "        ", ["total += %s;", "values.Add(%s);", "Console.WriteLine(total + %s);", "result[%s]++;",
+                     "if (count > %s) break;", "items.Sort();"]),
+    74: ("function main(): void {\n", "}\n\nmain();\n",
+         "  ", ["total += %s;", "values.push(%s);", "console.log(total, %s);", "const limit: number = %s;",
+                 "if (count > %s) return;", "items.sort();"]),
+    60: ("package main\n\nimport \"fmt\"\n\nfunc main() {\n", "}\n",
+         "\t", ["total += %s", "values = append(values, %s)", "fmt.Println(total, %s)", "result[%s]++",
+                "if count > %s {\n\t\treturn\n\t}"]),
+    46: ("#!/bin/bash\nset -e\n\n", "",
+         "", ["total=$((total + %s))", "echo \"$total\" %s", "values+=(%s)", "sleep 0.%s"]),
+    73: ("use std::io;\n\nfn main() {\n", "}\n",
+         "    ", ["total += %s;", "values.push(%s);", "println!(\"{} {}\", total, %s);", "let limit = %s;"]),
+    72: ("require 'set'\n\n", "",
+         "", ["total += %s", "values << %s", "puts total, %s", "result[%s] += 1"]),
+}
+WORDS = ["total", "values", "index", "result", "buffer", "parse", "render", "client", "server", "count", "items",
+         "sort", "fast", "test", "helper", "example", "solution", "input", "graph", "tree"]
+# Number of code lines: log-normal with this median, capped at MAX_LINES
+LINES_MEDIAN = 12
+LINES_SIGMA = 0.9
+MAX_LINES = 1000
+PRIVATE_FRACTION = 0.3
+FORK_FRACTION = 0.1
+EXAMPLE_FRACTION = 0.2
+# Fraction of generated users who are administrators
+ADMIN_FRACTION = 0.01
+# Number of recent snippets forks are copied from, which bounds memory on large builds
+FORK_POOL = 1000
+BATCH_SIZE = 10000
+
+
+def make_code(rng: random.Random, language_id: int, lines: int = None):
+    """Returns a snippet of code in a language, with lines statements or a log-normal number of them"""
+    head, tail, indent, statements = TEMPLATES[language_id]
+    if lines is None:
+        lines = min(MAX_LINES, max(1, int(rng.lognormvariate(math.log(LINES_MEDIAN), LINES_SIGMA))))
+    body = [indent + rng.choice(statements).replace("%s", str(rng.randint(0, 999))) for _ in range(lines)]
+    return head + "\n".join(body) + "\n" + tail
+
+
+def generate_users(count: int, seed: int = 0):
+    """Yields (username, password, access_code) of count users"""
+    rng = random.Random(seed)
+    for i in range(count):
+        yield "user%07d" % i, "password%d" % i, 2 if rng.random() < ADMIN_FRACTION else 1
+
+
+def generate_snippets(count: int, user_ids, seed: int = 0):
+    """Yields count snippets as dicts with SNIPPET_FIELDS keys for import_snippets(), owned by user_ids"""
+    rng = random.Random(seed)
+    user_ids = list(user_ids)
+    rng.shuffle(user_ids)
+    # Zipf-like ownership: the user of rank r owns a share proportional to 1 / r
+    owner_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(user_ids) + 1)))
+    languages, language_weights = list(LANGUAGE_WEIGHTS), list(itertools.accumulate(LANGUAGE_WEIGHTS.values()))
+    pool = []
+    for i in range(count):
+        if pool and rng.random() < FORK_FRACTION:
+            original = rng.choice(pool)
+            language_id, code = original["language_id"], original["code"]
+            if rng.random() < 0.5:
+                code = code.replace(str(rng.randint(0, 999)), str(rng.randint(0, 999)), 1) + "\n"
+            example_code = original["example_code"]
+        else:
+            language_id = rng.choices(languages, cum_weights=language_weights)[0]
+            code = make_code(rng, language_id)
+            example_code = make_code(rng, language_id, rng.randint(1, 5)) if rng.random() < EXAMPLE_FRACTION else ""
+        snippet = {"name": "%s %s %d" % (rng.choice(WORDS), rng.choice(WORDS), i), "language_id": language_id,
+                   "code": code, "example_code": example_code, "stdin": "", "expected_output": "",
+                   "is_private": rng.random() < PRIVATE_FRACTION,
+                   "user_id": rng.choices(user_ids, cum_weights=owner_weights)[0]}
+        if len(pool) < FORK_POOL:
+            pool.append(snippet)
+        else:
+            pool[rng.randrange(FORK_POOL)] = snippet
+        yield snippet
+
+
+def build_database(db: SnippetsDatabase, users: int, snippets: int, seed: int = 0, batch_size: int = BATCH_SIZE,
+                   on_progress=None):
+    """Adds users generated users and snippets generated snippets to a database, in batches of batch_size rows.
+
+    on_progress(imported) is called after every batch of snippets.
+    """
+    db.add_users(generate_users(users, seed), batch_size)
+    db.execute_query("SELECT id FROM users ORDER BY id")
+    user_ids = [user_id for user_id, in db.fetch_all()]
+    db.import_snippets(generate_snippets(snippets, user_ids, seed), batch_size, on_progress=on_progress)
+
+
+def open_database(path: str, users: int, snippets: int, seed: int = 0, **kwargs):
+    """Opens a database of generated data at path, building it unless it already has these numbers of rows.
+
+    Other keyword arguments are passed to SnippetsDatabase. A database built for
+    other numbers is deleted and rebuilt.
+    """
+    if os.path.exists(path):
+        db = SnippetsDatabase(path, **kwargs)
+        # The administrator created with every database comes on top of the generated users
+        if db.get_total_users() == users + 1 and db.get_total_snippets() == snippets:
+            return db
+        db.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    db = SnippetsDatabase(path, **kwargs)
+    build_database(db, users, snippets, seed)
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--snippets", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    db = SnippetsDatabase(args.db)
+    build_database(db, args.users, args.snippets, args.seed,
+                   on_progress=lambda imported: print("%d snippets, %.0f/s" % (
+                       imported, imported / (time.perf_counter() - start)), flush=True))
+    print("%d users and %d snippets in %.1f s, %.1f MB" % (args.users, args.snippets, time.perf_counter() - start,
+                                                          os.path.getsize(args.db) / 1e6))
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import zlib
+import hashlib
+from collections import Counter
+
+# zlib uses at most the last 32 KiB of a dictionary
+DICTIONARY_SIZE = 32 * 1024
+# Level 9 saves ~5% on snippets at twice the CPU time of level 6
+COMPRESSION_LEVEL = 6
+
+# Values of blobs.compression
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+
+def blob_hash(text: str):
+    """Returns the content address of a text, a SHA-256 digest"""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class BlobCodec:
+    """Compresses and decompresses blobs with zlib and an optional preset dictionary.
+
+    Loading a dictionary into a compressor costs more than compressing a typical
+    snippet, so a primed compressor is kept and copied for every blob.
+    """
+
+    def __init__(self, dictionary: bytes = None):
+        self.dictionary = dictionary
+        if dictionary:
+            self.compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=dictionary)
+        else:
+            self.compressor = zlib.compressobj(COMPRESSION_LEVEL)
+
+    def compress(self, text: str):
+        """Returns (data, compression) for a text, stored as is when compressing does not make it smaller"""
+        raw = text.encode("utf-8")
+        compressor = self.compressor.copy()
+        data = compressor.compress(raw) + compressor.flush()
+        if len(data) < len(raw):
+            return data, COMPRESSION_ZLIB
+        return raw, COMPRESSION_NONE
+
+    def decompress(self, data: bytes, compression: int):
+        """Returns the text of a stored blob"""
+        if compression == COMPRESSION_NONE:
+            return data.decode("utf-8")
+        decompressor = zlib.decompressobj(zdict=self.dictionary) if self.dictionary else zlib.decompressobj()
+        return (decompressor.decompress(data) + decompressor.flush()).decode("utf-8")
+
+
+def train_dictionary(samples, size: int = DICTIONARY_SIZE):
+    """Builds a zlib preset dictionary from sample texts.
+
+    The dictionary is made of the lines that occur in the most samples, weighted by
+    their length. zlib finds matches closer to the end of the dictionary more
+    cheaply, so the most valuable lines come last. Returns None if no line repeats.
+    """
+    counts = Counter()
+    for sample in samples:
+        counts.update(set(line for line in sample.encode("utf-8").splitlines(keepends=True) if len(line) > 3))
+    lines = [(count * len(line), line) for line, count in counts.items() if count > 1]
+    lines.sort(reverse=True)
+
+    chosen, total = [], 0
+    for _, line in lines:
+        if total + len(line) > size:
+            continue
+        chosen.append(line)
+        total += len(line)
+    return b"".join(reversed(chosen)) or None
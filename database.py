@@ -1,65 +1,851 @@
+import os
+import re
 import random
 import json
+import time
+import hashlib
 import sqlite3
-import requests
-import urllib.request
+import itertools
+import threading
+from collections import Counter, OrderedDict
+
+from blobstore import BlobCodec, blob_hash, train_dictionary
+from revisions import make_delta, apply_delta, content_hash
+from similarity import minhash, band_buckets, load_signature, estimate_similarity, SIMILARITY_THRESHOLD
+from metrics import metrics, query_template
+
+LANGUAGES_URL = "https://ce.judge0.com/languages/"
+# How long (in seconds) a fetched supported languages catalog is considered fresh
+LANGUAGES_TTL = 24 * 60 * 60
+
+# Connection settings: page cache size in KiB, memory-mapped I/O size in bytes,
+# and how long (in seconds) to wait for a lock held by another connection
+CACHE_SIZE = 64 * 1024
+MMAP_SIZE = 256 * 1024 * 1024
+BUSY_TIMEOUT = 10.0
+
+# Number of rows returned by get_snippets_page() by default
+SNIPPET_PAGE_SIZE = 100
+
+# Number of newest full-text matches ranked by search_snippets()
+SEARCH_MAX_CANDIDATES = 1000
+
+# Total size in bytes of cached execution results before the least recently used are evicted
+EXECUTION_CACHE_SIZE = 16 * 1024 * 1024
+# Execution cache lookups counted in memory before their hits, misses and last use times are written
+EXECUTION_CACHE_USAGE_BATCH = 100
+
+# Number of snippet and user rows kept in memory by their identity maps
+SNIPPET_ROWS_CACHE_SIZE = 512
+USER_ROWS_CACHE_SIZE = 128
+
+# Rows an admin console query returns before it is stopped, and rows fetched at a time
+CONSOLE_ROW_LIMIT = 10000
+CONSOLE_FETCH_SIZE = 200
+# SQLite virtual machine instructions between two checks for cancellation of a console query
+CONSOLE_PROGRESS_STEPS = 1000
+
+# Schema migrations applied on top of the tables from create_tables(), in order.
+# PRAGMA user_version stores how many of them have been applied. A migration is
+# either a list of SQL statements or a function taking the SnippetsDatabase.
+# Never edit or reorder an existing migration, append a new one instead.
+MIGRATIONS = [
+    # 1: indexes for get_snippets() and the analytics queries
+    [
+        'CREATE INDEX IF NOT EXISTS "idx_snippets_user_id" ON "snippets" ("user_id")',
+        'CREATE INDEX IF NOT EXISTS "idx_snippets_is_private" ON "snippets" ("is_private", "id")',
+        'CREATE INDEX IF NOT EXISTS "idx_snippets_language" ON "snippets" ("language")',
+    ],
+    # 2: full-text search index over snippets, kept in sync by triggers
+    [
+        """CREATE VIRTUAL TABLE "snippets_fts" USING fts5(
+            name, language, code, example_code,
+            content='snippets', content_rowid='id', tokenize="unicode61 tokenchars '_'", prefix='2 3'
+        )""",
+        "INSERT INTO snippets_fts(snippets_fts) VALUES ('rebuild')",
+        """CREATE TRIGGER "snippets_fts_insert" AFTER INSERT ON "snippets" BEGIN
+            INSERT INTO snippets_fts(rowid, name, language, code, example_code)
+            VALUES (new.id, new.name, new.language, new.code, new.example_code);
+        END""",
+        """CREATE TRIGGER "snippets_fts_delete" AFTER DELETE ON "snippets" BEGIN
+            INSERT INTO snippets_fts(snippets_fts, rowid, name, language, code, example_code)
+            VALUES ('delete', old.id, old.name, old.language, old.code, old.example_code);
+        END""",
+        """CREATE TRIGGER "snippets_fts_update" AFTER UPDATE OF name, language, code, example_code ON "snippets" BEGIN
+            INSERT INTO snippets_fts(snippets_fts, rowid, name, language, code, example_code)
+            VALUES ('delete', old.id, old.name, old.language, old.code, old.example_code);
+            INSERT INTO snippets_fts(rowid, name, language, code, example_code)
+            VALUES (new.id, new.name, new.language, new.code, new.example_code);
+        END""",
+    ],
+    # 3: execution result cache
+    [
+        """CREATE TABLE "execution_cache" (
+            "key"	TEXT NOT NULL UNIQUE,
+            "result"	TEXT NOT NULL,
+            "size"	INTEGER NOT NULL,
+            "created_at"	REAL NOT NULL,
+            "last_used_at"	REAL NOT NULL,
+            PRIMARY KEY("key")
+        )""",
+        'CREATE INDEX "idx_execution_cache_last_used_at" ON "execution_cache" ("last_used_at")',
+        """CREATE TABLE "execution_cache_stats" (
+            "id"	INTEGER NOT NULL UNIQUE CHECK ("id" = 1),
+            "hits"	INTEGER NOT NULL DEFAULT 0,
+            "misses"	INTEGER NOT NULL DEFAULT 0
+        )""",
+        'INSERT INTO "execution_cache_stats" ("id") VALUES (1)',
+    ],
+    # 4: checkpoints of interrupted bulk imports
+    [
+        """CREATE TABLE "import_progress" (
+            "source"	TEXT NOT NULL UNIQUE,
+            "imported"	INTEGER NOT NULL,
+            PRIMARY KEY("source")
+        )""",
+    ],
+    # 5: analytics counters, kept up to date by triggers
+    [
+        """CREATE TABLE "stats_totals" (
+            "name"	TEXT NOT NULL UNIQUE,
+            "count"	INTEGER NOT NULL,
+            PRIMARY KEY("name")
+        )""",
+        """CREATE TABLE "stats_by_language" (
+            "language"	TEXT NOT NULL UNIQUE,
+            "count"	INTEGER NOT NULL,
+            PRIMARY KEY("language")
+        )""",
+        """CREATE TABLE "stats_by_user" (
+            "user_id"	INTEGER NOT NULL UNIQUE,
+            "count"	INTEGER NOT NULL,
+            PRIMARY KEY("user_id")
+        )""",
+        """CREATE TRIGGER "stats_snippets_insert" AFTER INSERT ON "snippets" BEGIN
+            INSERT INTO stats_totals VALUES ('snippets', 1), (CASE WHEN new.is_private THEN 'private_snippets' ELSE 'public_snippets' END, 1)
+                ON CONFLICT(name) DO UPDATE SET count = count + 1;
+            INSERT INTO stats_by_language VALUES (coalesce(new.language, ''), 1)
+                ON CONFLICT(language) DO UPDATE SET count = count + 1;
+            INSERT INTO stats_by_user VALUES (new.user_id, 1)
+                ON CONFLICT(user_id) DO UPDATE SET count = count + 1;
+        END""",
+        """CREATE TRIGGER "stats_snippets_delete" AFTER DELETE ON "snippets" BEGIN
+            UPDATE stats_totals SET count = count - 1
+                WHERE name IN ('snippets', CASE WHEN old.is_private THEN 'private_snippets' ELSE 'public_snippets' END);
+            UPDATE stats_by_language SET count = count - 1 WHERE language = coalesce(old.language, '');
+            DELETE FROM stats_by_language WHERE language = coalesce(old.language, '') AND count = 0;
+            UPDATE stats_by_user SET count = count - 1 WHERE user_id = old.user_id;
+            DELETE FROM stats_by_user WHERE user_id = old.user_id AND count = 0;
+        END""",
+        """CREATE TRIGGER "stats_snippets_update" AFTER UPDATE OF language, user_id, is_private ON "snippets" BEGIN
+            UPDATE stats_totals SET count = count - 1
+                WHERE name = CASE WHEN old.is_private THEN 'private_snippets' ELSE 'public_snippets' END;
+            INSERT INTO stats_totals VALUES (CASE WHEN new.is_private THEN 'private_snippets' ELSE 'public_snippets' END, 1)
+                ON CONFLICT(name) DO UPDATE SET count = count + 1;
+            UPDATE stats_by_language SET count = count - 1 WHERE language = coalesce(old.language, '');
+            DELETE FROM stats_by_language WHERE language = coalesce(old.language, '') AND count = 0;
+            INSERT INTO stats_by_language VALUES (coalesce(new.language, ''), 1)
+                ON CONFLICT(language) DO UPDATE SET count = count + 1;
+            UPDATE stats_by_user SET count = count - 1 WHERE user_id = old.user_id;
+            DELETE FROM stats_by_user WHERE user_id = old.user_id AND count = 0;
+            INSERT INTO stats_by_user VALUES (new.user_id, 1)
+                ON CONFLICT(user_id) DO UPDATE SET count = count + 1;
+        END""",
+        """CREATE TRIGGER "stats_users_insert" AFTER INSERT ON "users" BEGIN
+            INSERT INTO stats_totals VALUES ('users', 1) ON CONFLICT(name) DO UPDATE SET count = count + 1;
+        END""",
+        """CREATE TRIGGER "stats_users_delete" AFTER DELETE ON "users" BEGIN
+            UPDATE stats_totals SET count = count - 1 WHERE name = 'users';
+        END""",
+        "INSERT INTO stats_totals SELECT 'users', COUNT(*) FROM users",
+        """INSERT INTO stats_totals
+            SELECT 'snippets', COUNT(*) FROM snippets
+            UNION ALL SELECT 'public_snippets', COUNT(*) FROM snippets WHERE NOT is_private OR is_private IS NULL
+            UNION ALL SELECT 'private_snippets', COUNT(*) FROM snippets WHERE is_private""",
+        "INSERT INTO stats_by_language SELECT coalesce(language, ''), COUNT(*) FROM snippets GROUP BY 1",
+        "INSERT INTO stats_by_user SELECT user_id, COUNT(*) FROM snippets GROUP BY user_id",
+    ],
+    # 6: code and example_code move to the compressed, deduplicated blob store
+    lambda db: db.convert_to_blob_store(),
+    # 7: the free text language column is replaced by language_id, referencing supported_languages
+    lambda db: db.normalize_languages(),
+    # 8: revision history of snippet edits
+    [
+        # A revision is a snapshot, whose code and example code are blobs, or a delta
+        # of them from make_delta() against the previous revision. content_hash
+        # identifies the texts of the revision for the next one.
+        """CREATE TABLE "snippet_revisions" (
+            "snippet_id"	INTEGER NOT NULL,
+            "revision"	INTEGER NOT NULL,
+            "created_at"	REAL,
+            "user_id"	INTEGER,
+            "is_snapshot"	INTEGER NOT NULL,
+            "content_hash"	BLOB NOT NULL,
+            "name"	TEXT,
+            "language_id"	INTEGER,
+            "stdin"	TEXT,
+            "expected_output"	TEXT,
+            "is_private"	INTEGER,
+            "code_blob_id"	INTEGER REFERENCES "blobs" ("id"),
+            "example_code_blob_id"	INTEGER REFERENCES "blobs" ("id"),
+            "code_delta"	BLOB,
+            "example_code_delta"	BLOB,
+            PRIMARY KEY("snippet_id", "revision")
+        )""",
+        """CREATE TRIGGER "snippet_revisions_insert" AFTER INSERT ON "snippet_revisions" BEGIN
+            UPDATE blobs SET refcount = refcount + 1 WHERE id = new.code_blob_id;
+            UPDATE blobs SET refcount = refcount + 1 WHERE id = new.example_code_blob_id;
+        END""",
+        """CREATE TRIGGER "snippet_revisions_delete" AFTER DELETE ON "snippet_revisions" BEGIN
+            UPDATE blobs SET refcount = refcount - 1 WHERE id = old.code_blob_id;
+            UPDATE blobs SET refcount = refcount - 1 WHERE id = old.example_code_blob_id;
+            DELETE FROM blobs WHERE id IN (old.code_blob_id, old.example_code_blob_id) AND refcount <= 0;
+        END""",
+        """CREATE TRIGGER "snippet_revisions_snippet_delete" AFTER DELETE ON "snippets" BEGIN
+            DELETE FROM snippet_revisions WHERE snippet_id = old.id;
+        END""",
+    ],
+    # 9: MinHash signatures and LSH buckets of snippet code, for near-duplicate lookups
+    lambda db: db.create_similarity_index(),
+]
+
+# The snippets table as created before the blob store, also used for SQL dumps
+# whose code and example_code columns hold the text itself, and language the language id
+SNIPPETS_TABLE = """CREATE TABLE IF NOT EXISTS "snippets" (
+            "id"	INTEGER,
+            "name"	TEXT,
+            "language"	TEXT,
+            "code"	TEXT,
+            "example_code"	TEXT,
+            "stdin"	TEXT,
+            "expected_output"	TEXT,
+            "is_private"	INTEGER,
+            "user_id"	INTEGER NOT NULL,
+            PRIMARY KEY("id")
+        )"""
+
+# Schema of the blob store. snippets.code_blob_id and example_code_blob_id reference
+# blobs, which the snippets_text view joins back into SNIPPET_FIELDS columns.
+# Blobs are looked up by their SHA-256 hash when stored, by id when read. Small
+# columns come first, so reading them never follows the overflow pages of data.
+# Triggers keep the full-text index and the blob reference counts up to date;
+# the delete and update triggers read the old blobs before releasing them.
+BLOB_STORE_SCHEMA = [
+    """CREATE TABLE "blob_dictionaries" (
+        "id"	INTEGER NOT NULL UNIQUE,
+        "data"	BLOB NOT NULL,
+        "created_at"	REAL NOT NULL,
+        PRIMARY KEY("id" AUTOINCREMENT)
+    )""",
+    """CREATE TABLE "blobs" (
+        "id"	INTEGER NOT NULL,
+        "hash"	BLOB NOT NULL UNIQUE,
+        "refcount"	INTEGER NOT NULL DEFAULT 0,
+        "size"	INTEGER NOT NULL,
+        "preview"	TEXT NOT NULL,
+        "compression"	INTEGER NOT NULL,
+        "dictionary_id"	INTEGER REFERENCES "blob_dictionaries" ("id"),
+        "data"	BLOB NOT NULL,
+        PRIMARY KEY("id")
+    )""",
+    """CREATE VIEW "snippets_text" AS
+        SELECT s.id, s.name, s.language,
+            blob_text(c.data, c.compression, c.dictionary_id) AS code,
+            blob_text(e.data, e.compression, e.dictionary_id) AS example_code,
+            s.stdin, s.expected_output, s.is_private, s.user_id
+        FROM snippets s
+        LEFT JOIN blobs c ON c.id = s.code_blob_id
+        LEFT JOIN blobs e ON e.id = s.example_code_blob_id""",
+    """CREATE VIRTUAL TABLE "snippets_fts" USING fts5(
+        name, language, code, example_code,
+        content='snippets_text', content_rowid='id', tokenize="unicode61 tokenchars '_'", prefix='2 3'
+    )""",
+    "INSERT INTO snippets_fts(snippets_fts) VALUES ('rebuild')",
+    """CREATE TRIGGER "snippets_content_insert" AFTER INSERT ON "snippets" BEGIN
+        UPDATE blobs SET refcount = refcount + 1 WHERE id = new.code_blob_id;
+        UPDATE blobs SET refcount = refcount + 1 WHERE id = new.example_code_blob_id;
+        INSERT INTO snippets_fts(rowid, name, language, code, example_code)
+        SELECT id, name, language, code, example_code FROM snippets_text WHERE id = new.id;
+    END""",
+    """CREATE TRIGGER "snippets_content_delete" AFTER DELETE ON "snippets" BEGIN
+        INSERT INTO snippets_fts(snippets_fts, rowid, name, language, code, example_code)
+        VALUES ('delete', old.id, old.name, old.language,
+            (SELECT blob_text(data, compression, dictionary_id) FROM blobs WHERE id = old.code_blob_id),
+            (SELECT blob_text(data, compression, dictionary_id) FROM blobs WHERE id = old.example_code_blob_id));
+        UPDATE blobs SET refcount = refcount - 1 WHERE id = old.code_blob_id;
+        UPDATE blobs SET refcount = refcount - 1 WHERE id = old.example_code_blob_id;
+        DELETE FROM blobs WHERE id IN (old.code_blob_id, old.example_code_blob_id) AND refcount <= 0;
+    END""",
+    """CREATE TRIGGER "snippets_content_update" AFTER UPDATE OF name, language, code_blob_id, example_code_blob_id ON "snippets" BEGIN
+        INSERT INTO snippets_fts(snippets_fts, rowid, name, language, code, example_code)
+        VALUES ('delete', old.id, old.name, old.language,
+            (SELECT blob_text(data, compression, dictionary_id) FROM blobs WHERE id = old.code_blob_id),
+            (SELECT blob_text(data, compression, dictionary_id) FROM blobs WHERE id = old.example_code_blob_id));
+        INSERT INTO snippets_fts(rowid, name, language, code, example_code)
+        SELECT id, name, language, code, example_code FROM snippets_text WHERE id = new.id;
+        UPDATE blobs SET refcount = refcount + 1 WHERE id = new.code_blob_id;
+        UPDATE blobs SET refcount = refcount + 1 WHERE id = new.example_code_blob_id;
+        UPDATE blobs SET refcount = refcount - 1 WHERE id = old.code_blob_id;
+        UPDATE blobs SET refcount = refcount - 1 WHERE id = old.example_code_blob_id;
+        DELETE FROM blobs WHERE id IN (old.code_blob_id, old.example_code_blob_id) AND refcount <= 0;
+    END""",
+]
+
+# Schema of normalized languages. snippets_text returns language_id in place of the
+# language text; the full-text index indexes the language name from the catalog through
+# snippets_search, and is rebuilt when the catalog renames a language snippets use.
+LANGUAGE_SCHEMA = [
+    'CREATE INDEX "idx_snippets_language_id" ON "snippets" ("language_id")',
+    """CREATE VIEW "snippets_text" AS
+        SELECT s.id, s.name, s.language_id,
+            blob_text(c.data, c.compression, c.dictionary_id) AS code,
+            blob_text(e.data, e.compression, e.dictionary_id) AS example_code,
+            s.stdin, s.expected_output, s.is_private, s.user_id
+        FROM snippets s
+        LEFT JOIN blobs c ON c.id = s.code_blob_id
+        LEFT JOIN blobs e ON e.id = s.example_code_blob_id""",
+    """CREATE VIEW "snippets_search" AS
+        SELECT t.id, t.name, l.name AS language, t.code, t.example_code
+        FROM snippets_text t LEFT JOIN supported_languages l ON l.id = t.language_id""",
+    """CREATE VIRTUAL TABLE "snippets_fts" USING fts5(
+        name, language, code, example_code,
+        content='snippets_search', content_rowid='id', tokenize="unicode61 tokenchars '_'", prefix='2 3'
+    )""",
+    "INSERT INTO snippets_fts(snippets_fts) VALUES ('rebuild')",
+    """CREATE TRIGGER "snippets_content_insert" AFTER INSERT ON "snippets" BEGIN
+        UPDATE blobs SET refcount = refcount + 1 WHERE id = new.code_blob_id;
+        UPDATE blobs SET refcount = refcount + 1 WHERE id = new.example_code_blob_id;
+        INSERT INTO snippets_fts(rowid, name, language, code, example_code)
+        SELECT id, name, language, code, example_code FROM snippets_search WHERE id = new.id;
+    END""",
+    """CREATE TRIGGER "snippets_content_delete" AFTER DELETE ON "snippets" BEGIN
+        INSERT INTO snippets_fts(snippets_fts, rowid, name, language, code, example_code)
+        VALUES ('delete', old.id, old.name, (SELECT name FROM supported_languages WHERE id = old.language_id),
+            (SELECT blob_text(data, compression, dictionary_id) FROM blobs WHERE id = old.code_blob_id),
+            (SELECT blob_text(data, compression, dictionary_id) FROM blobs WHERE id = old.example_code_blob_id));
+        UPDATE blobs SET refcount = refcount - 1 WHERE id = old.code_blob_id;
+        UPDATE blobs SET refcount = refcount - 1 WHERE id = old.example_code_blob_id;
+        DELETE FROM blobs WHERE id IN (old.code_blob_id, old.example_code_blob_id) AND refcount <= 0;
+    END""",
+    """CREATE TRIGGER "snippets_content_update" AFTER UPDATE OF name, language_id, code_blob_id, example_code_blob_id ON "snippets" BEGIN
+        INSERT INTO snippets_fts(snippets_fts, rowid, name, language, code, example_code)
+        VALUES ('delete', old.id, old.name, (SELECT name FROM supported_languages WHERE id = old.language_id),
+            (SELECT blob_text(data, compression, dictionary_id) FROM blobs WHERE id = old.code_blob_id),
+            (SELECT blob_text(data, compression, dictionary_id) FROM blobs WHERE id = old.example_code_blob_id));
+        INSERT INTO snippets_fts(rowid, name, language, code, example_code)
+        SELECT id, name, language, code, example_code FROM snippets_search WHERE id = new.id;
+        UPDATE blobs SET refcount = refcount + 1 WHERE id = new.code_blob_id;
+        UPDATE blobs SET refcount = refcount + 1 WHERE id = new.example_code_blob_id;
+        UPDATE blobs SET refcount = refcount - 1 WHERE id = old.code_blob_id;
+        UPDATE blobs SET refcount = refcount - 1 WHERE id = old.example_code_blob_id;
+        DELETE FROM blobs WHERE id IN (old.code_blob_id, old.example_code_blob_id) AND refcount <= 0;
+    END""",
+    # Snippets without a known language are counted under language id 0
+    """CREATE TABLE "stats_by_language" (
+        "language_id"	INTEGER NOT NULL UNIQUE,
+        "count"	INTEGER NOT NULL,
+        PRIMARY KEY("language_id")
+    )""",
+    """CREATE TRIGGER "stats_snippets_insert" AFTER INSERT ON "snippets" BEGIN
+        INSERT INTO stats_totals VALUES ('snippets', 1), (CASE WHEN new.is_private THEN 'private_snippets' ELSE 'public_snippets' END, 1)
+            ON CONFLICT(name) DO UPDATE SET count = count + 1;
+        INSERT INTO stats_by_language VALUES (coalesce(new.language_id, 0), 1)
+            ON CONFLICT(language_id) DO UPDATE SET count = count + 1;
+        INSERT INTO stats_by_user VALUES (new.user_id, 1)
+            ON CONFLICT(user_id) DO UPDATE SET count = count + 1;
+    END""",
+    """CREATE TRIGGER "stats_snippets_delete" AFTER DELETE ON "snippets" BEGIN
+        UPDATE stats_totals SET count = count - 1
+            WHERE name IN ('snippets', CASE WHEN old.is_private THEN 'private_snippets' ELSE 'public_snippets' END);
+        UPDATE stats_by_language SET count = count - 1 WHERE language_id = coalesce(old.language_id, 0);
+        DELETE FROM stats_by_language WHERE language_id = coalesce(old.language_id, 0) AND count = 0;
+        UPDATE stats_by_user SET count = count - 1 WHERE user_id = old.user_id;
+        DELETE FROM stats_by_user WHERE user_id = old.user_id AND count = 0;
+    END""",
+    """CREATE TRIGGER "stats_snippets_update" AFTER UPDATE OF language_id, user_id, is_private ON "snippets" BEGIN
+        UPDATE stats_totals SET count = count - 1
+            WHERE name = CASE WHEN old.is_private THEN 'private_snippets' ELSE 'public_snippets' END;
+        INSERT INTO stats_totals VALUES (CASE WHEN new.is_private THEN 'private_snippets' ELSE 'public_snippets' END, 1)
+            ON CONFLICT(name) DO UPDATE SET count = count + 1;
+        UPDATE stats_by_language SET count = count - 1 WHERE language_id = coalesce(old.language_id, 0);
+        DELETE FROM stats_by_language WHERE language_id = coalesce(old.language_id, 0) AND count = 0;
+        INSERT INTO stats_by_language VALUES (coalesce(new.language_id, 0), 1)
+            ON CONFLICT(language_id) DO UPDATE SET count = count + 1;
+        UPDATE stats_by_user SET count = count - 1 WHERE user_id = old.user_id;
+        DELETE FROM stats_by_user WHERE user_id = old.user_id AND count = 0;
+        INSERT INTO stats_by_user VALUES (new.user_id, 1)
+            ON CONFLICT(user_id) DO UPDATE SET count = count + 1;
+    END""",
+    "INSERT INTO stats_by_language SELECT coalesce(language_id, 0), COUNT(*) FROM snippets GROUP BY 1",
+]
+
+# Schema of the near-duplicate index. A snippet with code has a MinHash signature from
+# similarity.minhash() and one row per LSH band; snippets sharing a (band, bucket) are
+# candidate near duplicates. add_snippet(), edit_snippet() and import_snippets() index
+# the code they write, and a trigger drops the rows of deleted snippets.
+SIMILARITY_SCHEMA = [
+    """CREATE TABLE "snippet_signatures" (
+        "snippet_id"	INTEGER NOT NULL,
+        "signature"	BLOB NOT NULL,
+        PRIMARY KEY("snippet_id")
+    )""",
+    """CREATE TABLE "snippet_lsh_bands" (
+        "band"	INTEGER NOT NULL,
+        "bucket"	INTEGER NOT NULL,
+        "snippet_id"	INTEGER NOT NULL,
+        PRIMARY KEY("band", "bucket", "snippet_id")
+    ) WITHOUT ROWID""",
+    'CREATE INDEX "idx_snippet_lsh_bands_snippet_id" ON "snippet_lsh_bands" ("snippet_id")',
+    """CREATE TRIGGER "snippet_signatures_snippet_delete" AFTER DELETE ON "snippets" BEGIN
+        DELETE FROM snippet_lsh_bands WHERE snippet_id = old.id;
+        DELETE FROM snippet_signatures WHERE snippet_id = old.id;
+    END""",
+]
+
+# Inserts a snippet whose code and example code are blob ids from store_blob()
+INSERT_SNIPPET = """INSERT INTO snippets (name, language_id, code_blob_id, example_code_blob_id, stdin, expected_output,
+    is_private, user_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+
+# Number of snippets sampled to train a blob compression dictionary
+BLOB_DICTIONARY_SAMPLES = 2000
+# Number of leading characters of a blob also stored uncompressed, so snippet lists never decompress
+BLOB_PREVIEW_LENGTH = 32
+
+# Queries recomputing the analytics counters from scratch, as (table, query)
+ANALYTICS_QUERIES = (
+    ("stats_totals", """SELECT 'users', COUNT(*) FROM users
+        UNION ALL SELECT 'snippets', COUNT(*) FROM snippets
+        UNION ALL SELECT 'public_snippets', COUNT(*) FROM snippets WHERE NOT is_private OR is_private IS NULL
+        UNION ALL SELECT 'private_snippets', COUNT(*) FROM snippets WHERE is_private"""),
+    ("stats_by_language", "SELECT coalesce(language_id, 0), COUNT(*) FROM snippets GROUP BY coalesce(language_id, 0)"),
+    ("stats_by_user", "SELECT user_id, COUNT(*) FROM snippets GROUP BY user_id"),
+)
+
+# Fields of a snippet in import and export files, in snippets_text column order
+SNIPPET_FIELDS = ("id", "name", "language_id", "code", "example_code", "stdin", "expected_output", "is_private",
+                  "user_id")
+# Fields of a revision returned by get_revision()
+REVISION_FIELDS = ("snippet_id", "revision", "created_at", "user_id", "name", "language_id", "code", "example_code",
+                   "stdin", "expected_output", "is_private")
+# Every this many revisions of a snippet is a snapshot, so materializing one applies fewer deltas
+REVISION_SNAPSHOT_INTERVAL = 32
+# Most snippets sharing an LSH bucket with a lookup that are compared with it, which bounds lookups of boilerplate code
+SIMILARITY_MAX_CANDIDATES = 1000
+# Number of snippets written per transaction by import_snippets() and read per fetch by export_snippets()
+IMPORT_BATCH_SIZE = 1000
+
+
+def read_jsonl(path: str):
+    """Yields the records of a JSON Lines file one at a time"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def parse_language_id(language):
+    """Returns the Judge0 language id of a language value, or None.
+
+    The value is a combobox value, e.g. "71 {Python (3.8.1)}", or a bare id.
+    """
+    match = re.match(r"\s*\(?\s*(\d+)", str(language))
+    return int(match.group(1)) if match else None
+
+
+def execution_cache_key(language_id, source_code: str, stdin: str = None, compiler_options: str = None,
+                        backend: str = "judge0"):
+    """Returns the content hash identifying an execution for the result cache"""
+    data = json.dumps([backend, str(language_id), source_code, stdin or "", compiler_options or ""])
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def build_search_query(text: str):
+    """Turns user input into an FTS5 query matching all words as prefixes.
+
+    Returns None if the input has no searchable words.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join('"%s"*' % word for word in words)
+
+def query_plan_lines(rows):
+    """Returns the details of EXPLAIN QUERY PLAN rows (id, parent, notused, detail), indented by depth"""
+    depths, lines = {0: -1}, []
+    for plan_id, parent, _, detail in rows:
+        depths[plan_id] = depths.get(parent, -1) + 1
+        lines.append("   " * depths[plan_id] + detail)
+    return lines
+
+
+class IdentityMap:
+    """Thread-safe LRU map of database rows by id, counting hits and misses.
+
+    Rows are tuples, so a cached row can be handed out as is. Writers call
+    discard() after changing a row; a row loaded while a discard() happened is not
+    stored, as it may have been read before the change.
+    """
+
+    def __init__(self, name: str, size: int):
+        self.name: str = name
+        self.size: int = size
+        self.rows = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        """Returns the row of a key, calling load(key) on a miss. None rows are not cached."""
+        with self.lock:
+            row = self.rows.get(key)
+            if row is not None:
+                self.rows.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            generation = self.generation
+        if metrics.enabled:
+            metrics.increment("snippets_cache_lookups_total",
+                              (("cache", self.name), ("result", "miss" if row is None else "hit")))
+        if row is None:
+            row = load(key)
+            if row is not None:
+                self.put(key, row, generation)
+        return row
+
+    def put(self, key, row, generation: int = None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.rows[key] = row
+            self.rows.move_to_end(key)
+            while len(self.rows) > self.size:
+                self.rows.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.rows.pop(key, None)
+            self.generation += 1
+
+    def clear(self):
+        with self.lock:
+            self.rows.clear()
+            self.generation += 1
+
+    def stats(self):
+        """Returns (hits, misses, hit rate) since the map was created"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return self.hits, self.misses, self.hits / lookups if lookups else 0.0
+
+
+class ConsoleQuery:
+    """An admin console query, streamed in batches and cancellable from another thread.
+
+    run() executes the query on the calling thread's connection, normally a worker
+    thread, and passes the rows to on_rows(rows) CONSOLE_FETCH_SIZE at a time,
+    stopping after row_limit rows. cancel() stops it through the progress handler
+    and sqlite3's interrupt(). steps counts the virtual machine instructions run,
+    a measure of the rows scanned that Python's sqlite3 can report.
+    """
+
+    def __init__(self, db: "SnippetsDatabase", sql: str, row_limit: int = CONSOLE_ROW_LIMIT,
+                 fetch_size: int = CONSOLE_FETCH_SIZE):
+        self.db = db
+        self.sql: str = sql
+        self.row_limit: int = row_limit
+        self.fetch_size: int = fetch_size
+        self.columns = []
+        self.rows: int = 0
+        self.steps: int = 0
+        self.started = None
+        self.finished = None
+        self.truncated: bool = False
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    def on_progress(self):
+        self.steps += CONSOLE_PROGRESS_STEPS
+        return self.cancelled.is_set()
+
+    def cancel(self):
+        self.cancelled.set()
+        with self.lock:
+            if self.connection is not None:
+                self.connection.interrupt()
+
+    def run(self, on_rows):
+        """Runs the query, committing any changes it made; returns False if it was cancelled"""
+        connection = self.db.connection
+        changes = connection.total_changes
+        connection.set_progress_handler(self.on_progress, CONSOLE_PROGRESS_STEPS)
+        with self.lock:
+            self.connection = connection
+        self.started = time.perf_counter()
+        try:
+            cursor = connection.execute(self.sql)
+            self.columns = [column[0] for column in cursor.description or ()]
+            while not self.cancelled.is_set() and self.rows < self.row_limit:
+                rows = cursor.fetchmany(min(self.fetch_size, self.row_limit - self.rows))
+                if not rows:
+                    break
+                self.rows += len(rows)
+                on_rows(rows)
+            else:
+                self.truncated = not self.cancelled.is_set() and cursor.fetchone() is not None
+            cursor.close()
+            if self.cancelled.is_set():
+                connection.rollback()
+            else:
+                connection.commit()
+        except sqlite3.OperationalError:
+            connection.rollback()
+            if not self.cancelled.is_set():
+                raise
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            self.finished = time.perf_counter()
+            with self.lock:
+                self.connection = None
+            connection.set_progress_handler(None, 0)
+            if connection.total_changes != changes:
+                self.db.invalidate_caches()
+        return not self.cancelled.is_set()
+
+
+class ConnectionManager:
+    """Hands out one SQLite connection per thread.
+
+    File databases use WAL journaling, so readers never block the writer or each
+    other, with synchronous=NORMAL, which is durable enough in WAL mode. An
+    in-memory database is a single connection shared by all threads.
+    """
+
+    def __init__(self, db_name: str, journal_mode: str = "WAL", synchronous: str = "NORMAL",
+                 cache_size: int = CACHE_SIZE, mmap_size: int = MMAP_SIZE, busy_timeout: float = BUSY_TIMEOUT,
+                 on_connect=None):
+        self.db_name: str = db_name
+        self.journal_mode: str = journal_mode
+        self.synchronous: str = synchronous
+        self.cache_size: int = cache_size
+        self.mmap_size: int = mmap_size
+        self.busy_timeout: float = busy_timeout
+        # Called with every new connection, e.g. to register SQL functions
+        self.on_connect = on_connect
+        self.local = threading.local()
+        self.connections = {}
+        self.lock = threading.Lock()
+        self.shared = self.connect(check_same_thread=False) if db_name == ":memory:" else None
+
+    def connect(self, check_same_thread: bool = True):
+        connection = sqlite3.connect(self.db_name, timeout=self.busy_timeout, check_same_thread=check_same_thread)
+        connection.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        connection.execute(f"PRAGMA synchronous = {self.synchronous}")
+        connection.execute(f"PRAGMA cache_size = -{int(self.cache_size)}")
+        connection.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        if self.on_connect is not None:
+            self.on_connect(connection)
+        return connection
+
+    def get(self):
+        """Returns the connection of the calling thread, opening it on first use"""
+        if self.shared is not None:
+            return self.shared
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = self.connect()
+            with self.lock:
+                self.connections[threading.get_ident()] = connection
+        return connection
+
+    def release(self):
+        """Commits and closes the connection of the calling thread, e.g. before a worker thread ends"""
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            with self.lock:
+                self.connections.pop(threading.get_ident(), None)
+            self.local.connection = None
+            connection.commit()
+            connection.close()
+
+    def close(self):
+        """Commits and closes the connection of the calling thread and any shared connection.
+
+        sqlite3 connections can only be closed by the thread that created them, so
+        worker threads have to release() their own connections.
+        """
+        self.release()
+        if self.shared is not None:
+            self.shared.commit()
+            self.shared.close()
+            self.shared = None
+
 
 class SnippetsDatabase:
     """Class for managing SQLite database"""
 
-    def __init__(self, db_name: str = "snippets.db"):
+    def __init__(self, db_name: str = "snippets.db", languages_url: str = LANGUAGES_URL,
+                 languages_ttl: float = LANGUAGES_TTL, execution_cache_size: int = EXECUTION_CACHE_SIZE,
+                 **connection_options):
         self.db_name: str = db_name
-        self.connection = sqlite3.connect(self.db_name)
-        self.cursor = self.connection.cursor()
+        self.languages_url: str = languages_url
+        self.languages_ttl: float = languages_ttl
+        self.execution_cache_size: int = execution_cache_size
+        # Execution cache lookups not written yet, as last use times by key and numbers of hits and misses
+        self.cache_usage = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_usage_lock = threading.Lock()
+        # Blob codecs by dictionary id, and (dictionary id, codec) new blobs are compressed with once known
+        self.blob_codecs = {None: BlobCodec()}
+        self.blob_dictionary = None
+        # Supported languages catalog as ({id: name}, {name: id}), loaded on first use
+        self.languages = None
+        # Rows of snippets_text and users by id, for the lookups every click repeats
+        self.snippet_rows = IdentityMap("snippets", SNIPPET_ROWS_CACHE_SIZE)
+        self.user_rows = IdentityMap("users", USER_ROWS_CACHE_SIZE)
+        # User ids by username, for the rows of user_rows
+        self.user_ids = {}
+        # Keyword arguments of ConnectionManager, e.g. cache_size or mmap_size
+        self.connections = ConnectionManager(db_name, on_connect=self.register_functions, **connection_options)
 
         self.current_user = None
 
         self.create_tables()
 
     def __enter__(self):
-        self.connection = sqlite3.connect(self.db_name)
-        self.cursor = self.connection.cursor()
-        self.create_tables()
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
-        self.connection.commit()
-        self.cursor.close()
-        self.connection.close()
+        self.close()
+
+    @property
+    def connection(self):
+        """The connection of the calling thread"""
+        return self.connections.get()
+
+    def register_functions(self, connection: sqlite3.Connection):
+        """Registers the SQL functions of the schema on a new connection"""
+        def blob_text(data, compression, dictionary_id):
+            if data is None:
+                return None
+            codec = self.blob_codecs.get(dictionary_id)
+            if codec is None:
+                dictionary = connection.execute("SELECT data FROM blob_dictionaries WHERE id = ?",
+                                                (dictionary_id,)).fetchone()[0]
+                codec = self.blob_codecs[dictionary_id] = BlobCodec(dictionary)
+            return codec.decompress(data, compression)
+
+        connection.create_function("blob_text", 3, blob_text, deterministic=True)
+
+    def close(self):
+        """Writes pending execution cache usage, then commits and closes the connection of the calling thread"""
+        self.write_cache_usage()
+        self.connections.close()
+
+    def get_total(self, name: str):
+        """Returns an analytics counter of stats_totals"""
+        self.execute_query("SELECT count FROM stats_totals WHERE name = ?", (name,))
+        return (self.fetch_one() or (0,))[0]
 
     def get_total_users(self):
         """Returns the total number of users"""
-        self.execute_query("SELECT COUNT(*) FROM users")
-        return self.fetch_one()[0]
+        return self.get_total("users")
 
     def get_total_snippets(self):
         """Returns the total number of snippets"""
-        self.execute_query("SELECT COUNT(*) FROM snippets")
-        return self.fetch_one()[0]
+        return self.get_total("snippets")
 
     def get_total_supported_languages(self):
         """Returns the total number of supported languages"""
-        self.execute_query("SELECT COUNT(*) FROM supported_languages")
-        return self.fetch_one()[0]
+        return len(self.get_language_catalog()[0])
 
 
     def get_snippets_count_by_language(self):
-        """Returns the count of snippets for each language"""
-        self.execute_query("SELECT language, COUNT(*) FROM snippets GROUP BY language")
-        return self.fetch_all()
+        """Returns the count of snippets for each language, by language name"""
+        self.execute_query("SELECT language_id, count FROM stats_by_language ORDER BY count DESC")
+        return [(self.get_language_name(language_id) or "#%d" % language_id if language_id else "", count)
+                for language_id, count in self.fetch_all()]
 
     def get_snippets_count_by_user(self):
-        """Returns the count of snippets for each user"""
-        self.execute_query("SELECT user_id, COUNT(*) FROM snippets GROUP BY user_id")
+        """Returns the count of snippets for each user, by username"""
+        self.execute_query("""SELECT coalesce(users.username, '#' || stats_by_user.user_id), stats_by_user.count
+            FROM stats_by_user LEFT JOIN users ON users.id = stats_by_user.user_id
+            ORDER BY stats_by_user.count DESC""")
         return self.fetch_all()
 
+    def get_analytics_snapshot(self):
+        """Returns all analytics counters, read in one transaction so they are consistent"""
+        self.connection.commit()
+        with self.connection:
+            self.execute_query("BEGIN")
+            self.execute_query("SELECT name, count FROM stats_totals")
+            totals = dict(self.fetch_all())
+            return {
+                "total_users": totals.get("users", 0),
+                "total_snippets": totals.get("snippets", 0),
+                "public_snippets": totals.get("public_snippets", 0),
+                "private_snippets": totals.get("private_snippets", 0),
+                "total_supported_languages": self.get_total_supported_languages(),
+                "snippets_by_language": self.get_snippets_count_by_language(),
+                "snippets_by_user": self.get_snippets_count_by_user(),
+            }
+
+    def check_analytics_consistency(self):
+        """Recomputes the analytics counters from scratch and compares them with the stored ones.
+
+        Returns a list of (table, key, stored count, actual count) for each difference.
+        """
+        differences = []
+        self.connection.commit()
+        with self.connection:
+            self.execute_query("BEGIN")
+            for table, query in ANALYTICS_QUERIES:
+                self.execute_query(query)
+                actual = {key: count for key, count in self.fetch_all() if count}
+                self.execute_query(f"SELECT * FROM {table}")
+                stored = {key: count for key, count in self.fetch_all() if count}
+                for key in sorted(actual.keys() | stored.keys(), key=str):
+                    if actual.get(key, 0) != stored.get(key, 0):
+                        differences.append((table, key, stored.get(key, 0), actual.get(key, 0)))
+        return differences
+
+    def rebuild_analytics(self):
+        """Recomputes all analytics counters from scratch"""
+        with self.connection:
+            for table, query in ANALYTICS_QUERIES:
+                self.execute_query(f"DELETE FROM {table}")
+                self.execute_query(f"INSERT INTO {table} {query}")
+
 
     def execute_query(self, query, params=None):
-        """Executes a query with optional parameters"""
-        if params:
-            self.cursor.execute(query, params)
-        else:
-            self.cursor.execute(query)
+        """Executes a query with optional parameters on a new cursor and returns the cursor"""
+        if metrics.enabled:
+            return self.execute_query_measured(query, params)
+        cursor = self.connection.execute(query, params or ())
+        self.connections.local.cursor = cursor
+        return cursor
+
+    def execute_query_measured(self, query, params=None):
+        """execute_query() recording the latency of the query under its template"""
+        template = query_template(query)
+        start = time.perf_counter()
+        try:
+            cursor = self.connection.execute(query, params or ())
+        finally:
+            metrics.observe("snippets_db_query_seconds", (("query", template),), time.perf_counter() - start)
+        self.connections.local.cursor = cursor
+        self.connections.local.query_template = template
+        return cursor
 
     def run_and_get_output(self, query, params=None):
         """Executes a query and returns the output"""
@@ -67,12 +853,24 @@ class SnippetsDatabase:
         return self.fetch_all()
 
     def fetch_all(self):
-        """Fetches all results from the last executed query"""
-        return self.cursor.fetchall()
+        """Fetches all results from the last query executed by the calling thread"""
+        rows = self.connections.local.cursor.fetchall()
+        if metrics.enabled:
+            self.count_rows(len(rows))
+        return rows
 
     def fetch_one(self):
-        """Fetches one result from the last executed query"""
-        return self.cursor.fetchone()
+        """Fetches one result from the last query executed by the calling thread"""
+        row = self.connections.local.cursor.fetchone()
+        if metrics.enabled and row is not None:
+            self.count_rows(1)
+        return row
+
+    def count_rows(self, rows: int):
+        """Adds fetched rows to the metrics of the last query template of the calling thread"""
+        template = getattr(self.connections.local, "query_template", None)
+        if template is not None:
+            metrics.increment("snippets_db_rows_total", (("query", template),), rows)
 
     def create_users_table(self):
         """Creates the users table"""
@@ -90,60 +888,142 @@ class SnippetsDatabase:
 
     def create_snippets_table(self):
         """Creates the snippets table"""
-        self.execute_query("""CREATE TABLE IF NOT EXISTS "snippets" (
-            "id"	INTEGER,
-            "name"	TEXT,
-            "language"	TEXT,
-            "code"	TEXT,
-            "example_code"	TEXT,
-            "stdin"	TEXT,
-            "expected_output"	TEXT,
-            "is_private"	INTEGER,
-            "user_id"	INTEGER NOT NULL,
-            PRIMARY KEY("id")
-        )""")
+        self.execute_query(SNIPPETS_TABLE)
 
     def create_supported_languages_table(self):
-        """Creates the supported_languages table"""
+        """Creates the supported_languages table and its fetch metadata table.
+
+        The catalog is not fetched here: it persists between runs and is refreshed
+        with update_supported_languages() once it is older than languages_ttl.
+        """
         self.execute_query("""CREATE TABLE IF NOT EXISTS "supported_languages" (
             "id"	INTEGER NOT NULL UNIQUE,
             "name"	TEXT NOT NULL
         )""")
-        self.update_supported_languages()
+        self.execute_query("""CREATE TABLE IF NOT EXISTS "supported_languages_meta" (
+            "id"	INTEGER NOT NULL UNIQUE CHECK ("id" = 1),
+            "fetched_at"	REAL,
+            "etag"	TEXT
+        )""")
+        self.connection.commit()
 
     def is_admin(self, user_id: int):
         """Checks if the user is an administrator"""
-        self.execute_query("SELECT access_code FROM users WHERE id = ?", (user_id,))
-        return self.fetch_one()[0] == 2
+        return self.get_user(user_id)[3] == 2
         
     def create_tables(self):
         """Creates all tables"""
         self.create_users_table()
         self.create_snippets_table()
         self.create_supported_languages_table()
+        self.migrate()
+
+    def get_schema_version(self):
+        """Returns the number of applied schema migrations"""
+        self.execute_query("PRAGMA user_version")
+        return self.fetch_one()[0]
+
+    def migrate(self):
+        """Applies pending schema migrations, each one in its own transaction"""
+        current_version = self.get_schema_version()
+        for version, migration in enumerate(MIGRATIONS[current_version:], start=current_version + 1):
+            self.connection.commit()
+            self.execute_query("BEGIN")
+            try:
+                if callable(migration):
+                    migration(self)
+                else:
+                    for statement in migration:
+                        self.execute_query(statement)
+                self.execute_query(f"PRAGMA user_version = {version}")
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+
+    def rebuild_table(self, table: str, columns: str):
+        """Replaces a table by one with the column definitions columns, copying the columns both have.
+
+        Drops columns the way the SQLite documentation describes for versions without
+        ALTER TABLE DROP COLUMN (3.35): create the new table, copy the rows, drop the
+        old table and rename the new one. Indexes and triggers of the table are
+        recreated, so the caller has to drop those using a dropped column first, as
+        well as views using the table. Runs inside the caller's transaction.
+        """
+        self.execute_query("SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND tbl_name = ? "
+                           "AND sql IS NOT NULL", (table,))
+        statements = [sql for sql, in self.fetch_all()]
+        self.execute_query(f'PRAGMA table_info("{table}")')
+        old_columns = {row[1] for row in self.fetch_all()}
+        self.execute_query(f'CREATE TABLE "new_{table}" ({columns})')
+        self.execute_query(f'PRAGMA table_info("new_{table}")')
+        copied = ", ".join(f'"{row[1]}"' for row in self.fetch_all() if row[1] in old_columns)
+        self.execute_query(f'INSERT INTO "new_{table}" ({copied}) SELECT {copied} FROM "{table}"')
+        self.execute_query(f'DROP TABLE "{table}"')
+        self.execute_query(f'ALTER TABLE "new_{table}" RENAME TO "{table}"')
+        for statement in statements:
+            self.execute_query(statement)
+
+    def explain_query_plan(self, query, params=None):
+        """Returns the details of EXPLAIN QUERY PLAN for a query"""
+        self.execute_query("EXPLAIN QUERY PLAN " + query, params)
+        return [row[3] for row in self.fetch_all()]
 
     def add_user(self, username: str, password: str, access_code: int = 1):
         """Adds a user to the users table"""
         self.execute_query("INSERT INTO users VALUES (NULL, ?, ?, ?)", (username, password, access_code))
         self.connection.commit()
+        self.user_ids.pop(username, None)
+
+    def add_users(self, users, batch_size: int = IMPORT_BATCH_SIZE):
+        """Adds users from an iterable of (username, password, access_code), batch_size per transaction.
+
+        Returns the number of users added.
+        """
+        users = iter(users)
+        added = 0
+        while batch := list(itertools.islice(users, batch_size)):
+            with self.connection:
+                self.connection.executemany("INSERT INTO users VALUES (NULL, ?, ?, ?)", batch)
+            for username, *_ in batch:
+                self.user_ids.pop(username, None)
+            added += len(batch)
+        return added
 
-    def add_snippet(self, name: str, language: str, code: str, example_code: str, stdin: str,
-                    expected_output: str, is_private: bool):
-        """Adds a snippet to the snippets table"""
-        if self.current_user > 0:
-            self.execute_query("INSERT INTO snippets VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?)",
-                               (name, language, code, example_code, stdin, expected_output, is_private, self.current_user))
+    def add_snippet(self, name: str, language, code: str, example_code: str, stdin: str,
+                    expected_output: str, is_private: bool, user_id: int = None):
+        """Adds a snippet owned by user_id, by default the current user, and returns its id.
+
+        language is resolved with get_language_id().
+        """
+        user_id = self.current_user if user_id is None else user_id
+        if user_id and user_id > 0:
+            cursor = self.execute_query(INSERT_SNIPPET, (name, self.get_language_id(language), self.store_blob(code), self.store_blob(example_code),
+                                                         stdin, expected_output, is_private, user_id))
+            self.index_snippets([(cursor.lastrowid, code)])
             self.connection.commit()
+            # The id of a deleted snippet can be reused
+            self.snippet_rows.discard(cursor.lastrowid)
+            return cursor.lastrowid
         else:
             raise Exception("Anonymous users cannot add snippets")
     
     def edit_snippet(self, snippet_id, name=None, language=None, code=None, example_code=None, stdin=None,
-                    expected_output=None, is_private=None):
-        """Edits a snippet in the snippets table"""
-        if self.current_user > 0:
-            self.execute_query("UPDATE snippets SET name = ?, language = ?, code = ?, example_code = ?, stdin = ?, expected_output = ?, is_private = ? WHERE id = ?",
-                               (name, language, code, example_code, stdin, expected_output, is_private, snippet_id))
+                    expected_output=None, is_private=None, user_id: int = None):
+        """Edits a snippet in the snippets table on behalf of user_id, by default the current user.
+
+        The new version is added to the snippet's revision history.
+        """
+        user_id = self.current_user if user_id is None else user_id
+        if user_id and user_id > 0:
+            old = self.load_snippet(snippet_id)
+            self.execute_query("UPDATE snippets SET name = ?, language_id = ?, code_blob_id = ?, example_code_blob_id = ?, stdin = ?, expected_output = ?, is_private = ? WHERE id = ?",
+                               (name, self.get_language_id(language), self.store_blob(code), self.store_blob(example_code), stdin,
+                                expected_output, is_private, snippet_id))
+            self.record_revision(snippet_id, old, user_id)
+            self.index_snippets([(snippet_id, code)])
             self.connection.commit()
+            self.snippet_rows.discard(snippet_id)
         else:
             raise Exception("Anonymous users cannot edit snippets")
 
@@ -155,49 +1035,289 @@ class SnippetsDatabase:
     def get_snippets(self, user_id: int = 0):
         """Returns all snippets from the snippets table"""
         if user_id > 0:
-            self.execute_query("SELECT * FROM snippets WHERE user_id = ? OR is_private = 0", (user_id,))
+            # Two index lookups instead of "user_id = ? OR is_private = 0", which scans the table
+            self.execute_query("""SELECT * FROM snippets_text WHERE user_id = ?
+                UNION ALL
+                SELECT * FROM snippets_text WHERE is_private = 0 AND user_id != ?
+                ORDER BY id""", (user_id, user_id))
+        else:
+            self.execute_query("SELECT * FROM snippets_text WHERE is_private = 0 ORDER BY id")
+        return self.fetch_all()
+
+    def get_snippets_by_user(self, user_id: int):
+        """Returns all snippets owned by a user"""
+        self.execute_query("SELECT * FROM snippets_text WHERE user_id = ? ORDER BY id", (user_id,))
+        return self.fetch_all()
+
+    def get_snippets_page(self, user_id: int = 0, after_id: int = 0, limit: int = SNIPPET_PAGE_SIZE,
+                          before_id: int = None):
+        """Returns a page of (id, name, language id, code preview) rows visible to a user, ordered by id.
+
+        Pages are keyset paginated: pass the last id of the previous page as after_id,
+        or the first id of the next page as before_id to go backwards.
+        """
+        # The preview comes from the blob's uncompressed prefix rather than the snippets_text view
+        columns = "s.id AS id, s.name, s.language_id, substr(b.preview, 1, 10)"
+        snippets = "snippets s LEFT JOIN blobs b ON b.id = s.code_blob_id"
+        if before_id is None:
+            condition, order, key = "s.id > ?", "ASC", after_id
+        else:
+            condition, order, key = "s.id < ?", "DESC", before_id
+        if user_id > 0:
+            self.execute_query(f"""SELECT * FROM (
+                    SELECT {columns} FROM {snippets} WHERE s.user_id = ? AND {condition} ORDER BY s.id {order} LIMIT ?)
+                UNION ALL
+                SELECT * FROM (
+                    SELECT {columns} FROM {snippets} WHERE s.is_private = 0 AND s.user_id != ? AND {condition}
+                    ORDER BY s.id {order} LIMIT ?)
+                ORDER BY id {order} LIMIT ?""", (user_id, key, limit, user_id, key, limit, limit))
         else:
-            self.execute_query("SELECT * FROM snippets WHERE is_private = 0")
+            self.execute_query(f"SELECT {columns} FROM {snippets} WHERE s.is_private = 0 AND {condition} "
+                               f"ORDER BY s.id {order} LIMIT ?", (key, limit))
+        rows = self.fetch_all()
+        return rows if before_id is None else rows[::-1]
+
+    def search_snippets(self, query: str, user_id: int = 0, limit: int = 50, offset: int = 0,
+                        max_candidates: int = SEARCH_MAX_CANDIDATES):
+        """Returns (id, name, language id, highlighted fragment) of snippets matching a full-text query.
+
+        Results are ranked by bm25 and respect the same privacy rule as get_snippets().
+        Matched words are wrapped in [ and ] in the fragment. Only the max_candidates
+        newest matches the user can see are ranked, which bounds the cost of very
+        broad queries.
+        """
+        match = build_search_query(query)
+        if match is None:
+            return []
+        self.execute_query("""SELECT s.id, s.name, s.language_id, snippet(snippets_fts, -1, '[', ']', '...', 8)
+            FROM snippets_fts JOIN snippets s ON s.id = snippets_fts.rowid
+            WHERE snippets_fts MATCH :match AND (s.user_id = :user_id OR s.is_private = 0)
+                AND snippets_fts.rowid >= coalesce((
+                    SELECT snippets_fts.rowid FROM snippets_fts JOIN snippets v ON v.id = snippets_fts.rowid
+                    WHERE snippets_fts MATCH :match AND (v.user_id = :user_id OR v.is_private = 0)
+                    ORDER BY snippets_fts.rowid DESC LIMIT 1 OFFSET :candidates), 0)
+            ORDER BY snippets_fts.rank LIMIT :limit OFFSET :offset""",
+                           {"match": match, "user_id": user_id, "candidates": max_candidates - 1,
+                            "limit": limit, "offset": offset})
         return self.fetch_all()
 
     def get_snippet(self, snippet_id: int):
-        """Returns a snippet from the snippets table by id"""
-        self.execute_query("SELECT * FROM snippets WHERE id = ?", (snippet_id,))
+        """Returns a snippet from the snippets table by id, from snippet_rows if it is there"""
+        return self.snippet_rows.get(snippet_id, self.load_snippet)
+
+    def load_snippet(self, snippet_id: int):
+        self.execute_query("SELECT * FROM snippets_text WHERE id = ?", (snippet_id,))
         return self.fetch_one()
 
-    def update_snippet(self, snippet_id: int, name: str, language: str, code: str):
-        """Updates a snippet in the snippets table"""
-        self.execute_query("UPDATE snippets SET name = ?, language = ?, code = ? WHERE id = ?",
-                           (name, language, code, snippet_id))
+    def update_snippet(self, snippet_id: int, name: str, language, code: str):
+        """Updates a snippet in the snippets table, adding the new version to its revision history"""
+        old = self.load_snippet(snippet_id)
+        self.execute_query("UPDATE snippets SET name = ?, language_id = ?, code_blob_id = ? WHERE id = ?",
+                           (name, self.get_language_id(language), self.store_blob(code), snippet_id))
+        self.record_revision(snippet_id, old, self.current_user)
+        self.index_snippets([(snippet_id, code)])
         self.connection.commit()
+        self.snippet_rows.discard(snippet_id)
+
+    def record_revision(self, snippet_id: int, old, user_id: int = None):
+        """Adds the current version of a snippet to its history after an edit from old, its snippets_text row before.
+
+        Called in the transaction of the edit. The first edit of a snippet also adds
+        old as a snapshot, and so does an edit of a snippet changed without recording
+        a revision (e.g. from the SQL console), as the last delta does not lead to old.
+        """
+        new = self.load_snippet(snippet_id)
+        if old is None or new is None or new[1:8] == old[1:8]:
+            return
+        self.execute_query("SELECT revision, content_hash FROM snippet_revisions WHERE snippet_id = ? "
+                           "ORDER BY revision DESC LIMIT 1", (snippet_id,))
+        revision, latest_hash = self.fetch_one() or (0, None)
+        if latest_hash != content_hash(old[3], old[4]):
+            revision += 1
+            self.insert_revision(revision, old, None, None, None)
+        self.insert_revision(revision + 1, new, old, user_id, time.time())
+
+    def insert_revision(self, revision: int, row, previous, user_id, created_at):
+        """Stores a snippets_text row as a revision: a delta from previous, the row of the revision
+        before, or a snapshot if there is none or the revision number is due for one"""
+        code, example_code = row[3], row[4]
+        is_snapshot = previous is None or (revision - 1) % REVISION_SNAPSHOT_INTERVAL == 0
+        if is_snapshot:
+            blobs, deltas = (self.store_blob(code), self.store_blob(example_code)), (None, None)
+        else:
+            blobs = (None, None)
+            deltas = (None if code is None else make_delta(previous[3], code),
+                      None if example_code is None else make_delta(previous[4], example_code))
+        self.execute_query("INSERT INTO snippet_revisions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (row[0], revision, created_at, user_id, is_snapshot, content_hash(code, example_code),
+                            row[1], row[2], row[5], row[6], row[7], *blobs, *deltas))
+
+    def list_revisions(self, snippet_id: int):
+        """Returns (revision, created_at, user_id, name, is_snapshot) of the revisions of a snippet, newest first"""
+        self.execute_query("""SELECT revision, created_at, user_id, name, is_snapshot FROM snippet_revisions
+            WHERE snippet_id = ? ORDER BY revision DESC""", (snippet_id,))
+        return self.fetch_all()
+
+    def get_revision(self, snippet_id: int, revision: int):
+        """Returns a revision of a snippet as a tuple of REVISION_FIELDS, or None.
+
+        Starts from the nearest snapshot at or before the revision, so at most
+        REVISION_SNAPSHOT_INTERVAL - 1 deltas are applied whatever the length of the history.
+        """
+        self.execute_query("""SELECT r.revision, r.created_at, r.user_id, r.name, r.language_id, r.is_snapshot,
+                blob_text(c.data, c.compression, c.dictionary_id), blob_text(e.data, e.compression, e.dictionary_id),
+                r.code_delta, r.example_code_delta, r.stdin, r.expected_output, r.is_private
+            FROM snippet_revisions r
+            LEFT JOIN blobs c ON c.id = r.code_blob_id
+            LEFT JOIN blobs e ON e.id = r.example_code_blob_id
+            WHERE r.snippet_id = :snippet_id AND r.revision <= :revision AND r.revision >= (
+                SELECT max(revision) FROM snippet_revisions
+                WHERE snippet_id = :snippet_id AND revision <= :revision AND is_snapshot)
+            ORDER BY r.revision""", {"snippet_id": snippet_id, "revision": revision})
+        rows = self.fetch_all()
+        if not rows or rows[-1][0] != revision:
+            return None
+        code = example_code = None
+        for _, _, _, _, _, is_snapshot, snapshot_code, snapshot_example_code, code_delta, example_code_delta, *_ in rows:
+            if is_snapshot:
+                code, example_code = snapshot_code, snapshot_example_code
+            else:
+                code = None if code_delta is None else apply_delta(code, code_delta)
+                example_code = None if example_code_delta is None else apply_delta(example_code, example_code_delta)
+        _, created_at, user_id, name, language_id, *_, stdin, expected_output, is_private = rows[-1]
+        return (snippet_id, revision, created_at, user_id, name, language_id, code, example_code, stdin,
+                expected_output, is_private)
+
+    def index_snippets(self, rows):
+        """Replaces the near-duplicate index entries of (snippet id, code) rows, in the caller's transaction"""
+        ids, signatures, bands = [], [], []
+        for snippet_id, code in rows:
+            ids.append((snippet_id,))
+            signature = minhash(code)
+            if signature is not None:
+                signatures.append((snippet_id, signature.tobytes()))
+                bands += [(band, bucket, snippet_id) for band, bucket in band_buckets(signature)]
+        self.connection.executemany("DELETE FROM snippet_lsh_bands WHERE snippet_id = ?", ids)
+        self.connection.executemany("DELETE FROM snippet_signatures WHERE snippet_id = ?", ids)
+        self.connection.executemany("INSERT INTO snippet_signatures VALUES (?, ?)", signatures)
+        # In key order, each insert lands next to the one before in the band index
+        bands.sort()
+        self.connection.executemany("INSERT INTO snippet_lsh_bands VALUES (?, ?, ?)", bands)
+
+    def create_similarity_index(self, batch_size: int = IMPORT_BATCH_SIZE):
+        """Creates the near-duplicate index and indexes the code of all snippets.
+
+        Schema migration 9, run inside the migration transaction. Can also be called
+        after dropping the tables, to rebuild an index gone stale after snippets were
+        changed from the SQL console.
+        """
+        for statement in SIMILARITY_SCHEMA:
+            self.execute_query(statement)
+        last_id = 0
+        while True:
+            self.execute_query("SELECT id, code FROM snippets_text WHERE id > ? ORDER BY id LIMIT ?",
+                               (last_id, batch_size))
+            rows = self.fetch_all()
+            if not rows:
+                break
+            self.index_snippets(rows)
+            last_id = rows[-1][0]
+
+    def find_similar_snippets(self, code: str, user_id: int = 0, exclude_id: int = None,
+                              threshold: float = SIMILARITY_THRESHOLD, limit: int = 10):
+        """Returns (id, name, language id, similarity) of near duplicates of code visible to a user, most similar first.
+
+        Only snippets sharing an LSH bucket with code are compared, at most
+        SIMILARITY_MAX_CANDIDATES of them, so the cost of a lookup does not grow with
+        the number of snippets. Similarity is the Jaccard similarity of the code
+        shingles estimated from the MinHash signatures.
+        """
+        signature = minhash(code)
+        if signature is None:
+            return []
+        buckets = band_buckets(signature)
+        candidates = " UNION ".join(["SELECT snippet_id FROM snippet_lsh_bands WHERE band = ? AND bucket = ?"] *
+                                    len(buckets))
+        self.execute_query(f"""SELECT s.id, s.name, s.language_id, g.signature
+            FROM ({candidates} LIMIT ?) c
+            JOIN snippet_signatures g ON g.snippet_id = c.snippet_id
+            JOIN snippets s ON s.id = c.snippet_id
+            WHERE (s.user_id = ? OR s.is_private = 0) AND s.id IS NOT ?""",
+                           [key for bucket in buckets for key in bucket] + [SIMILARITY_MAX_CANDIDATES, user_id,
+                                                                            exclude_id])
+        similar = []
+        for snippet_id, name, language_id, data in self.fetch_all():
+            similarity = estimate_similarity(signature, load_signature(data))
+            if similarity >= threshold:
+                similar.append((snippet_id, name, language_id, similarity))
+        similar.sort(key=lambda row: (-row[3], row[0]))
+        return similar[:limit]
+
+    def get_similar_snippets(self, snippet_id: int, user_id: int = 0, limit: int = 10):
+        """Returns the near duplicates of a snippet visible to a user, as find_similar_snippets() does"""
+        snippet = self.get_snippet(snippet_id)
+        if snippet is None:
+            return []
+        return self.find_similar_snippets(snippet[3], user_id, snippet_id, limit=limit)
 
     def delete_snippet(self, snippet_id: int):
         """Deletes a snippet from the snippets table"""
         self.execute_query("DELETE FROM snippets WHERE id = ?", (snippet_id,))
         self.connection.commit()
+        self.snippet_rows.discard(snippet_id)
 
     def get_user(self, user_id: int):
-        """Returns a user from the users table by id"""
+        """Returns a user from the users table by id, from user_rows if it is there"""
+        return self.user_rows.get(user_id, self.load_user)
+
+    def load_user(self, user_id: int):
         self.execute_query("SELECT * FROM users WHERE id = ?", (user_id,))
         return self.fetch_one()
 
     def get_user_by_username(self, username: str):
         """Returns a user from the users table by username"""
+        user_id = self.user_ids.get(username)
+        if user_id is not None:
+            user = self.get_user(user_id)
+            if user is not None and user[1] == username:
+                return user
         self.execute_query("SELECT * FROM users WHERE username = ?", (username,))
-        return self.fetch_one()
+        user = self.fetch_one()
+        if user is not None:
+            self.user_rows.put(user[0], user)
+            self.user_ids[username] = user[0]
+        return user
+
+    def invalidate_caches(self):
+        """Forgets all rows and the languages catalog kept in memory, e.g. after arbitrary SQL changed the tables"""
+        self.snippet_rows.clear()
+        self.user_rows.clear()
+        self.user_ids.clear()
+        self.languages = None
+
+    def get_cache_stats(self):
+        """Returns (hits, misses, hit rate) of the row identity maps, by name"""
+        return {rows.name: rows.stats() for rows in (self.snippet_rows, self.user_rows)}
+
+    def authenticate(self, username: str, password: str):
+        """Returns the id of the user with these credentials, or None"""
+        user = self.get_user_by_username(username)
+        return user[0] if user and user[2] == password else None
 
     def login(self, username: str, password: str):
         """Authorizes a user"""
-        user = self.get_user_by_username(username)
-        if user and user[2] == password:
-            self.current_user = user[0]
+        user_id = self.authenticate(username, password)
+        if user_id is not None:
+            self.current_user = user_id
             return True
         else:
             return False
 
     def logout(self):
-        """Deauthorizes a user"""
+        """Deauthorizes a user and forgets the cached user rows of the session"""
         self.current_user = 0
+        self.user_rows.clear()
+        self.user_ids.clear()
 
     def register(self, username: str, password: str):
         """Registers a user"""
@@ -207,40 +1327,465 @@ class SnippetsDatabase:
             self.add_user(username, password)
             return True
 
-    def update_supported_languages(self):
-        """Updates the supported_languages table with languages from Judge0 API"""
-        self.execute_query("DELETE FROM supported_languages")
-        response = requests.get('https://ce.judge0.com/languages/', timeout=5)
+    def get_supported_languages_meta(self):
+        """Returns (fetched_at, etag) of the stored supported languages catalog"""
+        self.execute_query("SELECT fetched_at, etag FROM supported_languages_meta WHERE id = 1")
+        return self.fetch_one() or (None, None)
+
+    def supported_languages_expired(self):
+        """Checks if the stored supported languages catalog is missing or older than languages_ttl"""
+        fetched_at, _ = self.get_supported_languages_meta()
+        return fetched_at is None or time.time() - fetched_at > self.languages_ttl
+
+    def fetch_supported_languages(self, etag: str = None):
+        """Fetches supported languages from Judge0 API.
+
+        Returns (languages, etag); languages is None if the server answered 304 Not Modified.
+        """
+        # requests takes longer to import than the rest of the app, so it is imported on first use
+        import requests
+
+        headers = {"If-None-Match": etag} if etag else {}
+        response = requests.get(self.languages_url, headers=headers, timeout=5)
+        if response.status_code == 304:
+            return None, etag
         response.raise_for_status()
-        languages = response.json()
-        for language in languages:
-            self.execute_query("INSERT INTO supported_languages VALUES (?, ?)",
-                               (language['id'], language['name']))
-        self.connection.commit()
+        return response.json(), response.headers.get("ETag")
+
+    def update_supported_languages(self, force: bool = False):
+        """Updates the supported_languages table with languages from Judge0 API.
+
+        Does nothing while the stored catalog is fresh, unless force is set.
+        The new catalog is upserted in a single transaction, so readers never
+        see an empty or half-filled table. Returns True if the catalog was checked.
+        """
+        if not force and not self.supported_languages_expired():
+            return False
+        _, etag = self.get_supported_languages_meta()
+        languages, etag = self.fetch_supported_languages(etag)
+        with self.connection:
+            if languages is not None:
+                self.execute_query("SELECT id, name FROM supported_languages")
+                previous = dict(self.fetch_all())
+                self.connection.executemany(
+                    "INSERT INTO supported_languages VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET name = excluded.name",
+                    [(language['id'], language['name']) for language in languages])
+                self.execute_query("DELETE FROM supported_languages WHERE id NOT IN (SELECT value FROM json_each(?))",
+                                   (json.dumps([language['id'] for language in languages]),))
+                catalog = {language['id']: language['name'] for language in languages}
+                renamed = [language_id for language_id in previous.keys() | catalog.keys()
+                           if previous.get(language_id) != catalog.get(language_id)]
+                # The full-text index holds language names, and removing a snippet from it takes the indexed values
+                self.execute_query("SELECT EXISTS (SELECT 1 FROM snippets WHERE language_id IN "
+                                   "(SELECT value FROM json_each(?)))", (json.dumps(renamed),))
+                if self.fetch_one()[0]:
+                    self.execute_query("INSERT INTO snippets_fts(snippets_fts) VALUES ('rebuild')")
+            self.execute_query("INSERT INTO supported_languages_meta VALUES (1, ?, ?) "
+                               "ON CONFLICT(id) DO UPDATE SET fetched_at = excluded.fetched_at, etag = excluded.etag",
+                               (time.time(), etag))
+        if languages is not None:
+            self.languages = None
+        return True
+
+    def get_language_catalog(self):
+        """Returns the supported languages as ({id: name}, {name: id}).
+
+        The catalog is read once and kept in memory until update_supported_languages()
+        changes it, so showing or resolving languages never queries the database.
+        """
+        languages = self.languages
+        if languages is None:
+            self.execute_query("SELECT id, name FROM supported_languages ORDER BY id")
+            names = dict(self.fetch_all())
+            languages = self.languages = (names, {name: language_id for language_id, name in names.items()})
+        return languages
 
     def get_supported_languages(self):
-        """Returns all supported programming languages"""
-        self.execute_query("SELECT * FROM supported_languages")
-        return self.fetch_all()
+        """Returns all supported programming languages as (id, name), ordered by id"""
+        return list(self.get_language_catalog()[0].items())
 
     def get_supported_language(self, language_id: int):
         """Returns a supported programming language by id"""
-        self.execute_query("SELECT * FROM supported_languages WHERE id = ?", (language_id,))
-        return self.fetch_one()
+        name = self.get_language_name(language_id)
+        return None if name is None else (language_id, name)
+
+    def get_language_name(self, language_id):
+        """Returns the name of a language id, or None if the catalog does not have it"""
+        return self.get_language_catalog()[0].get(language_id)
+
+    def get_language_id(self, language):
+        """Returns the language id of a language id, name or combobox value like "71 {Python (3.8.1)}", or None"""
+        if language is None or isinstance(language, int):
+            return language
+        language_id = self.get_language_catalog()[1].get(language.strip())
+        return language_id if language_id is not None else parse_language_id(language)
+
+    def normalize_languages(self):
+        """Replaces the free text language column of snippets by language_id.
+
+        Schema migration 7, run inside the migration transaction. Language values are
+        parsed with parse_language_id(), or looked up by name in the catalog; snippets
+        whose language is neither get no language id. The full-text index, views and
+        triggers referencing the old column are recreated on top of language_id.
+        """
+        for statement in ('DROP TRIGGER "snippets_content_insert"', 'DROP TRIGGER "snippets_content_delete"',
+                          'DROP TRIGGER "snippets_content_update"', 'DROP TRIGGER "stats_snippets_insert"',
+                          'DROP TRIGGER "stats_snippets_delete"', 'DROP TRIGGER "stats_snippets_update"',
+                          'DROP TABLE "snippets_fts"', 'DROP VIEW "snippets_text"', 'DROP TABLE "stats_by_language"',
+                          'ALTER TABLE "snippets" ADD COLUMN "language_id" INTEGER '
+                          'REFERENCES "supported_languages" ("id")'):
+            self.execute_query(statement)
+        self.execute_query("SELECT DISTINCT language FROM snippets WHERE language IS NOT NULL")
+        languages = [language for language, in self.fetch_all()]
+        self.connection.executemany("UPDATE snippets SET language_id = ? WHERE language = ?",
+                                    [(self.get_language_id(str(language)), language) for language in languages])
+        self.execute_query('DROP INDEX IF EXISTS "idx_snippets_language"')
+        # Without language
+        self.rebuild_table("snippets", """
+            "id"	INTEGER,
+            "name"	TEXT,
+            "stdin"	TEXT,
+            "expected_output"	TEXT,
+            "is_private"	INTEGER,
+            "user_id"	INTEGER NOT NULL,
+            "code_blob_id"	INTEGER REFERENCES "blobs" ("id"),
+            "example_code_blob_id"	INTEGER REFERENCES "blobs" ("id"),
+            "language_id"	INTEGER REFERENCES "supported_languages" ("id"),
+            PRIMARY KEY("id")
+        """)
+        for statement in LANGUAGE_SCHEMA:
+            self.execute_query(statement)
     
     
+    def get_cached_result(self, key: str):
+        """Returns a cached execution result by key, or None, and counts the hit or miss.
+
+        The hit or miss and the last use time are kept in memory and written with the
+        next cache_result(), or every EXECUTION_CACHE_USAGE_BATCH lookups, so lookups
+        do not take the write lock.
+        """
+        self.execute_query("SELECT result FROM execution_cache WHERE key = ?", (key,))
+        row = self.fetch_one()
+        with self.cache_usage_lock:
+            if row:
+                self.cache_hits += 1
+                self.cache_usage[key] = time.time()
+            else:
+                self.cache_misses += 1
+            due = self.cache_hits + self.cache_misses >= EXECUTION_CACHE_USAGE_BATCH
+        if due:
+            self.write_cache_usage()
+        return row[0] if row else None
+
+    def write_cache_usage(self):
+        """Writes the hits, misses and last use times of the execution cache lookups counted in memory"""
+        with self.cache_usage_lock:
+            usage, hits, misses = self.cache_usage, self.cache_hits, self.cache_misses
+            self.cache_usage, self.cache_hits, self.cache_misses = {}, 0, 0
+        if not (usage or hits or misses):
+            return
+        self.connection.executemany("UPDATE execution_cache SET last_used_at = max(last_used_at, ?) WHERE key = ?",
+                                    [(used_at, key) for key, used_at in usage.items()])
+        self.execute_query("UPDATE execution_cache_stats SET hits = hits + ?, misses = misses + ?", (hits, misses))
+        self.connection.commit()
+
+    def cache_result(self, key: str, result: str):
+        """Stores an execution result, evicting the least recently used ones over execution_cache_size"""
+        # Eviction goes by last use, so the uses counted in memory are written first
+        self.write_cache_usage()
+        now = time.time()
+        self.execute_query("INSERT OR REPLACE INTO execution_cache VALUES (?, ?, ?, ?, ?)",
+                           (key, result, len(result.encode()), now, now))
+        self.execute_query("""DELETE FROM execution_cache WHERE key IN (
+            SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_used_at DESC, key) AS total
+                             FROM execution_cache)
+            WHERE total > ?)""", (self.execution_cache_size,))
+        self.connection.commit()
+
+    def get_execution_cache_stats(self):
+        """Returns (hits, misses, entries, total size) of the execution result cache"""
+        self.execute_query("""SELECT hits, misses, (SELECT COUNT(*) FROM execution_cache),
+            (SELECT COALESCE(SUM(size), 0) FROM execution_cache) FROM execution_cache_stats""")
+        hits, misses, entries, size = self.fetch_one()
+        with self.cache_usage_lock:
+            return hits + self.cache_hits, misses + self.cache_misses, entries, size
+
+    def clear_execution_cache(self):
+        """Removes all cached execution results"""
+        with self.cache_usage_lock:
+            self.cache_usage.clear()
+        self.execute_query("DELETE FROM execution_cache")
+        self.connection.commit()
+
+    def get_blob_dictionary(self):
+        """Returns (id, codec) of the newest blob compression dictionary; the id is None if there is none"""
+        if self.blob_dictionary is None:
+            self.execute_query("SELECT id, data FROM blob_dictionaries ORDER BY id DESC LIMIT 1")
+            row = self.fetch_one()
+            if row is None:
+                self.blob_dictionary = (None, self.blob_codecs[None])
+            else:
+                self.blob_codecs.setdefault(row[0], BlobCodec(row[1]))
+                self.blob_dictionary = (row[0], self.blob_codecs[row[0]])
+        return self.blob_dictionary
+
+    def store_blob(self, text: str):
+        """Stores a text in the blob store unless it is there already and returns the blob id.
+
+        The blob is compressed with the newest dictionary. Its reference count is
+        maintained by the snippets and snippet_revisions triggers, so the caller has to
+        reference it from a snippet or revision in the same transaction. Returns None for None.
+        """
+        if text is None:
+            return None
+        key = blob_hash(text)
+        self.execute_query("SELECT id FROM blobs WHERE hash = ?", (key,))
+        row = self.fetch_one()
+        if row is not None:
+            return row[0]
+        dictionary_id, codec = self.get_blob_dictionary()
+        data, compression = codec.compress(text)
+        # Another connection may have stored the same text since the lookup, in which case its blob is used
+        self.execute_query("INSERT INTO blobs VALUES (NULL, ?, 0, ?, ?, ?, ?, ?) ON CONFLICT (hash) DO NOTHING",
+                           (key, len(text.encode()), text[:BLOB_PREVIEW_LENGTH], compression,
+                            dictionary_id if compression else None, data))
+        self.execute_query("SELECT id FROM blobs WHERE hash = ?", (key,))
+        return self.fetch_one()[0]
+
+    def add_blob_dictionary(self, samples):
+        """Trains a compression dictionary on sample texts and stores it for the blobs stored from now on.
+
+        Returns the id of the dictionary, or None if the samples have nothing in common to put in one.
+        """
+        dictionary = train_dictionary(samples)
+        if dictionary is None:
+            return None
+        self.execute_query("INSERT INTO blob_dictionaries VALUES (NULL, ?, ?)", (dictionary, time.time()))
+        dictionary_id = self.connections.local.cursor.lastrowid
+        self.blob_codecs[dictionary_id] = BlobCodec(dictionary)
+        self.blob_dictionary = (dictionary_id, self.blob_codecs[dictionary_id])
+        return dictionary_id
+
+    def train_blob_dictionary(self, samples: int = BLOB_DICTIONARY_SAMPLES):
+        """Trains a compression dictionary on a random sample of the snippets.
+
+        Blobs stored from now on use the new dictionary; recompress_blobs() converts
+        the existing ones. Returns the id of the dictionary, or None.
+        """
+        self.execute_query("""SELECT code, example_code FROM snippets_text
+            WHERE id IN (SELECT id FROM snippets ORDER BY random() LIMIT ?)""", (samples,))
+        with self.connection:
+            return self.add_blob_dictionary(text for row in self.fetch_all() for text in row if text)
+
+    def recompress_blobs(self, batch_size: int = IMPORT_BATCH_SIZE):
+        """Recompresses all blobs with the newest dictionary and drops the dictionaries no longer used.
+
+        Blobs are converted batch_size at a time, one transaction per batch.
+        Returns the number of recompressed blobs.
+        """
+        self.connection.commit()
+        dictionary_id, codec = self.get_blob_dictionary()
+        recompressed, last_id = 0, 0
+        while True:
+            with self.connection:
+                self.execute_query("""SELECT id, blob_text(data, compression, dictionary_id) FROM blobs
+                    WHERE id > ? AND dictionary_id IS NOT ? ORDER BY id LIMIT ?""", (last_id, dictionary_id, batch_size))
+                rows = self.fetch_all()
+                for blob_id, text in rows:
+                    data, compression = codec.compress(text)
+                    self.execute_query("UPDATE blobs SET data = ?, compression = ?, dictionary_id = ? WHERE id = ?",
+                                       (data, compression, dictionary_id if compression else None, blob_id))
+            if not rows:
+                break
+            recompressed += len(rows)
+            last_id = rows[-1][0]
+        with self.connection:
+            self.execute_query("""DELETE FROM blob_dictionaries WHERE id IS NOT ?
+                AND id NOT IN (SELECT dictionary_id FROM blobs WHERE dictionary_id IS NOT NULL)""", (dictionary_id,))
+        return recompressed
+
+    def collect_garbage(self):
+        """Deletes the blobs no snippet or revision references, e.g. left over by a failed write. Returns their number"""
+        with self.connection:
+            self.execute_query("DELETE FROM blobs WHERE refcount <= 0")
+            return self.connections.local.cursor.rowcount
+
+    def vacuum(self):
+        """Rebuilds the database file, returning the pages freed by deletes to the file system"""
+        self.connection.commit()
+        self.execute_query("VACUUM")
+
+    def get_blob_stats(self):
+        """Returns (blobs, references, text size, stored size) of the blob store, sizes in bytes"""
+        self.execute_query("SELECT COUNT(*), COALESCE(SUM(refcount), 0), COALESCE(SUM(size), 0), "
+                           "COALESCE(SUM(length(data)), 0) FROM blobs")
+        return self.fetch_one()
+
+    def convert_to_blob_store(self, batch_size: int = IMPORT_BATCH_SIZE):
+        """Moves code and example_code of all snippets into the blob store, in place.
+
+        Schema migration 6, run inside the migration transaction: trains a dictionary
+        on the existing code, replaces the code and example_code columns by
+        code_blob_id and example_code_blob_id, and rebuilds the full-text index on
+        top of the snippets_text view.
+        """
+        for statement in ('DROP TRIGGER "snippets_fts_insert"', 'DROP TRIGGER "snippets_fts_delete"',
+                          'DROP TRIGGER "snippets_fts_update"', 'DROP TABLE "snippets_fts"',
+                          BLOB_STORE_SCHEMA[0], BLOB_STORE_SCHEMA[1],
+                          'ALTER TABLE "snippets" ADD COLUMN "code_blob_id" INTEGER REFERENCES "blobs" ("id")',
+                          'ALTER TABLE "snippets" ADD COLUMN "example_code_blob_id" INTEGER REFERENCES "blobs" ("id")'):
+            self.execute_query(statement)
+        self.execute_query("SELECT code, example_code FROM snippets ORDER BY random() LIMIT ?",
+                           (BLOB_DICTIONARY_SAMPLES,))
+        self.add_blob_dictionary(text for row in self.fetch_all() for text in row if text)
+
+        references = Counter()
+        last_id = 0
+        while True:
+            self.execute_query("SELECT id, code, example_code FROM snippets WHERE id > ? ORDER BY id LIMIT ?",
+                               (last_id, batch_size))
+            rows = self.fetch_all()
+            if not rows:
+                break
+            for snippet_id, code, example_code in rows:
+                code_blob_id, example_code_blob_id = self.store_blob(code), self.store_blob(example_code)
+                references.update(blob_id for blob_id in (code_blob_id, example_code_blob_id) if blob_id is not None)
+                self.execute_query("UPDATE snippets SET code_blob_id = ?, example_code_blob_id = ? WHERE id = ?",
+                                   (code_blob_id, example_code_blob_id, snippet_id))
+            last_id = rows[-1][0]
+        self.connection.executemany("UPDATE blobs SET refcount = ? WHERE id = ?",
+                                    [(count, blob_id) for blob_id, count in references.items()])
+        # Without code and example_code
+        self.rebuild_table("snippets", """
+            "id"	INTEGER,
+            "name"	TEXT,
+            "language"	TEXT,
+            "stdin"	TEXT,
+            "expected_output"	TEXT,
+            "is_private"	INTEGER,
+            "user_id"	INTEGER NOT NULL,
+            "code_blob_id"	INTEGER REFERENCES "blobs" ("id"),
+            "example_code_blob_id"	INTEGER REFERENCES "blobs" ("id"),
+            PRIMARY KEY("id")
+        """)
+
+        for statement in BLOB_STORE_SCHEMA[2:]:
+            self.execute_query(statement)
+
+    def import_snippets(self, records, batch_size: int = IMPORT_BATCH_SIZE, source: str = None, on_progress=None):
+        """Imports snippets from an iterable of dicts with SNIPPET_FIELDS keys, e.g. read_jsonl(path).
+
+        Records of older exports with a language instead of a language_id are resolved with get_language_id().
+        Records are inserted batch_size at a time, one transaction per batch. If source
+        names the input, the number of imported records is checkpointed with every batch,
+        and an import of the same source that failed part way resumes after the last
+        committed batch. Records without a user_id belong to the current user.
+        on_progress(imported) is called after every batch. Returns the number of imported records.
+        """
+        skip = 0
+        if source is not None:
+            self.execute_query("SELECT imported FROM import_progress WHERE source = ?", (source,))
+            skip = (self.fetch_one() or (0,))[0]
+        imported = skip
+        records = iter(records)
+        for _ in range(skip):
+            next(records, None)
+
+        while True:
+            batch = []
+            for record in records:
+                user_id = record.get("user_id") or self.current_user
+                if not user_id:
+                    raise ValueError("Snippet %r has no user_id and no user is logged in" % record.get("name"))
+                language = record["language_id"] if "language_id" in record else record.get("language")
+                batch.append((record.get("name"), self.get_language_id(language), record.get("code"),
+                              record.get("example_code"), record.get("stdin"), record.get("expected_output"),
+                              int(bool(record.get("is_private"))), user_id))
+                if len(batch) == batch_size:
+                    break
+            if not batch:
+                break
+            with self.connection:
+                codes = [code for _, _, code, *_ in batch]
+                batch = [(name, language, self.store_blob(code), self.store_blob(example_code), *rest)
+                         for name, language, code, example_code, *rest in batch]
+                self.execute_query("SELECT coalesce(max(id), 0) FROM snippets")
+                last_id = self.fetch_one()[0]
+                self.connection.executemany(INSERT_SNIPPET, batch)
+                # New rows get the ids after the largest one, in insertion order
+                self.execute_query("SELECT id FROM snippets WHERE id > ? ORDER BY id", (last_id,))
+                self.index_snippets(zip((snippet_id for snippet_id, in self.fetch_all()), codes))
+                imported += len(batch)
+                if source is not None:
+                    self.execute_query("INSERT OR REPLACE INTO import_progress VALUES (?, ?)", (source, imported))
+            if on_progress is not None:
+                on_progress(imported)
+
+        if source is not None:
+            with self.connection:
+                self.execute_query("DELETE FROM import_progress WHERE source = ?", (source,))
+        return imported - skip
+
+    def import_snippets_file(self, path: str, batch_size: int = IMPORT_BATCH_SIZE, on_progress=None):
+        """Imports snippets from a JSON Lines file, resuming an earlier failed import of the same file"""
+        return self.import_snippets(read_jsonl(path), batch_size, os.path.abspath(path), on_progress)
+
+    def export_snippets(self, path: str, user_id: int = None, language_id: int = None, public_only: bool = False,
+                        batch_size: int = IMPORT_BATCH_SIZE, on_progress=None):
+        """Exports snippets to a JSON Lines file, or to an SQL dump if path ends with .sql.
+
+        Rows are streamed batch_size at a time, so memory use does not depend on the
+        number of snippets. Snippets can be filtered by owner, language and privacy.
+        on_progress(exported) is called after every batch. Returns the number of exported snippets.
+        """
+        conditions, params = [], []
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if language_id is not None:
+            conditions.append("language_id = ?")
+            params.append(language_id)
+        if public_only:
+            conditions.append("is_private = 0")
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+        sql_dump = path.endswith(".sql")
+        if sql_dump:
+            # SQLite quotes the values itself, so rows come out as ready INSERT statements
+            columns = " || ', ' || ".join(f"quote({field})" for field in SNIPPET_FIELDS)
+            query = f"SELECT 'INSERT INTO snippets VALUES (' || {columns} || ');' FROM snippets_text{where} ORDER BY id"
+        else:
+            query = f"SELECT {', '.join(SNIPPET_FIELDS)} FROM snippets_text{where} ORDER BY id"
+        # A cursor of its own, so other queries of this thread can run while exporting
+        cursor = self.connection.execute(query, params)
+
+        exported = 0
+        with open(path, "w", encoding="utf-8") as f:
+            if sql_dump:
+                f.write("BEGIN TRANSACTION;\n%s;\n" % SNIPPETS_TABLE)
+            while rows := cursor.fetchmany(batch_size):
+                for row in rows:
+                    f.write((row[0] if sql_dump else json.dumps(dict(zip(SNIPPET_FIELDS, row)))) + "\n")
+                exported += len(rows)
+                if on_progress is not None:
+                    on_progress(exported)
+            if sql_dump:
+                f.write("COMMIT;\n")
+        return exported
+
     def get_all_users(self):
         self.execute_query("SELECT * FROM users")
         users = self.fetch_all()
         return users
     
     def generate_random_users(self):
+        import urllib.request
+
         url = "https://fakerapi.it/api/v1/users?_quantity=10&_locale=uk_UA"
         
         with urllib.request.urlopen(url) as response:
             data = json.loads(response.read().decode())
             users = data['data']
-            for user in users:
-                self.add_user(user['username'], user['password'], random.randint(1, 2))
+            self.add_users((user['username'], user['password'], random.randint(1, 2)) for user in users)
 
 
@@ -0,0 +1,259 @@
+import time
+import queue
+import itertools
+import threading
+import tkinter as tk
+import tkinter.ttk as ttk
+from concurrent.futures import ThreadPoolExecutor
+
+from judge0ce import ExecutionCancelled
+
+# Number of snippets that can execute at the same time
+MAX_WORKERS = 4
+# How often (in milliseconds) the Tk thread picks up execution events
+POLL_MS = 100
+
+
+class Execution:
+    """A single snippet run and its current state"""
+    QUEUED = "Queued"
+    RUNNING = "Running"
+    FINISHED = "Finished"
+    FAILED = "Failed"
+    CANCELLED = "Cancelled"
+
+    def __init__(self, execution_id: int, snippet_id: int, name: str, on_done=None):
+        self.id: int = execution_id
+        self.snippet_id: int = snippet_id
+        self.name: str = name
+        self.on_done = on_done
+        self.status: str = self.QUEUED
+        self.detail: str = ""
+        self.result = None
+        self.submitted_at: float = time.monotonic()
+        self.started_at: float = None
+        self.finished_at: float = None
+        self.cancelled = threading.Event()
+        self.future = None
+        # Executions submitted together with submit_many(), and their shared cancel event
+        self.batch = None
+        self.batch_cancelled = None
+
+    @property
+    def done(self):
+        return self.status in (self.FINISHED, self.FAILED, self.CANCELLED)
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+class ExecutionManager:
+    """Runs snippets in a worker pool without blocking the Tk event loop.
+
+    Snippets are executed by an ExecutionBackend, from worker threads. Workers never touch Tk: they put events on
+    a queue that the Tk thread drains with root.after, so state changes and
+    callbacks (on_done, listeners) always happen on the Tk thread.
+    """
+
+    def __init__(self, root: tk.Tk, backend, max_workers: int = MAX_WORKERS):
+        self.root = root
+        self.backend = backend
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="execution")
+        self.events = queue.Queue()
+        self.executions = {}
+        self.listeners = []
+        self.ids = itertools.count(1)
+        self.poll_job = None
+
+    def submit(self, snippet_id: int, name: str, code: str, language_id, stdin: str = None, on_done=None):
+        """Queues a snippet for execution; on_done(execution) is called on the Tk thread when it ends"""
+        execution = Execution(next(self.ids), snippet_id, name, on_done)
+        self.executions[execution.id] = execution
+        execution.future = self.executor.submit(self.execute, execution, code, language_id, stdin)
+        self.notify(execution)
+        if self.poll_job is None:
+            self.poll_job = self.root.after(POLL_MS, self.poll)
+        return execution
+
+    def record(self, snippet_id: int, name: str, result, detail: str = ""):
+        """Adds an execution that is already finished, e.g. a cached result"""
+        execution = Execution(next(self.ids), snippet_id, name)
+        execution.status, execution.detail, execution.result = Execution.FINISHED, detail, result
+        execution.started_at = execution.finished_at = time.monotonic()
+        self.executions[execution.id] = execution
+        self.notify(execution)
+        return execution
+
+    def submit_many(self, snippets: list, on_done=None):
+        """Queues (snippet_id, name, code, language_id, stdin) snippets to run together with the backend's run_many.
+
+        Each snippet gets its own Execution, which all share the worker and the future.
+        """
+        executions = [Execution(next(self.ids), snippet_id, name, on_done) for snippet_id, name, *_ in snippets]
+        batch_cancelled = threading.Event()
+        for execution in executions:
+            self.executions[execution.id] = execution
+            execution.batch = executions
+            execution.batch_cancelled = batch_cancelled
+        future = self.executor.submit(self.execute_many, executions, [
+            (execution.id, code, language_id, stdin)
+            for execution, (_, _, code, language_id, stdin) in zip(executions, snippets)], batch_cancelled)
+        for execution in executions:
+            execution.future = future
+            self.notify(execution)
+        if self.poll_job is None:
+            self.poll_job = self.root.after(POLL_MS, self.poll)
+        return executions
+
+    def cancel(self, execution: Execution):
+        """Cancels a queued or running execution"""
+        if execution.done:
+            return
+        execution.cancelled.set()
+        if execution.batch is not None:
+            # Results of a cancelled member of a batch are just dropped;
+            # the batch itself stops once all its members are cancelled
+            self.events.put((execution, Execution.CANCELLED, "", None))
+            if all(member.cancelled.is_set() for member in execution.batch):
+                execution.batch_cancelled.set()
+                execution.future.cancel()
+        elif execution.future.cancel():
+            # It never started, so no worker will report it
+            self.events.put((execution, Execution.CANCELLED, "", None))
+
+    def shutdown(self):
+        # Queued executions are cancelled one by one, as shutdown(cancel_futures=True) needs Python 3.9
+        for execution in self.executions.values():
+            execution.cancelled.set()
+            if execution.future is not None:
+                execution.future.cancel()
+        self.executor.shutdown(wait=False)
+        self.backend.close()
+
+    def execute(self, execution: Execution, code: str, language_id, stdin: str):
+        """Runs in a worker thread"""
+        self.events.put((execution, Execution.RUNNING, "", None))
+        try:
+            result = self.backend.run(code, language_id, stdin, execution.cancelled,
+                                      lambda status: self.events.put((execution, Execution.RUNNING,
+                                                                      status.get("description", ""), None)))
+        except ExecutionCancelled:
+            self.events.put((execution, Execution.CANCELLED, "", None))
+        except Exception as e:  # pylint: disable=broad-except
+            self.events.put((execution, Execution.FAILED, str(e), None))
+        else:
+            self.events.put((execution, Execution.FINISHED, "", result))
+
+    def execute_many(self, executions: list, snippets: list, cancelled: threading.Event):
+        """Runs a batch in a worker thread"""
+        by_id = {execution.id: execution for execution in executions}
+        for execution in executions:
+            self.events.put((execution, Execution.RUNNING, "", None))
+        try:
+            for key, result in self.backend.run_many(snippets, cancelled):
+                self.events.put((by_id.pop(key), Execution.FINISHED, "", result))
+        except ExecutionCancelled:
+            status, detail = Execution.CANCELLED, ""
+        except Exception as e:  # pylint: disable=broad-except
+            status, detail = Execution.FAILED, str(e)
+        else:
+            status, detail = Execution.FAILED, "No result"
+        for execution in by_id.values():
+            self.events.put((execution, status, detail, None))
+
+    def poll(self):
+        """Applies worker events on the Tk thread"""
+        while True:
+            try:
+                execution, status, detail, result = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if execution.done:
+                continue
+            if status == Execution.RUNNING and execution.started_at is None:
+                execution.started_at = time.monotonic()
+            execution.status, execution.detail = status, detail
+            if execution.done:
+                execution.finished_at = time.monotonic()
+                execution.result = result
+                if execution.on_done is not None:
+                    execution.on_done(execution)
+            self.notify(execution)
+
+        if any(not execution.done for execution in self.executions.values()):
+            self.poll_job = self.root.after(POLL_MS, self.poll)
+        else:
+            self.poll_job = None
+
+    def notify(self, execution: Execution):
+        for listener in self.listeners:
+            listener(execution)
+
+
+class ExecutionPanel:
+    """Window listing executions with their live status, elapsed time and a Cancel button"""
+
+    def __init__(self, root: tk.Tk, manager: ExecutionManager, show_result):
+        self.manager = manager
+        self.show_result = show_result
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Executions")
+        self.window.geometry("600x300")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.treeview = ttk.Treeview(self.window, columns=("id", "name", "status", "elapsed"), show="headings", height=10)
+        self.treeview.heading("id", text="#")
+        self.treeview.heading("name", text="Snippet")
+        self.treeview.heading("status", text="Status")
+        self.treeview.heading("elapsed", text="Elapsed")
+        self.treeview.column("id", width=40)
+        self.treeview.pack(padx=10, pady=5, fill=tk.BOTH, expand=True)
+        self.treeview.bind("<Double-1>", lambda event: self.show_selected_result())
+
+        self.cancel_button = ttk.Button(self.window, text="Cancel", command=self.cancel_selected)
+        self.cancel_button.pack(padx=10, pady=5)
+
+        for execution in manager.executions.values():
+            self.update(execution)
+        manager.listeners.append(self.update)
+        self.tick()
+
+    def update(self, execution: Execution):
+        status = execution.status + (": " + execution.detail if execution.detail else "")
+        values = (execution.id, execution.name, status, "%.1f s" % execution.elapsed)
+        iid = str(execution.id)
+        if self.treeview.exists(iid):
+            self.treeview.item(iid, values=values)
+        else:
+            self.treeview.insert("", 0, iid=iid, values=values)
+
+    def tick(self):
+        # Keeps the elapsed time of running executions moving
+        for execution in self.manager.executions.values():
+            if not execution.done:
+                self.update(execution)
+        self.tick_job = self.window.after(500, self.tick)
+
+    def selected(self):
+        return [self.manager.executions[int(iid)] for iid in self.treeview.selection()]
+
+    def cancel_selected(self):
+        for execution in self.selected():
+            self.manager.cancel(execution)
+
+    def show_selected_result(self):
+        for execution in self.selected():
+            if execution.status == Execution.FINISHED:
+                self.show_result(execution.result)
+
+    def close(self):
+        self.window.after_cancel(self.tick_job)
+        self.manager.listeners.remove(self.update)
+        self.window.destroy()
+
+    def exists(self):
+        return bool(self.window.winfo_exists())
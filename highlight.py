@@ -0,0 +1,245 @@
+import re
+import bisect
+
+# Tags of highlighted tokens
+KEYWORD = "keyword"
+STRING = "string"
+COMMENT = "comment"
+NUMBER = "number"
+TAGS = (KEYWORD, STRING, COMMENT, NUMBER)
+
+
+class Syntax:
+    """Lexical rules of a family of languages, applied one line at a time.
+
+    The state carried from one line to the next is None, or the delimiter that
+    closes the block comment or multi-line string the line ends in.
+    """
+
+    def __init__(self, name: str, keywords=(), line_comment: str = None, block_comments=(), strings=('"', "'"),
+                 multiline_strings=()):
+        self.name = name
+        self.keywords = frozenset(keywords)
+        # Tag of the token each open delimiter starts, by its closing delimiter
+        self.closers = {}
+        patterns = []
+        if line_comment:
+            patterns.append("(?P<comment>%s.*)" % re.escape(line_comment))
+        opens = []
+        for opener, closer in block_comments:
+            opens.append((opener, closer, COMMENT))
+        for delimiter in multiline_strings:
+            opens.append((delimiter, delimiter, STRING))
+        self.openers = {opener: (closer, tag) for opener, closer, tag in opens}
+        if opens:
+            patterns.append("(?P<open>%s)" % "|".join(re.escape(opener) for opener, _, _ in opens))
+        for opener, closer, tag in opens:
+            self.closers[closer] = tag
+        if strings:
+            patterns.append("(?P<string>%s)" % "|".join(r"%s(?:[^%s\\]|\\.)*%s?" % (quote, quote, quote)
+                                                        for quote in map(re.escape, strings)))
+        patterns.append(r"(?P<number>\b\d[\w.]*)")
+        patterns.append(r"(?P<word>[A-Za-z_]\w*)")
+        self.pattern = re.compile("|".join(patterns))
+
+    def tokenize(self, line: str, state=None):
+        """Returns the (tag, start, end) tokens of a line, and the state at its end"""
+        tokens = []
+        pos = 0
+        if state is not None:
+            end = line.find(state)
+            if end < 0:
+                return [(self.closers[state], 0, len(line))] if line else [], state
+            pos = end + len(state)
+            tokens.append((self.closers[state], 0, pos))
+        search = self.pattern.search
+        keywords = self.keywords
+        while (match := search(line, pos)) is not None:
+            kind = match.lastgroup
+            pos = match.end()
+            if kind == "word":
+                if match.group() in keywords:
+                    tokens.append((KEYWORD, match.start(), pos))
+            elif kind == "open":
+                closer, tag = self.openers[match.group()]
+                end = line.find(closer, pos)
+                if end < 0:
+                    tokens.append((tag, match.start(), len(line)))
+                    return tokens, closer
+                pos = end + len(closer)
+                tokens.append((tag, match.start(), pos))
+            else:
+                tokens.append((kind, match.start(), pos))
+        return tokens, None
+
+
+PYTHON = Syntax("Python", keywords=(
+    "False None True and as assert async await break class continue def del elif else except finally for from "
+    "global if import in is lambda nonlocal not or pass raise return try while with yield match case self").split(),
+    line_comment="#", multiline_strings=('"""', "'''"))
+C_FAMILY = Syntax("C", keywords=(
+    "auto bool break case catch char class const constexpr continue default delete do double else enum export "
+    "extends extern false final finally float fn for func function go if impl implements import in include "
+    "instanceof int interface let long match mut namespace new null nullptr package private protected public "
+    "return short signed sizeof static string struct super switch template this throw throws true try type "
+    "typedef typename union unsigned use using var virtual void volatile while yield").split(),
+    line_comment="//", block_comments=(("/*", "*/"),), strings=('"', "'", "`"))
+SHELL = Syntax("Shell", keywords=(
+    "begin case def do done elif else end esac export fi for function if in local module nil require rescue "
+    "return then unless until while yield").split(), line_comment="#")
+SQL = Syntax("SQL", keywords=[word for keyword in (
+    "select from where and or not insert into values update set delete create table index view drop alter join "
+    "left right inner outer on group by order having limit offset as distinct union all null is in like between "
+    "case when then else end primary key references begin commit").split() for word in (keyword, keyword.upper())],
+    line_comment="--", block_comments=(("/*", "*/"),), strings=("'",))
+PLAIN = Syntax("Plain", strings=(), multiline_strings=())
+
+# Syntaxes by Judge0 language name, without the version
+LANGUAGE_SYNTAXES = {
+    "python": PYTHON, "sql": SQL,
+    "bash": SHELL, "ruby": SHELL, "perl": SHELL, "elixir": SHELL, "r": SHELL,
+    "c": C_FAMILY, "c++": C_FAMILY, "c#": C_FAMILY, "objective-c": C_FAMILY, "d": C_FAMILY, "go": C_FAMILY,
+    "java": C_FAMILY, "javascript": C_FAMILY, "typescript": C_FAMILY, "kotlin": C_FAMILY, "groovy": C_FAMILY,
+    "scala": C_FAMILY, "swift": C_FAMILY, "rust": C_FAMILY, "php": C_FAMILY,
+}
+
+
+def syntax_for_language(language):
+    """Returns the Syntax of a snippet's language field, e.g. "71 {Python (3.8.1)}", PLAIN if unknown"""
+    name = str(language or "")
+    if "{" in name:
+        name = name[name.index("{") + 1:]
+    return LANGUAGE_SYNTAXES.get(name.split("(")[0].strip(" }").lower(), PLAIN)
+
+
+class Highlighter:
+    """Incremental tokenizer of a text, by line.
+
+    Keeps the tokens and starting state of every line. An edit marks the lines
+    it replaced as dirty; tokenize() re-tokenizes from a dirty line until the
+    state at the end of a line matches the stored starting state of the next,
+    unedited line, so typing retokenizes one line unless it opens or closes a
+    block comment or multi-line string. tokenize() can be limited to a number of
+    lines and resumed, for tokenizing large texts in chunks. Lines tokenized
+    since they were last painted are returned by take_unpainted() for a range.
+    """
+
+    def __init__(self, syntax: Syntax, line_count: int = 1):
+        self.syntax = syntax
+        self.reset(line_count)
+
+    def reset(self, line_count: int):
+        """Marks all lines as not tokenized, e.g. after the syntax or the whole text changed"""
+        self.states = [None] * line_count
+        self.tokens = [None] * line_count
+        self.painted = [False] * line_count
+        # Sorted line numbers from which tokenizing must resume
+        self.dirty = [0] if line_count else []
+
+    def set_syntax(self, syntax: Syntax):
+        self.syntax = syntax
+        self.reset(len(self.tokens))
+
+    @property
+    def line_count(self):
+        return len(self.tokens)
+
+    @property
+    def pending(self):
+        return bool(self.dirty)
+
+    def replace_lines(self, first: int, removed: int, inserted: int):
+        """Records an edit replacing lines [first, first + removed) with inserted lines"""
+        self.states[first:first + removed] = [self.states[first] if first < len(self.states) else None] * inserted
+        self.tokens[first:first + removed] = [None] * inserted
+        self.painted[first:first + removed] = [False] * inserted
+        # The lines after the edit keep their tokens, but the state they start in may have changed
+        index = bisect.bisect_left(self.dirty, first)
+        shifted = [line + inserted - removed for line in self.dirty[index:] if line >= first + removed]
+        if first < len(self.tokens) and shifted[:1] != [first]:
+            shifted.insert(0, first)
+        self.dirty[index:] = shifted
+
+    def tokenize(self, get_line, start: int = 0, max_lines: int = None):
+        """Tokenizes lines from the first dirty line at or after start, or the first one if there is none.
+
+        get_line(number) returns the text of a line. Stops once the state converges,
+        or after max_lines lines, leaving the rest dirty. Returns the number of lines tokenized.
+        """
+        if not self.dirty:
+            return 0
+        index = bisect.bisect_left(self.dirty, start)
+        if index == len(self.dirty):
+            index = 0
+        line = self.dirty.pop(index)
+        count, tokenize, line_count = 0, self.syntax.tokenize, len(self.tokens)
+        # The line starts in the state the previous line ends in. That state is only
+        # certain once no dirty line is left before it: until then it is a guess,
+        # corrected when tokenizing from the earlier dirty line reaches this one.
+        if line and self.tokens[line - 1] is not None:
+            state = self.tokens[line - 1][1]
+        else:
+            state = self.states[line] if line else None
+        while line < line_count:
+            if max_lines is not None and count >= max_lines:
+                bisect.insort(self.dirty, line)
+                break
+            self.states[line] = state
+            tokens, state = tokenize(get_line(line), state)
+            self.tokens[line] = (tokens, state)
+            self.painted[line] = False
+            count += 1
+            line += 1
+            index = bisect.bisect_left(self.dirty, line)
+            if index < len(self.dirty) and self.dirty[index] == line:
+                self.dirty.pop(index)
+            elif line < line_count and self.tokens[line] is not None and self.states[line] == state:
+                break
+        return count
+
+    def next_dirty(self, start: int = 0):
+        """Returns the first dirty line at or after start, or None"""
+        index = bisect.bisect_left(self.dirty, start)
+        return self.dirty[index] if index < len(self.dirty) else None
+
+    def mark_dirty(self, line: int):
+        """Makes tokenize() start at a line not tokenized yet, e.g. one scrolled into view before
+        the lines above it were tokenized, in the state it is guessed to start in"""
+        if self.tokens[line] is None and self.next_dirty(line) != line:
+            bisect.insort(self.dirty, line)
+
+    def highlight(self, get_line, first: int, last: int):
+        """Tokenizes the dirty lines in [first, last), e.g. the visible ones, tokenizing at most
+        last - first lines, and returns take_unpainted(first, last)"""
+        last = min(last, len(self.tokens))
+        if first < last:
+            self.mark_dirty(first)
+        budget = last - first
+        while budget > 0 and (line := self.next_dirty(first)) is not None and line < last:
+            budget -= self.tokenize(get_line, line, budget)
+        return self.take_unpainted(first, last)
+
+    def take_unpainted(self, first: int, last: int):
+        """Returns (line, tokens) of the tokenized lines in [first, last) changed since last taken"""
+        lines = []
+        painted, tokens = self.painted, self.tokens
+        for line in range(max(first, 0), min(last, len(tokens))):
+            if not painted[line] and tokens[line] is not None:
+                painted[line] = True
+                lines.append((line, tokens[line][0]))
+        return lines
+
+
+def tag_ranges(lines):
+    """Returns what painting (line, tokens) takes in a Text widget: the runs of consecutive lines
+    to remove tags from, as (first, last) 1-based line numbers, and the text indexes to tag by tag"""
+    runs, ranges = [], {tag: [] for tag in TAGS}
+    for line, tokens in lines:
+        if runs and runs[-1][1] == line:
+            runs[-1][1] = line + 1
+        else:
+            runs.append([line + 1, line + 1])
+        prefix = "%d." % (line + 1)
+        for tag, start, end in tokens:
+            ranges[tag] += (prefix + str(start), prefix + str(end))
+    return runs, ranges
@@ -1,44 +1,251 @@
 import json
-import requests
+import time
+import random
+
+from metrics import metrics, endpoint_template
+
+JUDGE0_URL = 'https://judge0-ce.p.rapidapi.com/'
+# (connect, read) timeouts in seconds for a single request
+TIMEOUT = (5, 30)
+# Responses worth retrying: throttling and transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Methods sent again after any of those, or after a timeout or a dropped connection
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+# Responses other methods are retried on, which say the request was not processed. A POST
+# that timed out or got a server error may have created a submission, so it is not sent again
+# unless the connection could not even be opened.
+NOT_PROCESSED_STATUSES = (429, 503)
+MAX_RETRIES = 4
+# Polling delay grows exponentially from POLL_INTERVAL up to MAX_POLL_INTERVAL, in seconds
+POLL_INTERVAL = 0.2
+MAX_POLL_INTERVAL = 5.0
+# Judge0 statuses of a submission that is not finished yet: In Queue, Processing
+PENDING_STATUSES = (1, 2)
+# Statuses of finished submissions that depend on the environment rather than on the
+# code and stdin: Time Limit Exceeded, Internal Error, Exec Format Error
+NON_REPRODUCIBLE_STATUSES = (5, 13, 14)
+# Maximum number of submissions in one batch request (Judge0's default MAX_SUBMISSION_BATCH_SIZE)
+BATCH_SIZE = 20
+
+
+class ExecutionCancelled(Exception):
+    """Raised when a running submission is cancelled"""
+
+
+def backoff_delay(attempt: int, base: float = POLL_INTERVAL, limit: float = MAX_POLL_INTERVAL):
+    """Exponential backoff with jitter: a random delay in the upper half of base * 2 ** attempt"""
+    delay = min(limit, base * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+def retry_after_delay(response: "requests.Response"):
+    """Returns the delay requested by a Retry-After header in seconds, or None"""
+    try:
+        return max(0.0, float(response.headers["Retry-After"]))
+    except (KeyError, ValueError):
+        return None
+
+
+def is_connect_error(error: Exception):
+    """Checks if a requests exception was raised while connecting, before anything was sent"""
+    import requests
+    from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+def is_reproducible(submission: dict):
+    """Checks if a finished submission would give the same result when run again"""
+    status = submission.get('status') or {}
+    return 'id' in status and status['id'] not in PENDING_STATUSES + NON_REPRODUCIBLE_STATUSES
+
 
 class Judge0CEClient:
-    def __init__(self, token: str):
+    def __init__(self, token: str, url: str = JUDGE0_URL, timeout=TIMEOUT, max_retries: int = MAX_RETRIES,
+                 use_wait: bool = True):
         self.token: str = token
         self.headers = {
             "X-RapidAPI-Key": self.token,
             "X-RapidAPI-Host": "judge0-ce.p.rapidapi.com"
         }
-        self.url = 'https://judge0-ce.p.rapidapi.com/'
+        self.url = url
+        self.timeout = timeout
+        self.max_retries: int = max_retries
+        # Whether to ask the server to answer submissions synchronously (?wait=true);
+        # turned off for good if the server does not allow it
+        self.use_wait: bool = use_wait
+
+        # requests takes longer to import than the rest of the app, so it is imported
+        # when the first client is created rather than at startup
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # One keep-alive connection pool shared by every call and worker thread
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, path: str, **kwargs):
+        """Sends a request, retrying connection errors, throttling and server errors with backoff.
 
-    
-    def create_submission(self, source_code: str, language_id: int, number_of_runs: int = 1):
+        Only IDEMPOTENT_METHODS are retried on every error. Others are retried only
+        if the connection could not be opened or on NOT_PROCESSED_STATUSES, so a
+        submission is never created twice.
+        """
+        import requests
+
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES if idempotent else NOT_PROCESSED_STATUSES
+        # Labels of the request's metrics, None when metrics are off
+        labels = (("endpoint", endpoint_template(method, path)),) if metrics.enabled else None
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            if labels is not None and attempt:
+                metrics.increment("snippets_http_retries_total", labels)
+            try:
+                r = self.session.request(method, self.url + path, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if labels is not None:
+                    metrics.increment("snippets_http_responses_total", labels + (("status", type(e).__name__),))
+                if attempt == self.max_retries or not (idempotent or is_connect_error(e)):
+                    if labels is not None:
+                        metrics.observe("snippets_http_request_seconds", labels, time.perf_counter() - start)
+                    raise
+                delay = backoff_delay(attempt)
+            else:
+                if labels is not None:
+                    metrics.increment("snippets_http_responses_total", labels + (("status", str(r.status_code)),))
+                if r.status_code not in retry_statuses or attempt == self.max_retries:
+                    if labels is not None:
+                        metrics.observe("snippets_http_request_seconds", labels, time.perf_counter() - start)
+                    r.raise_for_status()
+                    return r.json()
+                delay = retry_after_delay(r)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+            time.sleep(delay)
+
+    def create_submission(self, source_code: str, language_id: int, number_of_runs: int = 1, stdin: str = None,
+                          wait: bool = False):
+        """Creates a submission. With wait, the server answers with the finished submission
+        instead of just its token, if it allows it."""
         data = {
             'source_code': source_code,
             'language_id': language_id,
             'number_of_runs': number_of_runs
         }
-        r = requests.post(self.url + 'submissions', json=data, headers=self.headers)
-        return r.json()
-    
+        if stdin:
+            data['stdin'] = stdin
+        params = {'wait': 'true'} if wait else None
+        return self.request('POST', 'submissions', json=data, params=params)
+
     def get_submission(self, submission_id: int):
-        r = requests.get(self.url + 'submissions/' + str(submission_id), headers=self.headers)
-        return r.json()
-    
+        return self.request('GET', 'submissions/' + str(submission_id))
+
     def get_submission_output(self, submission_id: int):
-        r = requests.get(self.url + 'submissions/' + str(submission_id), headers=self.headers)
-        return r.json()
-    
-    def run_code(self, source_code: str, language_id: int, number_of_runs: int = 1):
-        submission = self.create_submission(source_code, language_id, number_of_runs)
+        return self.get_submission(submission_id)
+
+    def create_submissions_batch(self, submissions: list):
+        """Creates up to BATCH_SIZE submissions in one request.
+
+        submissions are dicts with source_code, language_id and optionally stdin.
+        Returns one dict per submission, with either a token or the errors.
+        """
+        return self.request('POST', 'submissions/batch', json={'submissions': submissions})
+
+    def get_submissions_batch(self, tokens: list):
+        """Returns the submissions for up to BATCH_SIZE tokens in one request, in token order (None if unknown)"""
+        return self.request('GET', 'submissions/batch', params={'tokens': ",".join(tokens)})['submissions']
+
+    def run_many(self, snippets, batch_size: int = BATCH_SIZE, cancelled=None):
+        """Runs many snippets with batch requests, yielding (key, submission) as they finish.
+
+        snippets is an iterable of (key, source_code, language_id, stdin). They are
+        submitted batch_size at a time, then every polling round fetches all unfinished
+        submissions at once (one request per batch_size tokens). A submission the server
+        refused, or no longer knows when polled, is yielded with an 'error' field instead
+        of a status.
+        cancelled is an optional threading.Event that stops polling when set.
+        """
+        snippets = list(snippets)
+        pending = {}
+        for start in range(0, len(snippets), batch_size):
+            chunk = snippets[start:start + batch_size]
+            created = self.create_submissions_batch([
+                {'source_code': source_code, 'language_id': language_id, **({'stdin': stdin} if stdin else {})}
+                for _, source_code, language_id, stdin in chunk])
+            for (key, *_), submission in zip(chunk, created):
+                if 'token' in submission:
+                    pending[submission['token']] = key
+                else:
+                    yield key, {'error': submission}
+
+        attempt = 0
+        while pending:
+            delay = backoff_delay(attempt)
+            attempt += 1
+            if cancelled is not None:
+                if cancelled.wait(delay):
+                    raise ExecutionCancelled(list(pending))
+            else:
+                time.sleep(delay)
+            tokens = list(pending)
+            for start in range(0, len(tokens), batch_size):
+                chunk = tokens[start:start + batch_size]
+                # Submissions come back in the order of the tokens, null for a token the server does not know
+                for token, submission in zip(chunk, self.get_submissions_batch(chunk)):
+                    if submission is None:
+                        yield pending.pop(token), {'error': 'Unknown submission token %s' % token}
+                    elif submission['status']['id'] not in PENDING_STATUSES:
+                        yield pending.pop(token), submission
+
+    def submit(self, source_code: str, language_id: int, number_of_runs: int = 1, stdin: str = None):
+        """Creates a submission, waiting for the result in the same request when the server supports it"""
+        import requests
+
+        if self.use_wait:
+            try:
+                return self.create_submission(source_code, language_id, number_of_runs, stdin, wait=True)
+            except requests.HTTPError as e:
+                # Servers with synchronous submissions disabled reject wait=true
+                if e.response is None or e.response.status_code != 400:
+                    raise
+                self.use_wait = False
+        return self.create_submission(source_code, language_id, number_of_runs, stdin)
+
+    def run_code(self, source_code: str, language_id: int, number_of_runs: int = 1, cancelled=None,
+                 on_status=None, stdin: str = None):
+        """Runs code and returns the finished submission as formatted JSON"""
+        submission = self.run_submission(source_code, language_id, number_of_runs, cancelled, on_status, stdin)
+        return json.dumps(submission, indent=4, sort_keys=True)
+
+    def run_submission(self, source_code: str, language_id: int, number_of_runs: int = 1, cancelled=None,
+                       on_status=None, stdin: str = None):
+        """Runs code and waits for the finished submission.
+
+        cancelled is an optional threading.Event, checked between polls; ExecutionCancelled
+        is raised once it is set. on_status is called with the Judge0 status of each poll.
+        """
+        submission = self.submit(source_code, language_id, number_of_runs, stdin)
         submission_id = submission['token']
-        print(self.get_submission(submission_id))
-        while True:
+        attempt = 0
+        while 'status' not in submission or submission['status']['id'] in PENDING_STATUSES:
+            if 'status' in submission and on_status is not None:
+                on_status(submission['status'])
+            delay = backoff_delay(attempt)
+            attempt += 1
+            if cancelled is not None:
+                if cancelled.wait(delay):
+                    raise ExecutionCancelled(submission_id)
+            else:
+                time.sleep(delay)
             submission = self.get_submission(submission_id)
-            if submission['status']['id'] in [1, 2]:
-                continue
-            break
-
-        output = self.get_submission_output(submission_id)
-        return json.dumps(output, indent=4, sort_keys=True)
-    
-    
\ No newline at end of file
+
+        if on_status is not None:
+            on_status(submission['status'])
+        return submission
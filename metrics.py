@@ -0,0 +1,239 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import bisect
+import functools
+import threading
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Set to 1 to record metrics from startup; the Diagnostics window can also turn recording on and off
+METRICS_ENV = "SNIPPETS_METRICS"
+# Longest query template kept as a label, in characters
+MAX_TEMPLATE_LENGTH = 200
+# Number of functions shown from a profile of a single action
+PROFILE_LINES = 30
+# Number of modules shown in an import time breakdown
+IMPORT_LINES = 15
+
+# Metric descriptions, for the Prometheus text format
+METRIC_HELP = {
+    "snippets_api_request_seconds": ("histogram", "JSON API request latency by route"),
+    "snippets_cache_lookups_total": ("counter", "Identity map lookups of database rows by cache and result"),
+    "snippets_db_query_seconds": ("histogram", "SQLite query latency by query template"),
+    "snippets_db_rows_total": ("counter", "Rows fetched by query template"),
+    "snippets_http_request_seconds": ("histogram", "Judge0 HTTP request latency by endpoint, retries included"),
+    "snippets_http_responses_total": ("counter", "Judge0 HTTP responses by endpoint and status"),
+    "snippets_http_retries_total": ("counter", "Judge0 HTTP request retries by endpoint"),
+    "snippets_startup_seconds": ("histogram", "Duration of the phases of the app's startup"),
+    "snippets_ui_handler_seconds": ("histogram", "UI handler duration by handler"),
+}
+
+
+@functools.lru_cache(maxsize=1024)
+def query_template(query: str):
+    """Returns a query with whitespace collapsed and literal values replaced by ?, as a metric label"""
+    template = re.sub(r"\s+", " ", query).strip()
+    template = re.sub(r"'(?:[^']|'')*'", "?", template)
+    template = re.sub(r"\b\d+\b", "?", template)
+    template = re.sub(r"\((?:\?, )+\?\)", "(?, ...)", template)
+    return template[:MAX_TEMPLATE_LENGTH]
+
+
+def endpoint_template(method: str, path: str):
+    """Returns a Judge0 endpoint with submission tokens replaced by {token}, e.g. GET submissions/{token}"""
+    return "%s %s" % (method.upper(), re.sub(r"^submissions/(?!batch$)[^/?]+", "submissions/{token}", path))
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, plus the sum, count and maximum of the observations"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction: float):
+        """Returns the upper bound of the bucket holding the given fraction of the observations"""
+        rank, seen = fraction * self.count, 0
+        for bound, count in zip(LATENCY_BUCKETS + (self.max,), self.buckets):
+            seen += count
+            if seen >= rank and seen:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """Thread-safe registry of latency histograms and counters, keyed by metric name and labels.
+
+    Recording is off unless enabled, and instrumented code checks enabled before
+    measuring anything, so disabled metrics cost one attribute lookup per call.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        # Callback of a requested profile of the next UI action
+        self.profile_request = None
+
+    def observe(self, metric: str, labels: tuple, seconds: float):
+        """Adds a latency observation; labels is a tuple of (name, value) pairs"""
+        with self.lock:
+            histogram = self.histograms.get((metric, labels))
+            if histogram is None:
+                histogram = self.histograms[(metric, labels)] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, metric: str, labels: tuple, amount: int = 1):
+        with self.lock:
+            self.counters[(metric, labels)] = self.counters.get((metric, labels), 0) + amount
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """Returns all metrics as a JSON-serializable dict"""
+        with self.lock:
+            return {
+                "time": time.time(),
+                "histograms": [{
+                    "metric": metric, "labels": dict(labels), "count": histogram.count, "sum": histogram.sum,
+                    "max": histogram.max, "p50": histogram.percentile(0.5), "p95": histogram.percentile(0.95),
+                    "buckets": dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], histogram.buckets)),
+                } for (metric, labels), histogram in self.histograms.items()],
+                "counters": [{"metric": metric, "labels": dict(labels), "value": value}
+                             for (metric, labels), value in self.counters.items()],
+            }
+
+    def to_prometheus(self):
+        """Returns all metrics in the Prometheus text exposition format"""
+        def format_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{%s}" % ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                                     for name, value in pairs)
+
+        lines, described = [], set()
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        for (metric, labels), item in histograms + counters:
+            if metric not in described:
+                described.add(metric)
+                kind, help_text = METRIC_HELP.get(metric, ("untyped", metric))
+                lines += ["# HELP %s %s" % (metric, help_text), "# TYPE %s %s" % (metric, kind)]
+            if isinstance(item, Histogram):
+                cumulative = 0
+                for bound, count in zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], item.buckets):
+                    cumulative += count
+                    lines.append("%s_bucket%s %d" % (metric, format_labels(labels, [("le", bound)]), cumulative))
+                lines.append("%s_sum%s %r" % (metric, format_labels(labels), item.sum))
+                lines.append("%s_count%s %d" % (metric, format_labels(labels), item.count))
+            else:
+                lines.append("%s%s %d" % (metric, format_labels(labels), item))
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """Writes a snapshot to a file, in the Prometheus text format if path ends with .prom or .txt, else JSON"""
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith((".prom", ".txt")):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), f, indent=2)
+
+    def profile_next(self, callback):
+        """Profiles the next UI action with cProfile, then calls callback(handler, report, stats)"""
+        self.profile_request = callback
+
+    def call(self, handler: str, func, args, kwargs):
+        """Calls a UI handler, under cProfile if a profile was requested"""
+        callback, self.profile_request = self.profile_request, None
+        if callback is None:
+            return func(*args, **kwargs)
+        import pstats
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            stats = pstats.Stats(profile)
+            callback(handler, format_profile(stats), stats)
+
+
+def format_profile(stats: "pstats.Stats", lines: int = PROFILE_LINES):
+    """Returns the functions of a profile with the highest cumulative time, as text"""
+    output = io.StringIO()
+    stats.stream = output
+    stats.sort_stats("cumulative").print_stats(lines)
+    return output.getvalue()
+
+
+class StartupTimer:
+    """Times the phases of the app's startup, from a perf_counter() reading taken before the imports"""
+
+    def __init__(self, started: float):
+        self.started = self.last = started
+        self.phases = []
+
+    def mark(self, phase: str):
+        """Ends a phase, which started when the previous one ended"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        if metrics.enabled:
+            metrics.observe("snippets_startup_seconds", (("phase", phase),), now - self.last)
+        self.last = now
+
+    def total(self):
+        return self.last - self.started
+
+    def format(self):
+        lines = ["%-16s %8.1f ms" % (phase, seconds * 1000) for phase, seconds in self.phases]
+        return "\n".join(lines + ["%-16s %8.1f ms" % ("total", self.total() * 1000)])
+
+
+def import_times(module: str, python: str = sys.executable, cwd: str = None):
+    """Imports a module in a fresh interpreter with -X importtime.
+
+    Returns (name, self_seconds, cumulative_seconds, depth) of the module and every
+    module it imported, in import order with the module itself last. Modules the
+    interpreter imports at startup (site) are left out.
+    """
+    import subprocess
+
+    result = subprocess.run([python, "-X", "importtime", "-c", "import " + module], capture_output=True, text=True,
+                            cwd=cwd or os.path.dirname(os.path.abspath(__file__)), check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            if times and times[-1][3] == 0:
+                times = []
+            times.append((name, int(own) / 1e6, int(cumulative) / 1e6, (len(indent) - 1) // 2))
+    return times
+
+
+def format_import_times(times, lines: int = IMPORT_LINES):
+    """Returns the modules with the highest cumulative import time, as text"""
+    slowest = sorted(times, key=lambda item: item[2], reverse=True)[:lines]
+    return "\n".join("%-40s %8.1f ms %8.1f ms self" % ("  " * depth + name, cumulative * 1000, own * 1000)
+                     for name, own, cumulative, depth in slowest)
+
+
+metrics = Metrics(enabled=os.environ.get(METRICS_ENV) == "1")
@@ -0,0 +1,185 @@
+"""Headless regression runner for the snippet library.
+
+Executes snippets with their stored stdin through Judge0 (or locally, with
+--backend local), compares the output
+with their expected_output and writes a JSON and/or JUnit XML report.
+
+    python regression_runner.py --json report.json --junit report.xml
+    python regression_runner.py --url http://127.0.0.1:2358/ --user admin --workers 8
+
+Snippets without an expected output are reported as skipped. The exit status
+is 1 if any snippet failed or could not be executed.
+"""
+import os
+import sys
+import json
+import time
+import difflib
+import argparse
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from database import SnippetsDatabase
+from judge0ce import Judge0CEClient, JUDGE0_URL
+from backends import ExecutionBackend, Judge0Backend, LocalBackend
+
+PASSED = "passed"
+FAILED = "failed"
+ERROR = "error"
+SKIPPED = "skipped"
+
+
+def normalize_output(output: str):
+    """Ignores trailing whitespace on every line and trailing blank lines"""
+    return "\n".join(line.rstrip() for line in (output or "").rstrip().splitlines())
+
+
+def is_blank(text: str):
+    return text is None or text.strip() == ""
+
+
+class RegressionRunner:
+    """Runs snippets in parallel and compares their output with the expected one"""
+
+    def __init__(self, backend: ExecutionBackend, workers: int = 8):
+        self.backend = backend
+        self.workers: int = workers
+
+    def run_snippet(self, snippet):
+        snippet_id, name, language_id, code, example_code, stdin, expected_output = snippet[:7]
+        result = {"id": snippet_id, "name": name, "language_id": language_id,
+                  "wall_time": 0.0, "cpu_time": None, "memory": None}
+        if is_blank(expected_output):
+            return {**result, "status": SKIPPED, "message": "No expected output"}
+        if result["language_id"] is None:
+            return {**result, "status": ERROR, "message": "Unknown language"}
+
+        code = code if is_blank(example_code) else example_code
+        start = time.perf_counter()
+        try:
+            submission = self.backend.run(code, result["language_id"], stdin)
+        except Exception as e:  # pylint: disable=broad-except
+            return {**result, "status": ERROR, "message": str(e), "wall_time": time.perf_counter() - start}
+        result["wall_time"] = time.perf_counter() - start
+        result["cpu_time"] = float(submission["time"]) if submission.get("time") else None
+        result["memory"] = submission.get("memory")
+        result["judge0_status"] = submission["status"]["description"]
+        result["stdout"] = submission.get("stdout")
+        result["stderr"] = submission.get("stderr") or submission.get("compile_output")
+
+        expected, actual = normalize_output(expected_output), normalize_output(submission.get("stdout"))
+        if expected == actual:
+            return {**result, "status": PASSED, "message": ""}
+        diff = "\n".join(difflib.unified_diff(expected.splitlines(), actual.splitlines(),
+                                              "expected_output", "stdout", lineterm=""))
+        message = "Output differs from expected_output"
+        if submission["status"]["id"] != 3:
+            message += " (%s)" % submission["status"]["description"]
+        return {**result, "status": FAILED, "message": message, "diff": diff}
+
+    def run(self, snippets):
+        """Returns the results of all snippets, in the order they were given"""
+        with ThreadPoolExecutor(self.workers) as executor:
+            return list(executor.map(self.run_snippet, snippets))
+
+
+def summarize(results, wall_time: float):
+    summary = {status: sum(result["status"] == status for result in results)
+               for status in (PASSED, FAILED, ERROR, SKIPPED)}
+    summary["total"] = len(results)
+    summary["wall_time"] = wall_time
+    return summary
+
+
+def write_json_report(path: str, results, summary):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "results": results}, f, indent=4)
+
+
+def write_junit_report(path: str, results, summary):
+    suite = ET.Element("testsuite", name="snippets", tests=str(summary["total"]), failures=str(summary[FAILED]),
+                       errors=str(summary[ERROR]), skipped=str(summary[SKIPPED]), time="%.3f" % summary["wall_time"])
+    for result in results:
+        case = ET.SubElement(suite, "testcase", classname="snippets.language_%s" % result["language_id"],
+                             name="%s %s" % (result["id"], result["name"]), time="%.3f" % result["wall_time"])
+        if result["status"] == FAILED:
+            ET.SubElement(case, "failure", message=result["message"]).text = result["diff"]
+        elif result["status"] == ERROR:
+            ET.SubElement(case, "error", message=result["message"])
+        elif result["status"] == SKIPPED:
+            ET.SubElement(case, "skipped", message=result["message"])
+        properties = ET.SubElement(case, "properties")
+        for name in ("cpu_time", "memory", "judge0_status"):
+            if result.get(name) is not None:
+                ET.SubElement(properties, "property", name=name, value=str(result[name]))
+        if result.get("stdout"):
+            ET.SubElement(case, "system-out").text = result["stdout"]
+        if result.get("stderr"):
+            ET.SubElement(case, "system-err").text = result["stderr"]
+    ET.ElementTree(suite).write(path, encoding="utf-8", xml_declaration=True)
+
+
+def select_snippets(db: SnippetsDatabase, args):
+    if args.user:
+        user = db.get_user_by_username(args.user)
+        if user is None:
+            raise SystemExit("Unknown user %r" % args.user)
+        snippets = db.get_snippets_by_user(user[0])
+    else:
+        snippets = db.run_and_get_output("SELECT * FROM snippets_text ORDER BY id")
+    if args.ids:
+        ids = {int(snippet_id) for snippet_id in args.ids.split(",")}
+        snippets = [snippet for snippet in snippets if snippet[0] in ids]
+    if args.language:
+        snippets = [snippet for snippet in snippets if snippet[2] == args.language]
+    if args.name:
+        snippets = [snippet for snippet in snippets if args.name.lower() in (snippet[1] or "").lower()]
+    return snippets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="snippets.db", help="snippets database")
+    parser.add_argument("--backend", choices=("judge0", "local"), default="judge0",
+                        help="execute with Judge0 or in local subprocesses")
+    parser.add_argument("--url", default=JUDGE0_URL, help="Judge0 API URL")
+    parser.add_argument("--token", default=os.environ.get("JUDGE0_API_TOKEN", ""),
+                        help="Judge0 API key, defaults to $JUDGE0_API_TOKEN")
+    parser.add_argument("--workers", type=int, default=8, help="snippets executed in parallel")
+    parser.add_argument("--user", help="only snippets of this username")
+    parser.add_argument("--ids", help="only these comma-separated snippet ids")
+    parser.add_argument("--language", type=int, help="only snippets in this Judge0 language id")
+    parser.add_argument("--name", help="only snippets whose name contains this text")
+    parser.add_argument("--json", help="write a JSON report to this path")
+    parser.add_argument("--junit", help="write a JUnit XML report to this path")
+    args = parser.parse_args(argv)
+
+    with SnippetsDatabase(args.db) as db:
+        snippets = select_snippets(db, args)
+
+    if args.backend == "local":
+        backend = LocalBackend(args.workers)
+    else:
+        backend = Judge0Backend(Judge0CEClient(args.token, args.url))
+    runner = RegressionRunner(backend, args.workers)
+    start = time.perf_counter()
+    try:
+        results = runner.run(snippets)
+    finally:
+        backend.close()
+    summary = summarize(results, time.perf_counter() - start)
+
+    for result in results:
+        print("%-7s %5s %-30s %7.2f s  %s" % (result["status"].upper(), result["id"], (result["name"] or "")[:30],
+                                              result["wall_time"], result["message"]))
+    print("%(total)d snippets: %(passed)d passed, %(failed)d failed, %(error)d errors, "
+          "%(skipped)d skipped in %(wall_time).2f s" % summary)
+    if args.json:
+        write_json_report(args.json, results, summary)
+    if args.junit:
+        write_junit_report(args.junit, results, summary)
+    return 1 if summary[FAILED] or summary[ERROR] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
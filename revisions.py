@@ -0,0 +1,54 @@
+import json
+import zlib
+import difflib
+import hashlib
+
+# Deltas shorter than this are stored uncompressed, zlib would only make them longer
+MIN_COMPRESSED_DELTA = 64
+
+
+def content_hash(*texts):
+    """Returns a short digest of a version's texts, to check that a delta applies to the version it was made from"""
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(b"\x00" if text is None else b"\x01" + text.encode("utf-8") + b"\x00")
+    return digest.digest()[:8]
+
+
+def make_delta(old: str, new: str):
+    """Returns a line-based delta turning old into new, as bytes.
+
+    The delta is a JSON list of [start, end, lines] changes, replacing the lines
+    [start, end) of old by lines, compressed with zlib when that makes it shorter.
+    """
+    old_lines = (old or "").splitlines(keepends=True)
+    new_lines = (new or "").splitlines(keepends=True)
+    changes = [[i1, i2, new_lines[j1:j2]]
+               for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_lines, new_lines).get_opcodes()
+               if tag != "equal"]
+    data = json.dumps(changes, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(data) >= MIN_COMPRESSED_DELTA:
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data):
+            return compressed
+    return data
+
+
+def apply_delta(old: str, delta: bytes):
+    """Returns the text make_delta(old, new) was made from"""
+    # JSON deltas start with "[", zlib streams with 0x78
+    changes = json.loads(delta if delta[:1] == b"[" else zlib.decompress(delta))
+    old_lines = (old or "").splitlines(keepends=True)
+    lines, position = [], 0
+    for start, end, inserted in changes:
+        lines += old_lines[position:start]
+        lines += inserted
+        position = end
+    lines += old_lines[position:]
+    return "".join(lines)
+
+
+def unified_diff(old: str, new: str, old_name: str, new_name: str):
+    """Returns the lines of a unified diff between two versions of a text"""
+    return list(difflib.unified_diff((old or "").splitlines(), (new or "").splitlines(), old_name, new_name,
+                                     lineterm=""))
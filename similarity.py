@@ -0,0 +1,96 @@
+import re
+import zlib
+import hashlib
+from array import array
+from itertools import accumulate
+
+# Number of MinHash values in a signature, a power of two
+SIGNATURE_SIZE = 64
+# Signatures are split into this many LSH bands of SIGNATURE_SIZE // LSH_BANDS values. Two snippets of
+# Jaccard similarity s share a bucket in at least one band with probability 1 - (1 - s^4)^16:
+# 99% at s = 0.7, 64% at 0.5 and 12% at 0.3
+LSH_BANDS = 16
+# Number of consecutive code tokens in a shingle
+SHINGLE_SIZE = 5
+# Estimated Jaccard similarity from which two snippets are near duplicates; changing one token
+# of a 60 token snippet leaves about 0.85
+SIMILARITY_THRESHOLD = 0.7
+
+# Identifiers, numbers and single punctuation characters; whitespace and layout are ignored
+TOKEN = re.compile(r"\w+|[^\w\s]")
+# Number tokens, normalized to 0
+NUMBER = re.compile(r"\b\d\w*")
+# Odd 64-bit multiplier spreading CRC-32 values over the high bits of a 64-bit hash
+MULTIPLIER = 0x9E3779B97F4A7C15
+BIN_SHIFT = 64 - (SIGNATURE_SIZE - 1).bit_length()
+EMPTY = 1 << 32
+
+
+def shingles(code: str):
+    """Returns the set of SHINGLE_SIZE token shingles of normalized code, as CRC-32 values.
+
+    Numbers are normalized to 0, so snippets differing only in constants share their
+    shingles. The tokens are joined into one buffer once and shingles are hashed as
+    slices of it, which is several times faster than joining every shingle.
+    """
+    tokens = TOKEN.findall(NUMBER.sub("0", code or ""))
+    text = " ".join(tokens).encode("utf-8")
+    if len(tokens) <= SHINGLE_SIZE:
+        return {zlib.crc32(text)} if tokens else set()
+    if not text.isascii():
+        tokens = [token.encode("utf-8") for token in tokens]
+    # Offset of every token in text, and of the end of text
+    offsets = list(accumulate((len(token) + 1 for token in tokens), initial=0))
+    crc32 = zlib.crc32
+    return {crc32(text[start:end - 1]) for start, end in zip(offsets, offsets[SHINGLE_SIZE:])}
+
+
+def minhash(code: str):
+    """Returns the MinHash signature of code as an array of SIGNATURE_SIZE 32-bit values, or None if it has no tokens.
+
+    Uses one permutation hashing: each shingle is hashed once, the high bits of the
+    hash pick one of SIGNATURE_SIZE bins and the bin keeps its smallest value. Bins
+    no shingle fell into borrow the value of the next filled bin, mixed with the
+    distance, so short snippets still get comparable signatures.
+    """
+    code_shingles = shingles(code)
+    if not code_shingles:
+        return None
+    mins = [EMPTY] * SIGNATURE_SIZE
+    for shingle in code_shingles:
+        h = shingle * MULTIPLIER & 0xFFFFFFFFFFFFFFFF
+        b, value = h >> BIN_SHIFT, h >> 16 & 0xFFFFFFFF
+        if value < mins[b]:
+            mins[b] = value
+    signature = array("I", [0]) * SIGNATURE_SIZE
+    for i in range(SIGNATURE_SIZE):
+        distance = 0
+        while mins[(i + distance) % SIGNATURE_SIZE] == EMPTY:
+            distance += 1
+        signature[i] = (mins[(i + distance) % SIGNATURE_SIZE] ^ distance * 0x9E3779B1) & 0xFFFFFFFF
+    return signature
+
+
+def band_buckets(signature):
+    """Returns the (band, bucket) LSH keys of a signature, one per band"""
+    rows = SIGNATURE_SIZE // LSH_BANDS
+    return [(band, int.from_bytes(hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(),
+                                                  digest_size=8).digest(), "little", signed=True))
+            for band in range(LSH_BANDS)]
+
+
+def load_signature(data: bytes):
+    """Returns a signature stored as the bytes of its array"""
+    signature = array("I")
+    signature.frombytes(data)
+    return signature
+
+
+def estimate_similarity(a, b):
+    """Returns the Jaccard similarity estimated from two signatures, the fraction of equal values"""
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+def jaccard(a: set, b: set):
+    """Returns the exact Jaccard similarity of two shingle sets"""
+    return len(a & b) / len(a | b) if a or b else 0.0
@@ -1,38 +1,42 @@
-from database import SnippetsDatabase
-from judge0ce import Judge0CEClient
+import time
+# Taken before the other imports, for --profile-startup
+STARTED = time.perf_counter()
+
+# Modules only some actions need (requests, the execution backends, webbrowser,
+# file dialogs) are imported where they are used, to keep startup fast
+from database import SnippetsDatabase, ConsoleQuery, execution_cache_key, query_plan_lines, CONSOLE_ROW_LIMIT
+from judge0ce import is_reproducible
+from widgets import PagedTreeview, CodeEditor, ResultGrid
+from applog import log, logger, setup_logging
+from metrics import metrics, StartupTimer, import_times, format_import_times
 import tkinter as tk
 from tkinter import messagebox
 import tkinter.ttk as ttk
 from tkinter.scrolledtext import ScrolledText
 from tkinter import Menu
-import logging, os
-import webbrowser
-
-logger = logging.getLogger("snippets_app")
-logger.setLevel(logging.DEBUG)
-
-file_handler = logging.FileHandler("snippets_app.log")
-file_handler.setLevel(logging.DEBUG)
-
-
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-
-formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-file_handler.setFormatter(formatter)
-console_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
-
-def log(func):
-    def wrapper(*args, **kwargs):
-        logger.info(f"Calling {func.__name__} with args: {args} and kwargs: {kwargs}")
-        return func(*args, **kwargs)
-    return wrapper
+import sys
+import json
+import queue
+import argparse
+import atexit
+import os
+import threading
+
+# Delay between the last keystroke in the search box and the search query
+SEARCH_DELAY_MS = 250
+# Interval between refreshes of an open analytics window
+ANALYTICS_REFRESH_MS = 5000
+# Interval between refreshes of an open diagnostics window
+DIAGNOSTICS_REFRESH_MS = 2000
+# Interval between refreshes of the elapsed time of a running SQL console query
+CONSOLE_STATUS_MS = 100
 
 class SnippetsApp:
-    def __init__(self, db):
+    def __init__(self, db, startup: StartupTimer = None, profile_startup: bool = False):
         self.db = db
+        # Phases of startup are timed if startup is set, and printed once done if profile_startup is set
+        self.startup = startup
+        self.profile_startup = profile_startup
         self.root = tk.Tk()
         self.root.title("Snippets App")
         self.root.geometry("900x600")
@@ -51,10 +55,63 @@ class SnippetsApp:
         # https://www.iconsdb.com/black-icons/code-icon.html  
         self.root.iconbitmap("favicon.ico")
 
+        self.executions = None
+        self.execution_panel = None
+        self.analytics_window = None
+        self.analytics_refresh_job = None
+        self.diagnostics_window = None
+        self.diagnostics_refresh_job = None
+
         self.create_widgets()
-    
+        if self.startup is not None:
+            self.startup.mark("window")
+
+        # The snippet list is filled, and the languages catalog refreshed, once the
+        # window is shown instead of before
+        self.map_binding = self.root.bind("<Map>", self.on_first_frame, add="+")
+
+    def on_first_frame(self, event):
+        if event.widget is not self.root:
+            return
+        self.root.unbind("<Map>", self.map_binding)
+        if self.startup is not None:
+            self.startup.mark("first frame")
+        self.root.after_idle(self.finish_startup)
+
+    def finish_startup(self):
+        self.update_snippet_treeview()
+        if self.startup is not None:
+            self.startup.mark("snippet list")
+            if self.profile_startup:
+                self.print_startup_profile()
+        self.refresh_supported_languages()
+
+    def print_startup_profile(self):
+        """Prints the startup phases, then the import times measured in a fresh interpreter"""
+        print("Startup phases:\n" + self.startup.format(), file=sys.stderr, flush=True)
+
+        def measure_imports():
+            try:
+                report = format_import_times(import_times("snippet_manager"))
+            except Exception as e:
+                report = f"Could not measure import times: {e}"
+            print("Import times (cumulative, self) of a fresh interpreter:\n" + report, file=sys.stderr, flush=True)
+
+        threading.Thread(target=measure_imports, name="import-times", daemon=True).start()
+
+    @log
+    def refresh_supported_languages(self):
+        def refresh():
+            try:
+                if self.db.update_supported_languages():
+                    logger.info("Supported languages catalog refreshed")
+            except Exception as e:
+                logger.warning(f"Could not refresh supported languages, using cached catalog: {e}")
+            finally:
+                self.db.connections.release()
+
+        threading.Thread(target=refresh, name="languages-refresh", daemon=True).start()
 
-    
 
     @log
     def create_widgets(self):
@@ -101,15 +158,39 @@ class SnippetsApp:
         self.new_snippet_button.pack(padx=10, pady=5)
         self.new_snippet_button.state(["disabled"])
 
+        self.run_buttons_frame = tk.Frame(self.snippet_frame)
+        self.run_buttons_frame.pack(padx=10, pady=5)
 
-        self.snippet_treeview = ttk.Treeview(self.snippet_frame, columns=("id", "name", "language", "code"), show="headings", height=15)
+        self.run_selected_button = ttk.Button(self.run_buttons_frame, text="Run Selected", command=self.run_selected_snippets)
+        self.run_selected_button.pack(side=tk.LEFT, padx=5)
+
+        self.run_all_button = ttk.Button(self.run_buttons_frame, text="Run All My Snippets", command=self.run_all_snippets)
+        self.run_all_button.pack(side=tk.LEFT, padx=5)
+        self.run_all_button.state(["disabled"])
+
+        self.search_job = None
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", self.on_search_changed)
+        self.search_entry = tk.Entry(self.snippet_frame, textvariable=self.search_var, font=("Arial", 12), bd=2, relief=tk.SOLID, width=40)
+        self.search_entry.pack(padx=10, pady=5)
+
+        self.snippet_list_frame = tk.Frame(self.snippet_frame)
+        self.snippet_list_frame.pack(padx=10, pady=5)
+
+        self.snippet_treeview = ttk.Treeview(self.snippet_list_frame, columns=("id", "name", "language", "code"), show="headings", height=15)
         self.snippet_treeview.heading("id", text="ID")
         self.snippet_treeview.heading("name", text="Name")
         self.snippet_treeview.heading("language", text="Language")
         self.snippet_treeview.heading("code", text="Code")
-        self.snippet_treeview.pack(padx=10, pady=5)
+        self.snippet_treeview.pack(side=tk.LEFT)
         self.snippet_treeview.bind("<Button-3>", self.show_context_menu)
-        self.update_snippet_treeview()
+
+        self.snippet_scrollbar = ttk.Scrollbar(self.snippet_list_frame, orient=tk.VERTICAL)
+        self.snippet_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.snippet_list = PagedTreeview(self.snippet_treeview, self.snippet_scrollbar, self.get_snippets_page,
+                                          lambda snippet: (snippet[0], snippet[1], self.language_name(snippet[2]),
+                                                           (snippet[3] or "") + "..."))
 
 
     @log
@@ -124,6 +205,7 @@ class SnippetsApp:
         if self.db.login(username, password):
             self.show_snippets()
             self.new_snippet_button.state(["!disabled"])
+            self.run_all_button.state(["!disabled"])
             self.welcome_label = tk.Label(self.snippet_frame, text="Welcome, " + username + "!", font=("Arial", 12))
             self.welcome_label.pack(padx=10, pady=5)
 
@@ -132,13 +214,11 @@ class SnippetsApp:
 
             self.root.geometry("700x600")
         
-            id = self.db.get_user_by_username(username)[0]
-
             self.login_frame.pack_forget()
             self.snippet_frame.pack(pady=20)
             self.logout_button.pack(padx=10, pady=5)
             self.admin_button = ttk.Button(self.snippet_frame, text="Admin", command=self.open_admin_window)
-            if db.is_admin(id):
+            if self.db.is_admin(self.db.current_user):
                 self.admin_button.pack(padx=15, pady=6)
             
 
@@ -175,31 +255,123 @@ class SnippetsApp:
         self.analytics_button = ttk.Button(self.admin_frame, text="Analytics", command=self.open_analytics_window)
         self.analytics_button.pack(padx=10, pady=5)
 
+        self.import_snippets_button = ttk.Button(self.admin_frame, text="Import Snippets", command=self.import_snippets)
+        self.import_snippets_button.pack(padx=10, pady=5)
+
+        self.export_snippets_button = ttk.Button(self.admin_frame, text="Export Snippets", command=self.export_snippets)
+        self.export_snippets_button.pack(padx=10, pady=5)
+
+        self.diagnostics_button = ttk.Button(self.admin_frame, text="Diagnostics", command=self.open_diagnostics_window)
+        self.diagnostics_button.pack(padx=10, pady=5)
+
+        self.bulk_progress_label = tk.Label(self.admin_frame, text="")
+        self.bulk_progress_label.pack(padx=10, pady=5)
+
+    def run_in_background(self, task, on_done, progress_label=None, on_progress=None):
+        """Runs task(on_progress) in a worker thread; on_done(result, error) is called on the Tk thread.
+
+        The values the worker passes to on_progress are sent through a queue, and
+        passed to the on_progress argument on the Tk thread, or shown in progress_label as counts.
+        """
+        events = queue.Queue()
+
+        def worker():
+            try:
+                events.put(("done", task(lambda count: events.put(("progress", count))), None))
+            except Exception as e:
+                events.put(("done", None, e))
+            finally:
+                self.db.connections.release()
+
+        def poll():
+            while True:
+                try:
+                    event = events.get_nowait()
+                except queue.Empty:
+                    break
+                if event[0] == "progress":
+                    if on_progress is not None:
+                        on_progress(event[1])
+                    elif progress_label is not None and progress_label.winfo_exists():
+                        progress_label.config(text=f"{event[1]} snippets processed...")
+                else:
+                    on_done(event[1], event[2])
+                    return
+            self.root.after(200, poll)
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(200, poll)
 
     @log
-    def open_analytics_window(self):
-        total_users = self.db.get_total_users()
-        total_snippets = self.db.get_total_snippets()
-        total_supported_languages = self.db.get_total_supported_languages()
-        total_snippets_count_by_language = self.db.get_snippets_count_by_language()
-        total_snippets_count_by_user = self.db.get_snippets_count_by_user()
+    def import_snippets(self):
+        from tkinter import filedialog
+
+        path = filedialog.askopenfilename(parent=self.admin_window, title="Import Snippets",
+                                          filetypes=[("JSON Lines", "*.jsonl"), ("All files", "*")])
+        if not path:
+            return
+        self.import_snippets_button.state(["disabled"])
+
+        def on_done(count, error):
+            if self.import_snippets_button.winfo_exists():
+                self.import_snippets_button.state(["!disabled"])
+            if error is not None:
+                messagebox.showerror("Import Failed", f"{error}\nRun the import again to resume it.")
+            else:
+                messagebox.showinfo("Import Snippets", f"{count} snippets imported")
+                self.update_snippet_treeview()
+
+        self.run_in_background(lambda on_progress: self.db.import_snippets_file(path, on_progress=on_progress),
+                               on_done, self.bulk_progress_label)
+
+    @log
+    def export_snippets(self):
+        from tkinter import filedialog
+
+        path = filedialog.asksaveasfilename(parent=self.admin_window, title="Export Snippets", defaultextension=".jsonl",
+                                            filetypes=[("JSON Lines", "*.jsonl"), ("SQL dump", "*.sql")])
+        if not path:
+            return
+        self.export_snippets_button.state(["disabled"])
+
+        def on_done(count, error):
+            if self.export_snippets_button.winfo_exists():
+                self.export_snippets_button.state(["!disabled"])
+            if error is not None:
+                messagebox.showerror("Export Failed", str(error))
+            else:
+                messagebox.showinfo("Export Snippets", f"{count} snippets exported to {path}")
+
+        self.run_in_background(lambda on_progress: self.db.export_snippets(path, on_progress=on_progress),
+                               on_done, self.bulk_progress_label)
+
 
+    @log
+    def open_analytics_window(self):
+        if self.analytics_window is not None and self.analytics_window.winfo_exists():
+            self.analytics_window.lift()
+            return
         self.analytics_window = tk.Toplevel(self.admin_window)
         self.analytics_window.title("Analytics")
         self.analytics_window.geometry("800x600")
+        # Also destroyed along with the admin window, so the refresh is stopped on <Destroy>
+        self.analytics_window.bind("<Destroy>", self.on_analytics_window_destroyed)
 
         self.analytics_frame = tk.Frame(self.analytics_window)
         self.analytics_frame.pack(pady=20)
 
-        self.total_users_label = tk.Label(self.analytics_frame, text="Total users: " + str(total_users))
+        self.total_users_label = tk.Label(self.analytics_frame)
         self.total_users_label.pack(padx=10, pady=5)
 
-        self.total_snippets_label = tk.Label(self.analytics_frame, text="Total snippets: " + str(total_snippets))
+        self.total_snippets_label = tk.Label(self.analytics_frame)
         self.total_snippets_label.pack(padx=10, pady=5)
 
-        self.total_supported_languages_label = tk.Label(self.analytics_frame, text="Total supported languages: " + str(total_supported_languages))
+        self.total_supported_languages_label = tk.Label(self.analytics_frame)
         self.total_supported_languages_label.pack(padx=10, pady=5)
 
+        self.execution_cache_label = tk.Label(self.analytics_frame)
+        self.execution_cache_label.pack(padx=10, pady=5)
+
         self.total_snippets_count_by_language_label = tk.Label(self.analytics_frame, text="Total snippets count by language: ")
         self.total_snippets_count_by_language_label.pack(padx=10, pady=5)
 
@@ -208,8 +380,6 @@ class SnippetsApp:
 
         self.total_snippets_count_by_language_treeview.heading("count", text="Count")
         self.total_snippets_count_by_language_treeview.pack(padx=10, pady=5)
-        for language, count in total_snippets_count_by_language:
-            self.total_snippets_count_by_language_treeview.insert("", "end", values=(language, count))
 
         self.total_snippets_count_by_user_label = tk.Label(self.analytics_frame, text="Total snippets count by user: ")
         self.total_snippets_count_by_user_label.pack(padx=10, pady=5)
@@ -218,9 +388,143 @@ class SnippetsApp:
         self.total_snippets_count_by_user_treeview.heading("username", text="Username")
         self.total_snippets_count_by_user_treeview.heading("count", text="Count")
         self.total_snippets_count_by_user_treeview.pack(padx=10, pady=5)
-        for username, count in total_snippets_count_by_user:
-            self.total_snippets_count_by_user_treeview.insert("", "end", values=(username, count))
 
+        self.check_analytics_button = tk.Button(self.analytics_frame, text="Check Consistency", command=self.check_analytics_consistency)
+        self.check_analytics_button.pack(padx=10, pady=5)
+
+        self.refresh_analytics_window()
+
+    def refresh_analytics_window(self):
+        """Repopulates the analytics window from the counter tables, then schedules the next refresh"""
+        if self.analytics_refresh_job is not None:
+            # Refreshed early, e.g. after a rebuild; the pending refresh is replaced
+            self.analytics_window.after_cancel(self.analytics_refresh_job)
+            self.analytics_refresh_job = None
+        if not self.analytics_window.winfo_exists():
+            return
+        snapshot = self.db.get_analytics_snapshot()
+        cache_hits, cache_misses, cache_entries, cache_size = self.db.get_execution_cache_stats()
+
+        self.total_users_label.config(text="Total users: " + str(snapshot["total_users"]))
+        self.total_snippets_label.config(text=f"Total snippets: {snapshot['total_snippets']} ({snapshot['public_snippets']} public, {snapshot['private_snippets']} private)")
+        self.total_supported_languages_label.config(text="Total supported languages: " + str(snapshot["total_supported_languages"]))
+        self.execution_cache_label.config(text=f"Execution cache: {cache_hits} hits, {cache_misses} misses, {cache_entries} results ({cache_size // 1024} KiB)")
+
+        for treeview, rows in ((self.total_snippets_count_by_language_treeview, snapshot["snippets_by_language"]),
+                               (self.total_snippets_count_by_user_treeview, snapshot["snippets_by_user"])):
+            treeview.delete(*treeview.get_children())
+            for key, count in rows:
+                treeview.insert("", "end", values=(key, count))
+
+        self.analytics_refresh_job = self.analytics_window.after(ANALYTICS_REFRESH_MS, self.refresh_analytics_window)
+
+    def on_analytics_window_destroyed(self, event):
+        # <Destroy> is also delivered for each child widget of the window
+        if event.widget is self.analytics_window and self.analytics_refresh_job is not None:
+            self.analytics_window.after_cancel(self.analytics_refresh_job)
+            self.analytics_refresh_job = None
+
+    def check_analytics_consistency(self):
+        differences = self.db.check_analytics_consistency()
+        if not differences:
+            messagebox.showinfo("Consistency Check", "The analytics counters are consistent", parent=self.analytics_window)
+            return
+        details = "\n".join(f"{table} {key!r}: stored {stored}, actual {actual}" for table, key, stored, actual in differences[:20])
+        if messagebox.askyesno("Consistency Check", f"{len(differences)} counters differ:\n{details}\n\nRebuild them?", parent=self.analytics_window):
+            self.db.rebuild_analytics()
+            self.refresh_analytics_window()
+
+    @log
+    def open_diagnostics_window(self):
+        if self.diagnostics_window is not None and self.diagnostics_window.winfo_exists():
+            self.diagnostics_window.lift()
+            return
+        self.diagnostics_window = tk.Toplevel(self.admin_window)
+        self.diagnostics_window.title("Diagnostics")
+        self.diagnostics_window.geometry("1000x600")
+        self.diagnostics_window.bind("<Destroy>", self.on_diagnostics_window_destroyed)
+
+        buttons_frame = tk.Frame(self.diagnostics_window)
+        buttons_frame.pack(padx=10, pady=5, fill=tk.X)
+
+        self.metrics_enabled_var = tk.BooleanVar(value=metrics.enabled)
+        tk.Checkbutton(buttons_frame, text="Record metrics", variable=self.metrics_enabled_var,
+                       command=lambda: setattr(metrics, "enabled", self.metrics_enabled_var.get())).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Reset", command=self.reset_diagnostics).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Dump Snapshot", command=self.dump_diagnostics).pack(side=tk.LEFT, padx=5)
+        self.profile_button = ttk.Button(buttons_frame, text="Profile Next Action", command=self.profile_next_action)
+        self.profile_button.pack(side=tk.LEFT, padx=5)
+
+        columns = ("metric", "label", "count", "total_ms", "p50_ms", "p95_ms", "max_ms", "rows")
+        headings = ("Metric", "Query / endpoint / handler", "Count", "Total ms", "p50 ms", "p95 ms", "Max ms", "Rows")
+        self.diagnostics_treeview = ttk.Treeview(self.diagnostics_window, columns=columns, show="headings")
+        for column, heading in zip(columns, headings):
+            self.diagnostics_treeview.heading(column, text=heading)
+            self.diagnostics_treeview.column(column, width=400 if column == "label" else 80, stretch=column == "label")
+        self.diagnostics_treeview.pack(padx=10, pady=5, fill=tk.BOTH, expand=True)
+
+        self.refresh_diagnostics_window()
+
+    def refresh_diagnostics_window(self):
+        """Shows the recorded metrics, slowest in total first, then schedules the next refresh"""
+        if not self.diagnostics_window.winfo_exists():
+            return
+        snapshot = metrics.snapshot()
+        rows = {(counter["metric"], tuple(counter["labels"].items())): counter["value"] for counter in snapshot["counters"]}
+        lines = []
+        for histogram in sorted(snapshot["histograms"], key=lambda histogram: -histogram["sum"]):
+            labels = tuple(histogram["labels"].items())
+            fetched = rows.pop(("snippets_db_rows_total", labels), "")
+            lines.append((histogram["metric"], " ".join(str(value) for value in histogram["labels"].values()),
+                          histogram["count"], "%.1f" % (histogram["sum"] * 1000), "%.2f" % (histogram["p50"] * 1000),
+                          "%.2f" % (histogram["p95"] * 1000), "%.2f" % (histogram["max"] * 1000), fetched))
+        for (metric, labels), value in sorted(rows.items()):
+            lines.append((metric, " ".join(str(value) for _, value in labels), "", "", "", "", "", value))
+
+        self.diagnostics_treeview.delete(*self.diagnostics_treeview.get_children())
+        for line in lines:
+            self.diagnostics_treeview.insert("", "end", values=line)
+        self.diagnostics_refresh_job = self.diagnostics_window.after(DIAGNOSTICS_REFRESH_MS,
+                                                                     self.refresh_diagnostics_window)
+
+    def on_diagnostics_window_destroyed(self, event):
+        if event.widget is self.diagnostics_window and self.diagnostics_refresh_job is not None:
+            self.diagnostics_window.after_cancel(self.diagnostics_refresh_job)
+            self.diagnostics_refresh_job = None
+
+    def reset_diagnostics(self):
+        metrics.reset()
+        self.diagnostics_treeview.delete(*self.diagnostics_treeview.get_children())
+
+    def dump_diagnostics(self):
+        from tkinter import filedialog
+
+        path = filedialog.asksaveasfilename(parent=self.diagnostics_window, defaultextension=".json",
+                                            filetypes=[("JSON", "*.json"), ("Prometheus text", "*.prom"), ("All files", "*.*")])
+        if path:
+            metrics.dump(path)
+
+    def profile_next_action(self):
+        """Profiles the next UI action with cProfile and shows the report"""
+        def show_report(handler, report, stats):
+            self.profile_button.config(text="Profile Next Action")
+            report_window = tk.Toplevel(self.root)
+            report_window.title(f"Profile of {handler}")
+            report_window.geometry("1000x600")
+            report_text = ScrolledText(report_window, font=("Courier", 10))
+            report_text.pack(fill=tk.BOTH, expand=True)
+            report_text.insert(tk.END, report)
+
+            def save():
+                from tkinter import filedialog
+
+                path = filedialog.asksaveasfilename(parent=report_window, defaultextension=".prof")
+                if path:
+                    stats.dump_stats(path)
+            ttk.Button(report_window, text="Save .prof", command=save).pack(pady=5)
+
+        metrics.profile_next(lambda *args: self.root.after_idle(show_report, *args))
+        self.profile_button.config(text="Profiling next action...")
 
     @log
     def open_add_user_window(self):
@@ -278,34 +582,106 @@ class SnippetsApp:
     def open_execute_sql_query_window(self):
         self.execute_sql_query_window = tk.Toplevel(self.admin_window)
         self.execute_sql_query_window.title("Execute SQL Query")
-        self.execute_sql_query_window.geometry("700x600")
-        self.execute_sql_query_window.resizable(False, False)
+        self.execute_sql_query_window.geometry("900x650")
+        self.execute_sql_query_window.protocol("WM_DELETE_WINDOW", self.close_execute_sql_query_window)
+        self.console_query = None
 
         self.execute_sql_query_frame = tk.Frame(self.execute_sql_query_window)
-        self.execute_sql_query_frame.pack(pady=20)
+        self.execute_sql_query_frame.pack(pady=20, fill=tk.BOTH, expand=True)
 
         self.sql_query_label = tk.Label(self.execute_sql_query_frame, text="SQL Query")
         self.sql_query_label.pack(padx=10, pady=5)
 
-        self.sql_query_text = tk.Text(self.execute_sql_query_frame, height=5)
-        self.sql_query_text.pack(padx=10, pady=5)
-
-        self.execute_button = ttk.Button(self.execute_sql_query_frame, text="Execute", command=self.execute_sql_query)
-        self.execute_button.pack(padx=10, pady=5)
+        self.sql_query_text = CodeEditor(self.execute_sql_query_frame, language="SQL", height=5)
+        self.sql_query_text.pack(padx=10, pady=5, fill=tk.X)
+
+        buttons_frame = tk.Frame(self.execute_sql_query_frame)
+        buttons_frame.pack(padx=10, pady=5)
+        self.execute_button = ttk.Button(buttons_frame, text="Execute", command=self.execute_sql_query)
+        self.execute_button.pack(side=tk.LEFT, padx=5)
+        self.explain_button = ttk.Button(buttons_frame, text="Explain Query Plan",
+                                         command=lambda: self.execute_sql_query(explain=True))
+        self.explain_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_query_button = ttk.Button(buttons_frame, text="Cancel", command=self.cancel_sql_query,
+                                              state="disabled")
+        self.cancel_query_button.pack(side=tk.LEFT, padx=5)
+        tk.Label(buttons_frame, text="Row limit:").pack(side=tk.LEFT, padx=5)
+        self.row_limit_var = tk.IntVar(value=CONSOLE_ROW_LIMIT)
+        ttk.Spinbox(buttons_frame, from_=1, to=10 * CONSOLE_ROW_LIMIT, increment=1000, width=8,
+                    textvariable=self.row_limit_var).pack(side=tk.LEFT)
 
         self.result_label = tk.Label(self.execute_sql_query_frame, text="Result")
         self.result_label.pack(padx=10, pady=5)
 
-        self.result_text = tk.Text(self.execute_sql_query_frame, height=20)
-        self.result_text.pack(padx=10, pady=5)
+        self.result_grid = ResultGrid(self.execute_sql_query_frame, height=18)
+        self.result_grid.pack(padx=10, pady=5, fill=tk.BOTH, expand=True)
 
-    
     @log
-    def execute_sql_query(self):
-        sql_query = self.sql_query_text.get("1.0", tk.END)
-        result = self.db.run_and_get_output(sql_query)
-        self.result_text.delete("1.0", tk.END)
-        self.result_text.insert(tk.END, result)
+    def execute_sql_query(self, explain=False):
+        """Runs the console's query in a worker thread, streaming its rows into the result grid"""
+        if self.console_query is not None:
+            return
+        sql_query = self.sql_query_text.get("1.0", tk.END).strip()
+        if not sql_query:
+            return
+        try:
+            row_limit = max(1, self.row_limit_var.get())
+        except tk.TclError:
+            row_limit = CONSOLE_ROW_LIMIT
+        query = self.console_query = ConsoleQuery(self.db, ("EXPLAIN QUERY PLAN " if explain else "") + sql_query,
+                                                  row_limit)
+        self.result_grid.set_columns(["QUERY PLAN"] if explain else [])
+        plan = []
+
+        def on_rows(rows):
+            if explain:
+                plan.extend(rows)
+            elif self.execute_sql_query_window.winfo_exists():
+                if not self.result_grid.rows:
+                    self.result_grid.set_columns(query.columns)
+                self.result_grid.append(rows)
+
+        def on_done(result, error):
+            self.console_query = None
+            if not self.execute_sql_query_window.winfo_exists():
+                return
+            for button in (self.execute_button, self.explain_button):
+                button.state(["!disabled"])
+            self.cancel_query_button.state(["disabled"])
+            if explain and plan:
+                self.result_grid.append([(line,) for line in query_plan_lines(plan)])
+            elif not explain and not self.result_grid.rows:
+                self.result_grid.set_columns(query.columns)
+            if error is not None:
+                self.result_label.config(text=f"Error after {query.elapsed():.3f} s: {error}")
+            else:
+                self.result_label.config(text=self.console_status(query, "Cancelled" if not result else "Done"))
+
+        def refresh_status():
+            if self.console_query is query and self.execute_sql_query_window.winfo_exists():
+                self.result_label.config(text=self.console_status(query, "Running"))
+                self.root.after(CONSOLE_STATUS_MS, refresh_status)
+
+        for button in (self.execute_button, self.explain_button):
+            button.state(["disabled"])
+        self.cancel_query_button.state(["!disabled"])
+        self.run_in_background(query.run, on_done, on_progress=on_rows)
+        refresh_status()
+
+    @staticmethod
+    def console_status(query: ConsoleQuery, state: str):
+        status = f"{state}: {query.rows} rows in {query.elapsed():.3f} s, {query.steps} VM steps"
+        if query.truncated:
+            status += f" (stopped at the row limit of {query.row_limit})"
+        return status
+
+    def cancel_sql_query(self):
+        if self.console_query is not None:
+            self.console_query.cancel()
+
+    def close_execute_sql_query_window(self):
+        self.cancel_sql_query()
+        self.execute_sql_query_window.destroy()
 
     @log
     def generate_random_users(self):
@@ -358,21 +734,42 @@ class SnippetsApp:
 
         self.update_snippet_treeview()
 
+    def language_name(self, language_id):
+        """Returns the name of a snippet's language id from the catalog, for display"""
+        if language_id is None:
+            return ""
+        return self.db.get_language_name(language_id) or "#%d" % language_id
+
+    def get_snippets_page(self, after_id, before_id, limit):
+        return self.db.get_snippets_page(self.db.current_user or 0, after_id, limit, before_id)
+
     @log
     def update_snippet_treeview(self):
-        self.snippet_treeview.delete(*self.snippet_treeview.get_children())
         self.context_menu = Menu(self.snippet_treeview, tearoff=False)
         self.context_menu.add_command(label="Copy Snippet", command=self.copy_snippet)
-        snippets = self.db.get_snippets()
-        
+
         if self.db.current_user is not None:
-            snippets = self.db.get_snippets(self.db.current_user)
             self.context_menu.add_command(label="Edit Snippet", command=self.edit_snippet)
             self.context_menu.add_command(label="Delete Snippet", command=self.delete_snippet)
             self.context_menu.add_command(label="Execute Snippet", command=self.copy_snippet)
-        
-        for snippet in snippets:
-            self.snippet_treeview.insert("", tk.END, values=(snippet[0], snippet[1], snippet[2], snippet[3][:10] + "..."))
+
+        self.search_snippets()
+
+    def on_search_changed(self, *args):
+        # Debounce: only search once typing pauses
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(SEARCH_DELAY_MS, self.search_snippets)
+
+    @log(sample=0.2)
+    def search_snippets(self):
+        self.search_job = None
+        query = self.search_var.get()
+        if query.strip():
+            self.snippet_list.show_rows(self.db.search_snippets(query, self.db.current_user or 0, limit=100),
+                                        lambda row: (row[0], row[1], self.language_name(row[2]), row[3]))
+        else:
+            self.snippet_list.reset()
 
     @log
     def open_new_snippet_window(self):
@@ -388,24 +785,30 @@ class SnippetsApp:
         language_label = tk.Label(new_snippet_window, text="Language:")
         language_label.grid(row=1, column=0, padx=10, pady=5)
 
-        language_combo = ttk.Combobox(new_snippet_window, values=self.db.get_supported_languages(), state="readonly")
+        language_combo = ttk.Combobox(new_snippet_window, values=[name for _, name in self.db.get_supported_languages()],
+                                      state="readonly")
         language_combo.grid(row=1, column=1, padx=10, pady=5)
 
         code_label = tk.Label(new_snippet_window, text="Code:")
         code_label.grid(row=2, column=0, padx=10, pady=5)
 
-        code_text = ScrolledText(new_snippet_window, height=10)
+        code_text = CodeEditor(new_snippet_window, height=10)
         code_text.grid(row=2, column=1, padx=10, pady=5)
-        code_text.configure(borderwidth=1, relief="solid")
-        code_text.configure(insertbackground="white", insertwidth=1)
+        code_text.text.configure(borderwidth=1, relief="solid")
+        code_text.text.configure(insertbackground="white", insertwidth=1)
 
         example_code_label = tk.Label(new_snippet_window, text="Example Code:")
         example_code_label.grid(row=3, column=0, padx=10, pady=5)
 
-        example_code_text = ScrolledText(new_snippet_window, height=10)
+        example_code_text = CodeEditor(new_snippet_window, height=10)
         example_code_text.grid(row=3, column=1, padx=10, pady=5)
-        example_code_text.configure(borderwidth=1, relief="solid")
-        example_code_text.configure(insertbackground="white", insertwidth=1)
+        example_code_text.text.configure(borderwidth=1, relief="solid")
+        example_code_text.text.configure(insertbackground="white", insertwidth=1)
+
+        def on_language_selected(event):
+            code_text.set_language(language_combo.get())
+            example_code_text.set_language(language_combo.get())
+        language_combo.bind("<<ComboboxSelected>>", on_language_selected)
 
         stdin_label = tk.Label(new_snippet_window, text="STDIN:")
         stdin_label.grid(row=4, column=0, padx=10, pady=5)
@@ -433,11 +836,13 @@ class SnippetsApp:
 
     @log
     def add_snippet(self, **kwargs):
+        if not self.confirm_not_duplicate(kwargs["code"]):
+            return
         self.db.add_snippet(kwargs["name"], kwargs["language"], kwargs["code"], kwargs["example_code"], kwargs["stdin"], kwargs["expected_output"], kwargs["is_private"])
         messagebox.showinfo("Snippet Added", "Snippet has been added successfully!")
         self.update_snippet_treeview()
 
-    @log
+    @log(sample=0.05)
     def show_context_menu(self, event):
         item = self.snippet_treeview.identify_row(event.y)
         if item:
@@ -446,14 +851,33 @@ class SnippetsApp:
             menu.add_command(label="Delete Snippet", command=self.delete_snippet, state="disabled")
             self.selected_snippet = self.db.get_snippet(self.snippet_treeview.item(item)["values"][0])
             if self.db.current_user:
-                if self.db.is_admin(self.db.get_user(self.db.current_user)[0]) or self.selected_snippet[8] == self.db.current_user:
+                if self.db.is_admin(self.db.current_user) or self.selected_snippet[8] == self.db.current_user:
                     menu.entryconfig("Edit Snippet", state="normal")
                     menu.entryconfig("Delete Snippet", state="normal")
             menu.add_command(label="Execute Snippet", command=self.execute_snippet)
+            menu.add_command(label="Execute Snippet (Force Re-run)", command=self.force_execute_snippet)
             menu.add_command(label="Copy Snippet", command=self.copy_snippet)
+            menu.add_command(label="Similar Snippets", command=self.show_similar_snippets)
             menu.post(event.x_root, event.y_root)
             
 
+    @staticmethod
+    def format_similar_snippets(similar):
+        return "\n".join(f"#{snippet_id} {name} ({similarity:.0%} similar)" for snippet_id, name, _, similarity in similar)
+
+    def confirm_not_duplicate(self, code, snippet_id=None):
+        """Asks whether to save code anyway if the user can see near duplicates of it; returns True to save"""
+        similar = self.db.find_similar_snippets(code, self.db.current_user or 0, snippet_id, limit=5)
+        return not similar or messagebox.askyesno(
+            "Similar Snippets", "This code is very similar to:\n\n" + self.format_similar_snippets(similar) +
+            "\n\nSave it anyway?")
+
+    @log
+    def show_similar_snippets(self):
+        similar = self.db.get_similar_snippets(self.selected_snippet[0], self.db.current_user or 0)
+        messagebox.showinfo("Similar Snippets", self.format_similar_snippets(similar) if similar else
+                            "No similar snippets found.")
+
     @log
     def edit_snippet(self):
         edit_snippet_window = tk.Toplevel(self.root)
@@ -469,25 +893,31 @@ class SnippetsApp:
         language_label = tk.Label(edit_snippet_window, text="Language:")
         language_label.grid(row=1, column=0, padx=10, pady=5)
 
-        language_combo = ttk.Combobox(edit_snippet_window, values=self.db.get_supported_languages(), state="readonly")
+        language_combo = ttk.Combobox(edit_snippet_window, values=[name for _, name in self.db.get_supported_languages()],
+                                      state="readonly")
         language_combo.grid(row=1, column=1, padx=10, pady=5)
-        language_combo.set(self.selected_snippet[2])
+        language = self.db.get_language_name(self.selected_snippet[2]) or ""
+        language_combo.set(language)
 
-        # TODO Make a widget for code and example code that has line numbers and syntax highlighting
         code_label = tk.Label(edit_snippet_window, text="Code:")
         code_label.grid(row=2, column=0, padx=10, pady=5)
 
-        code_text = ScrolledText(edit_snippet_window, height=10)
+        code_text = CodeEditor(edit_snippet_window, language=language, height=10)
         code_text.grid(row=2, column=1, padx=10, pady=5)
         code_text.insert(tk.END, self.selected_snippet[3])
 
         example_code_label = tk.Label(edit_snippet_window, text="Example Code:")
         example_code_label.grid(row=3, column=0, padx=10, pady=5)
 
-        example_code_text = ScrolledText(edit_snippet_window, height=10)
+        example_code_text = CodeEditor(edit_snippet_window, language=language, height=10)
         example_code_text.grid(row=3, column=1, padx=10, pady=5)
         example_code_text.insert(tk.END, self.selected_snippet[4])
 
+        def on_language_selected(event):
+            code_text.set_language(language_combo.get())
+            example_code_text.set_language(language_combo.get())
+        language_combo.bind("<<ComboboxSelected>>", on_language_selected)
+
         stdin_label = tk.Label(edit_snippet_window, text="STDIN:")
         stdin_label.grid(row=4, column=0, padx=10, pady=5)
 
@@ -513,8 +943,65 @@ class SnippetsApp:
         edit_button = tk.Button(edit_snippet_window, text="Edit Snippet", command=lambda: self.edit_snippet_submit(snippet_id=self.selected_snippet[0], name=name_entry.get(), language=language_combo.get(), code=code_text.get("1.0", tk.END), example_code=example_code_text.get("1.0", tk.END), stdin=stdin_text.get("1.0", tk.END), expected_output=expected_output_text.get("1.0", tk.END), is_private=is_private_var.get()))
         edit_button.grid(row=7, column=0, columnspan=2, padx=10, pady=5)
 
+        history_button = tk.Button(edit_snippet_window, text="History", command=lambda: self.open_revision_history(self.selected_snippet[0], name_entry, code_text, example_code_text))
+        history_button.grid(row=8, column=0, columnspan=2, padx=10, pady=5)
+
+    @log
+    def open_revision_history(self, snippet_id, name_entry, code_text, example_code_text):
+        """Lists the revisions of a snippet; selecting one shows its diff against the revision before it"""
+        from revisions import unified_diff
+        history_window = tk.Toplevel(self.root)
+        history_window.title("Snippet History")
+
+        revisions_tree = ttk.Treeview(history_window, columns=("revision", "date", "user", "name"), show="headings",
+                                      height=8)
+        for column, width in (("revision", 70), ("date", 150), ("user", 120), ("name", 250)):
+            revisions_tree.heading(column, text=column.capitalize())
+            revisions_tree.column(column, width=width)
+        revisions_tree.pack(padx=10, pady=5, fill=tk.X)
+        for revision, created_at, user_id, name, _ in self.db.list_revisions(snippet_id):
+            user = self.db.get_user(user_id) if user_id else None
+            revisions_tree.insert("", tk.END, iid=str(revision), values=(
+                revision, time.strftime("%Y-%m-%d %H:%M", time.localtime(created_at)) if created_at else "",
+                user[1] if user else "", name))
+
+        diff_text = ScrolledText(history_window, height=20, width=100)
+        diff_text.pack(padx=10, pady=5, fill=tk.BOTH, expand=True)
+        for tag, color in (("added", "dark green"), ("removed", "red"), ("hunk", "blue")):
+            diff_text.tag_configure(tag, foreground=color)
+        shown = {}
+
+        def on_revision_selected(event):
+            if not revisions_tree.focus():
+                return
+            revision = int(revisions_tree.focus())
+            current = shown["revision"] = self.db.get_revision(snippet_id, revision)
+            previous = self.db.get_revision(snippet_id, revision - 1) or (None,) * len(current)
+            diff_text.delete("1.0", tk.END)
+            for field in (6, 7):
+                for line in unified_diff(previous[field], current[field], "revision %d" % (revision - 1),
+                                         "revision %d" % revision):
+                    tag = "hunk" if line.startswith("@@") else "added" if line.startswith("+") else \
+                        "removed" if line.startswith("-") else ""
+                    diff_text.insert(tk.END, line + "\n", tag)
+        revisions_tree.bind("<<TreeviewSelect>>", on_revision_selected)
+
+        def load_into_editor():
+            revision = shown.get("revision")
+            if revision is None:
+                return
+            name_entry.delete(0, tk.END)
+            name_entry.insert(0, revision[4])
+            for editor, text in ((code_text, revision[6]), (example_code_text, revision[7])):
+                editor.delete("1.0", tk.END)
+                editor.insert(tk.END, text or "")
+            history_window.destroy()
+        tk.Button(history_window, text="Load into Editor", command=load_into_editor).pack(padx=10, pady=5)
+
     @log
     def edit_snippet_submit(self, **kwargs):
+        if not self.confirm_not_duplicate(kwargs.get('code'), kwargs['snippet_id']):
+            return
         self.db.edit_snippet(kwargs['snippet_id'], kwargs.get('name'), kwargs.get('language'), kwargs.get('code'),
                              kwargs.get('example_code'), kwargs.get('stdin'), kwargs.get('expected_output'),
                              kwargs.get('is_private'))
@@ -530,6 +1017,8 @@ class SnippetsApp:
 
     @log
     def open_judge0_link(self):
+        import webbrowser
+
         webbrowser.open_new_tab("https://judge0.com/ce")
 
     @log
@@ -543,26 +1032,110 @@ class SnippetsApp:
     def show_judge0_api_key_error(self):
         messagebox.showerror("Judge0 API Key Error", "Judge0 API Key not found. Please set the JUDGE0_API_TOKEN environment variable to your Judge0 API Key.")
 
+    def get_executions(self):
+        """Returns the execution manager, or None if there is no Judge0 API key.
+
+        Snippets run locally instead of with Judge0 if SNIPPETS_BACKEND=local.
+        """
+        if self.executions is None:
+            from backends import backend_from_environment
+            from execution import ExecutionManager
+
+            if (backend := backend_from_environment()) is None:
+                self.show_judge0_api_key_error()
+                return None
+            self.executions = ExecutionManager(self.root, backend)
+        return self.executions
+
+    @staticmethod
+    def get_execution_input(snippet):
+        """Returns (snippet_id, name, code, language, stdin) to execute for a snippet row"""
+        def is_empty_string(s):
+            return s is None or len(s) == 0 or s.isspace() or s == "" or s == "\n" or s == "\n\n"
+
+        code = snippet[4] if not is_empty_string(snippet[4]) else snippet[3]
+        return snippet[0], snippet[1], code, snippet[2], snippet[5]
+
     @log
-    def execute_snippet(self):
-        if (api_key := os.environ.get("JUDGE0_API_TOKEN")) is None:
-            self.show_judge0_api_key_error()
-            return        
-        client = Judge0CEClient(api_key)
-        
+    def execute_snippet(self, force=False):
+        if self.get_executions() is None:
+            return
+
         snippet = self.db.get_snippet(self.selected_snippet[0])
+        execution_input = self.get_execution_input(snippet)
+        self.open_execution_panel()
+        if not force and (result := self.get_cached_result(execution_input)) is not None:
+            self.executions.record(snippet[0], snippet[1], result, "cached")
+            self.show_execute_snippet_result(result)
+            return
+        self.executions.submit(*execution_input, on_done=lambda execution: self.on_execution_done(execution, execution_input))
 
-        def is_empty_string(s):
-            return len(s) == 0 or s.isspace() or s == "" or s == "\n" or s == "\n\n"
+    @log
+    def force_execute_snippet(self):
+        self.execute_snippet(force=True)
 
+    def get_cached_result(self, execution_input):
+        _, _, code, language, stdin = execution_input
+        result = self.db.get_cached_result(execution_cache_key(language, code, stdin, backend=self.executions.backend.name))
+        return json.loads(result) if result is not None else None
 
-        code = snippet[4] if not is_empty_string(snippet[4]) else snippet[3]
-        language = snippet[2]
-        stdin = snippet[5]
+    def cache_result(self, execution_input, result):
+        _, _, code, language, stdin = execution_input
+        if is_reproducible(result):
+            self.db.cache_result(execution_cache_key(language, code, stdin, backend=self.executions.backend.name),
+                                 json.dumps(result))
+
+    @log
+    def run_selected_snippets(self):
+        snippet_ids = [self.snippet_treeview.item(item)["values"][0] for item in self.snippet_treeview.selection()]
+        if not snippet_ids:
+            messagebox.showinfo("Run Selected", "Select one or more snippets first")
+            return
+        self.run_snippets([self.db.get_snippet(snippet_id) for snippet_id in snippet_ids])
 
+    @log
+    def run_all_snippets(self):
+        self.run_snippets(self.db.get_snippets_by_user(self.db.current_user))
 
-        result = client.run_code(code, language)
-        self.show_execute_snippet_result(result)
+    def run_snippets(self, snippets):
+        if not snippets or self.get_executions() is None:
+            return
+        self.open_execution_panel()
+        inputs = {}
+        for snippet in snippets:
+            execution_input = self.get_execution_input(snippet)
+            if (result := self.get_cached_result(execution_input)) is not None:
+                self.executions.record(snippet[0], snippet[1], result, "cached")
+            else:
+                inputs[snippet[0]] = execution_input
+        if inputs:
+            # Results are collected in the panel instead of a window per snippet
+            self.executions.submit_many(list(inputs.values()),
+                                        on_done=lambda execution: self.on_batch_execution_done(
+                                            execution, inputs[execution.snippet_id]))
+
+    @log
+    def open_execution_panel(self):
+        if self.execution_panel is not None and self.execution_panel.exists():
+            self.execution_panel.window.lift()
+            return
+        from execution import ExecutionPanel
+
+        self.execution_panel = ExecutionPanel(self.root, self.executions, self.show_execute_snippet_result)
+
+    def on_batch_execution_done(self, execution, execution_input):
+        if execution.status == execution.FINISHED:
+            self.cache_result(execution_input, execution.result)
+        elif execution.status == execution.FAILED:
+            logger.warning(f"Execution of {execution.name} failed: {execution.detail}")
+
+    @log
+    def on_execution_done(self, execution, execution_input):
+        if execution.status == execution.FINISHED:
+            self.cache_result(execution_input, execution.result)
+            self.show_execute_snippet_result(execution.result)
+        elif execution.status == execution.FAILED:
+            messagebox.showerror("Execution Failed", f"{execution.name}: {execution.detail}")
 
     @log
     def show_execute_snippet_result(self, result: dict):
@@ -572,7 +1145,7 @@ class SnippetsApp:
 
         result_text = ScrolledText(result_window, height=20)
         result_text.grid(row=0, column=0, padx=10, pady=5)
-        result_text.insert(tk.END, result)
+        result_text.insert(tk.END, json.dumps(result, indent=4, sort_keys=True))
 
     @log        
     def update_snippet(self, snippet_id, name, language, code):
@@ -583,10 +1156,87 @@ class SnippetsApp:
 
     def run(self):
         self.root.mainloop()
+        if self.executions is not None:
+            self.executions.shutdown()
+
+
+def import_command(db, args):
+    if args.user:
+        if not db.login(args.user, args.password or ""):
+            sys.exit("Invalid username or password")
+    count = db.import_snippets_file(args.file, args.batch_size,
+                                    lambda imported: print(f"\r{imported} snippets imported", end="", flush=True))
+    print(f"\rImported {count} snippets from {args.file}")
+
+
+def export_command(db, args):
+    user_id = None
+    if args.user:
+        if (user := db.get_user_by_username(args.user)) is None:
+            sys.exit(f"Unknown user {args.user}")
+        user_id = user[0]
+    count = db.export_snippets(args.file, user_id, args.language, args.public_only, args.batch_size,
+                               lambda exported: print(f"\r{exported} snippets exported", end="", flush=True))
+    print(f"\rExported {count} snippets to {args.file}")
+
+
+def compact_command(db, args):
+    # Opening the database already converted it to the blob store if it was older
+    size = os.path.getsize(args.db)
+    if not args.keep_dictionary:
+        if db.train_blob_dictionary() is not None:
+            print(f"Recompressed {db.recompress_blobs()} blobs with a new dictionary")
+    print(f"Removed {db.collect_garbage()} unreferenced blobs")
+    db.vacuum()
+    blobs, references, text_size, stored_size = db.get_blob_stats()
+    print(f"{blobs} blobs for {references} references: {text_size // 1024} KiB of code stored in {stored_size // 1024} KiB")
+    print(f"Database file: {size // 1024} KiB -> {os.path.getsize(args.db) // 1024} KiB")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Snippets App. Without a command, starts the GUI.")
+    parser.add_argument("--db", default="snippets.db", help="snippets database")
+    parser.add_argument("--metrics", metavar="PATH", help="record metrics and write them to PATH at exit, "
+                                                          "in the Prometheus text format if it ends with .prom")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print how long the phases of startup and the imports took")
+    commands = parser.add_subparsers(dest="command")
+
+    import_parser = commands.add_parser("import", help="import snippets from a JSON Lines file")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--user", help="owner of snippets without a user_id")
+    import_parser.add_argument("--password")
+    import_parser.add_argument("--batch-size", type=int, default=1000)
+    import_parser.set_defaults(handler=import_command)
+
+    export_parser = commands.add_parser("export", help="export snippets to a JSON Lines file or an .sql dump")
+    export_parser.add_argument("file")
+    export_parser.add_argument("--user", help="only snippets of this username")
+    export_parser.add_argument("--language", type=int, help="only snippets in this Judge0 language id")
+    export_parser.add_argument("--public-only", action="store_true")
+    export_parser.add_argument("--batch-size", type=int, default=1000)
+    export_parser.set_defaults(handler=export_command)
+
+    compact_parser = commands.add_parser("compact", help="retrain the code compression dictionary, recompress and vacuum")
+    compact_parser.add_argument("--keep-dictionary", action="store_true", help="only remove unused blobs and vacuum")
+    compact_parser.set_defaults(handler=compact_command)
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    db = SnippetsDatabase()
+    startup = StartupTimer(STARTED)
+    startup.mark("imports")
+    args = parse_args()
+    setup_logging()
+    if args.metrics:
+        metrics.enabled = True
+        atexit.register(metrics.dump, args.metrics)
+    startup.mark("logging")
+    db = SnippetsDatabase(args.db)
+    startup.mark("database")
     with db:
-        app = SnippetsApp(db)
-        app.run()
+        if args.command:
+            args.handler(db, args)
+        else:
+            app = SnippetsApp(db, startup, args.profile_startup)
+            app.run()
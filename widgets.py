@@ -0,0 +1,331 @@
+import tkinter as tk
+import tkinter.ttk as ttk
+import tkinter.font as tkfont
+
+from highlight import Highlighter, syntax_for_language, tag_ranges, TAGS, KEYWORD, STRING, COMMENT, NUMBER
+
+# Lines highlighted above and below the visible ones
+HIGHLIGHT_MARGIN = 50
+# Lines tokenized by each idle callback while a large text is highlighted in the background
+HIGHLIGHT_CHUNK = 1000
+# Lines fetched from the text widget at once while tokenizing
+READ_BLOCK = 256
+TAG_COLORS = {KEYWORD: "#0000C0", STRING: "#067D17", COMMENT: "#8C8C8C", NUMBER: "#1750EB"}
+# Rows shown at once by a ResultGrid
+RESULT_PAGE_SIZE = 500
+# Longest value shown in a ResultGrid cell, in characters
+RESULT_CELL_LENGTH = 200
+
+
+class PagedTreeview:
+    """Virtual scrolling adapter for a ttk.Treeview.
+
+    Rows are fetched page by page with fetch_page(after_id, before_id, limit),
+    which returns rows ordered by id with the id in the first column. The next
+    page is loaded when the view is scrolled close to the bottom, the previous
+    one close to the top, and at most max_pages pages are kept in the widget,
+    so a refresh costs one page query whatever the size of the data.
+    """
+
+    def __init__(self, treeview: ttk.Treeview, scrollbar: ttk.Scrollbar, fetch_page, format_row=tuple,
+                 page_size: int = 100, max_pages: int = 5, prefetch: float = 0.1):
+        self.treeview = treeview
+        self.scrollbar = scrollbar
+        self.fetch_page = fetch_page
+        self.format_row = format_row
+        self.page_size: int = page_size
+        self.max_pages: int = max_pages
+        self.prefetch: float = prefetch
+
+        # Loaded pages, in order, as (first row id, last row id, item ids)
+        self.pages = []
+        self.at_start: bool = True
+        self.at_end: bool = False
+        self.loading: bool = False
+
+        self.treeview.configure(yscrollcommand=self.on_scroll)
+        self.scrollbar.configure(command=self.treeview.yview)
+
+    def reset(self):
+        """Drops all rows and loads the first page"""
+        self.treeview.delete(*self.treeview.get_children())
+        self.pages = []
+        self.at_start, self.at_end = True, False
+        self.load_next_page()
+
+    def show_rows(self, rows, format_row=None):
+        """Replaces the paged rows with a fixed list of rows, e.g. search results"""
+        self.treeview.delete(*self.treeview.get_children())
+        self.pages = []
+        self.at_start = self.at_end = True
+        for row in rows:
+            self.treeview.insert("", "end", values=(format_row or self.format_row)(row))
+
+    def load_next_page(self):
+        rows = self.fetch_page(self.pages[-1][1] if self.pages else 0, None, self.page_size)
+        self.at_end = len(rows) < self.page_size
+        if not rows:
+            return
+        items = [self.treeview.insert("", "end", values=self.format_row(row)) for row in rows]
+        self.pages.append((rows[0][0], rows[-1][0], items))
+        if len(self.pages) > self.max_pages:
+            dropped = self.pages.pop(0)[2]
+            self.treeview.delete(*dropped)
+            # Keep the visible rows in place after removing the rows above them
+            self.treeview.yview_scroll(-len(dropped), "units")
+            self.at_start = False
+
+    def load_previous_page(self):
+        rows = self.fetch_page(None, self.pages[0][0], self.page_size)
+        self.at_start = len(rows) < self.page_size
+        if not rows:
+            return
+        items = [self.treeview.insert("", index, values=self.format_row(row)) for index, row in enumerate(rows)]
+        self.pages.insert(0, (rows[0][0], rows[-1][0], items))
+        self.treeview.yview_scroll(len(items), "units")
+        if len(self.pages) > self.max_pages:
+            self.treeview.delete(*self.pages.pop()[2])
+            self.at_end = False
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if not self.loading:
+            self.loading = True
+            self.treeview.after_idle(self.load_visible_pages)
+
+    def load_visible_pages(self):
+        self.loading = False
+        if not self.pages:
+            return
+        first, last = self.treeview.yview()
+        if not self.at_end and last >= 1 - self.prefetch:
+            self.load_next_page()
+        elif not self.at_start and first <= self.prefetch:
+            self.load_previous_page()
+
+
+class CodeEditor(tk.Frame):
+    """Text widget for code, with line numbers and syntax highlighting for a snippet's language.
+
+    Inserts and deletes are intercepted at the Tcl level, so each edit only
+    re-tokenizes the lines it changed, plus the following lines whose state it
+    changed (e.g. after opening a block comment). Only the visible lines and
+    HIGHLIGHT_MARGIN lines around them are tokenized and tagged while handling an
+    edit or a scroll; the rest of a large text is tokenized HIGHLIGHT_CHUNK lines
+    at a time from after_idle callbacks. get(), insert() and delete() are the
+    Text widget's, which is the text attribute.
+    """
+
+    def __init__(self, master, language=None, **kwargs):
+        super().__init__(master)
+        self.text = tk.Text(self, wrap=tk.NONE, undo=True, **kwargs)
+        self.line_numbers = tk.Canvas(self, highlightthickness=0, background="#F0F0F0")
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.text.yview)
+        self.xscrollbar = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.text.xview)
+        self.text.configure(yscrollcommand=self.on_scroll, xscrollcommand=self.xscrollbar.set)
+        self.line_numbers.grid(row=0, column=0, sticky="ns")
+        self.text.grid(row=0, column=1, sticky="nsew")
+        self.scrollbar.grid(row=0, column=2, sticky="ns")
+        self.xscrollbar.grid(row=1, column=1, sticky="ew")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(1, weight=1)
+        for tag in TAGS:
+            self.text.tag_configure(tag, foreground=TAG_COLORS[tag])
+        self.text.tag_raise("sel")
+        self.font = tkfont.Font(font=self.text["font"])
+
+        self.highlighter = Highlighter(syntax_for_language(language), 1)
+        self.background_job = None
+
+        # Route the widget's Tcl command through dispatch() to see every edit
+        self.widget_command = self.text._w + "_text"
+        self.tk.call("rename", self.text._w, self.widget_command)
+        self.tk.createcommand(self.text._w, self.dispatch)
+        self.text.bind("<Destroy>", self.on_destroy, add="+")
+        self.text.bind("<Configure>", lambda event: self.highlight_visible(), add="+")
+
+        self.get = self.text.get
+        self.insert = self.text.insert
+        self.delete = self.text.delete
+
+    def call(self, *args):
+        """Calls the Text widget's own Tcl command, bypassing dispatch()"""
+        return self.tk.call(self.widget_command, *args)
+
+    def dispatch(self, operation, *args):
+        if operation == "insert" and args:
+            first = self.line_of(args[0])
+            inserted = sum(str(chars).count("\n") for chars in args[1::2])
+            result = self.call(operation, *args)
+            self.on_edit(first, 1, inserted + 1)
+        elif operation in ("delete", "replace") and args:
+            first = self.line_of(args[0])
+            last = self.line_of(args[1]) if len(args) > 1 else first
+            inserted = sum(str(chars).count("\n") for chars in args[2::2]) if operation == "replace" else 0
+            result = self.call(operation, *args)
+            self.on_edit(first, max(last - first, 0) + 1, inserted + 1)
+        else:
+            result = self.call(operation, *args)
+        return result
+
+    def line_of(self, index):
+        """Returns the 0-based line of a text index, clamped to the last line"""
+        return min(int(str(self.call("index", index)).split(".")[0]), self.line_count()) - 1
+
+    def line_count(self):
+        return int(str(self.call("index", "end - 1 char")).split(".")[0])
+
+    def on_edit(self, first: int, removed: int, inserted: int):
+        self.highlighter.replace_lines(first, removed, inserted)
+        self.highlight_visible()
+
+    def on_destroy(self, event):
+        if event.widget is self.text:
+            if self.background_job is not None:
+                self.after_cancel(self.background_job)
+                self.background_job = None
+            self.tk.deletecommand(self.text._w)
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.highlight_visible()
+        self.draw_line_numbers()
+
+    def set_language(self, language):
+        """Highlights the text for another language, e.g. when the snippet's language changes"""
+        syntax = syntax_for_language(language)
+        if syntax is not self.highlighter.syntax:
+            self.highlighter.set_syntax(syntax)
+            for tag in TAGS:
+                self.call("tag", "remove", tag, "1.0", "end")
+            self.highlight_visible()
+
+    def visible_lines(self):
+        """Returns the 0-based range of visible lines, with HIGHLIGHT_MARGIN lines around them"""
+        first = int(str(self.call("index", "@0,0")).split(".")[0]) - 1
+        last = int(str(self.call("index", "@0,%d" % self.text.winfo_height())).split(".")[0])
+        return max(first - HIGHLIGHT_MARGIN, 0), last + HIGHLIGHT_MARGIN
+
+    def line_reader(self):
+        """Returns get_line(line) for the highlighter, reading READ_BLOCK lines at a time"""
+        blocks = {}
+
+        def get_line(line):
+            block = line // READ_BLOCK
+            if block not in blocks:
+                blocks[block] = str(self.call("get", "%d.0" % (block * READ_BLOCK + 1),
+                                              "%d.0" % ((block + 1) * READ_BLOCK + 1))).split("\n")
+            return blocks[block][line % READ_BLOCK]
+        return get_line
+
+    def highlight_visible(self):
+        """Tokenizes and tags the visible lines that changed, then leaves the rest to the background"""
+        self.paint(self.highlighter.highlight(self.line_reader(), *self.visible_lines()))
+        if self.highlighter.pending and self.background_job is None:
+            self.background_job = self.after_idle(self.highlight_in_background)
+
+    def highlight_in_background(self):
+        self.background_job = None
+        self.highlighter.tokenize(self.line_reader(), 0, HIGHLIGHT_CHUNK)
+        self.paint(self.highlighter.take_unpainted(*self.visible_lines()))
+        if self.highlighter.pending:
+            self.background_job = self.after_idle(self.highlight_in_background)
+
+    def paint(self, lines):
+        """Replaces the tags of lines, a list of (line, tokens)"""
+        if not lines:
+            return
+        runs, ranges = tag_ranges(lines)
+        for first, last in runs:
+            for tag in TAGS:
+                self.call("tag", "remove", tag, "%d.0" % first, "%d.end" % last)
+        for tag, indexes in ranges.items():
+            if indexes:
+                self.call("tag", "add", tag, *indexes)
+
+    def draw_line_numbers(self):
+        self.line_numbers.delete("all")
+        digits = len(str(self.line_count()))
+        width = self.font.measure("0" * max(digits, 2)) + 8
+        self.line_numbers.configure(width=width)
+        index = self.call("index", "@0,0")
+        while (info := self.text.dlineinfo(index)) is not None:
+            self.line_numbers.create_text(width - 4, info[1], anchor="ne", text=str(index).split(".")[0],
+                                          font=self.font, fill="#8C8C8C")
+            index = self.call("index", "%s + 1 line" % index)
+            if str(self.call("compare", index, ">=", "end")) == "1":
+                break
+
+
+class ResultGrid(tk.Frame):
+    """Grid of query results with column headers, shown one page of RESULT_PAGE_SIZE rows at a time.
+
+    Rows are appended as they arrive; only the rows of the current page are
+    inserted in the Treeview, so a large result does not slow the widget down.
+    """
+
+    def __init__(self, master, page_size: int = RESULT_PAGE_SIZE, **kwargs):
+        super().__init__(master)
+        self.page_size: int = page_size
+        self.rows = []
+        self.page: int = 0
+        self.treeview = ttk.Treeview(self, show="headings", **kwargs)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.treeview.yview)
+        self.xscrollbar = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.treeview.xview)
+        self.treeview.configure(yscrollcommand=self.scrollbar.set, xscrollcommand=self.xscrollbar.set)
+        navigation = tk.Frame(self)
+        self.previous_button = ttk.Button(navigation, text="<", width=3, command=lambda: self.show_page(self.page - 1))
+        self.next_button = ttk.Button(navigation, text=">", width=3, command=lambda: self.show_page(self.page + 1))
+        self.page_label = tk.Label(navigation)
+        self.previous_button.pack(side=tk.LEFT)
+        self.page_label.pack(side=tk.LEFT, padx=10)
+        self.next_button.pack(side=tk.LEFT)
+        self.treeview.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.xscrollbar.grid(row=1, column=0, sticky="ew")
+        navigation.grid(row=2, column=0, columnspan=2)
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+    def set_columns(self, columns):
+        """Drops all rows and shows the given column headers"""
+        self.rows = []
+        self.page = 0
+        self.treeview.delete(*self.treeview.get_children())
+        self.treeview.configure(columns=[str(index) for index in range(len(columns))])
+        for index, column in enumerate(columns):
+            self.treeview.heading(str(index), text=column, anchor="w")
+            self.treeview.column(str(index), width=120, minwidth=40, stretch=False)
+        self.update_navigation()
+
+    def append(self, rows):
+        """Adds rows, showing those that fall on the current page"""
+        start = len(self.rows)
+        self.rows += rows
+        end = min(len(self.rows), (self.page + 1) * self.page_size)
+        for row in self.rows[max(start, self.page * self.page_size):end]:
+            self.treeview.insert("", "end", values=[self.format_value(value) for value in row])
+        self.update_navigation()
+
+    def show_page(self, page: int):
+        self.page = max(0, min(page, (len(self.rows) - 1) // self.page_size))
+        self.treeview.delete(*self.treeview.get_children())
+        for row in self.rows[self.page * self.page_size:(self.page + 1) * self.page_size]:
+            self.treeview.insert("", "end", values=[self.format_value(value) for value in row])
+        self.update_navigation()
+
+    def update_navigation(self):
+        first = self.page * self.page_size
+        self.page_label.config(text="Rows %d-%d of %d" % (min(first + 1, len(self.rows)),
+                                                          min(first + self.page_size, len(self.rows)), len(self.rows)))
+        self.previous_button.state(["!disabled" if self.page > 0 else "disabled"])
+        self.next_button.state(["!disabled" if first + self.page_size < len(self.rows) else "disabled"])
+
+    @staticmethod
+    def format_value(value):
+        if value is None:
+            return "NULL"
+        if isinstance(value, bytes):
+            return "<%d bytes>" % len(value)
+        text = str(value).replace("\n", " ")
+        return text if len(text) <= RESULT_CELL_LENGTH else text[:RESULT_CELL_LENGTH] + "..."